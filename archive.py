@@ -0,0 +1,180 @@
+"""
+Reading and writing corpora stored in tar, zip and gzip files without extracting them.
+
+Supported input:  .tar, .tar.gz, .tgz, .tar.bz2, .tbz2, .tar.xz, .txz, .zip, and single .gz files
+Supported output: .tar, .tar.gz, .tgz, .tar.bz2, .tbz2, .tar.xz, .txz, .zip
+"""
+
+import gzip
+import tarfile
+import zipfile
+from io import BytesIO
+from os import path
+from threading import Lock
+
+from errors import CorpusError
+
+# tarfile modes for writing each type of tar archive
+tar_write_modes = {
+    '.tar': 'w',
+    '.tar.gz': 'w:gz',
+    '.tgz': 'w:gz',
+    '.tar.bz2': 'w:bz2',
+    '.tbz2': 'w:bz2',
+    '.tar.xz': 'w:xz',
+    '.txz': 'w:xz',
+}
+
+
+def archive_type(file_name):
+    """Returns 'tar', 'zip' or 'gz' depending on the extension of file_name, or None if it is not an archive."""
+    file_name = file_name.lower()
+
+    if file_name.endswith(tuple(tar_write_modes)):
+        return 'tar'
+    elif file_name.endswith('.zip'):
+        return 'zip'
+    elif file_name.endswith('.gz'):
+        return 'gz'
+
+    return None
+
+
+def is_archive(file_name):
+    """Returns True if file_name has the extension of an archive that can be read by ArchiveReader."""
+    return archive_type(file_name) is not None
+
+
+def read_text_file(file_name, encoding='UTF-8', errors='ignore'):
+    """Returns the content of a text file as a string. Files ending in .gz are decompressed."""
+    if file_name.lower().endswith('.gz'):
+        with gzip.open(file_name, 'rt', encoding=encoding, errors=errors) as f:
+            return f.read()
+
+    with open(file_name, encoding=encoding, errors=errors) as f:
+        return f.read()
+
+
+class ArchiveReader:
+    """
+    Reads the files in an archive.
+
+    Example:
+        >>> a = ArchiveReader('/home/mike/corpora/Mini-CORE_tagd_H.tar.gz')
+        >>> for name, text in a.texts():
+        ...     print(name, len(text))
+
+    Arguments:
+        file_name: path to a tar, zip or gzip file
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.type = archive_type(file_name)
+
+        if self.type is None:
+            raise CorpusError('Not a supported archive: ' + file_name)
+
+    def names(self):
+        """Returns the names of the files in the archive, in the order they are stored in."""
+        if self.type == 'tar':
+            with tarfile.open(self.file_name, 'r:*') as tar:
+                return [member.name for member in tar if member.isfile()]
+        elif self.type == 'zip':
+            with zipfile.ZipFile(self.file_name) as z:
+                return [info.filename for info in z.infolist() if not info.is_dir()]
+        else:
+            # A gzip file holds one file named like the archive without .gz
+            return [path.basename(self.file_name)[:-3]]
+
+    def texts(self, encoding='UTF-8', errors='ignore', names=None):
+        """
+        Yields (name, text) for every file in the archive in the order the files are stored in. The archive is read
+        from start to end once, so this works for compressed tar files.
+
+        Keyword arguments:
+            encoding: character encoding of the files
+            errors: how encoding errors are handled when reading the files
+            names: if given, only files with these names are read
+        """
+        if names is not None:
+            names = set(names)
+
+        if self.type == 'tar':
+            # Streams through the archive instead of seeking to each member
+            with tarfile.open(self.file_name, 'r|*') as tar:
+                for member in tar:
+                    if not member.isfile() or (names is not None and member.name not in names):
+                        continue
+
+                    with tar.extractfile(member) as f:
+                        yield member.name, f.read().decode(encoding, errors)
+
+        elif self.type == 'zip':
+            with zipfile.ZipFile(self.file_name) as z:
+                for info in z.infolist():
+                    if info.is_dir() or (names is not None and info.filename not in names):
+                        continue
+
+                    with z.open(info) as f:
+                        yield info.filename, f.read().decode(encoding, errors)
+
+        else:
+            name = self.names()[0]
+            if names is None or name in names:
+                yield name, read_text_file(self.file_name, encoding, errors)
+
+
+class ArchiveWriter:
+    """
+    Writes texts into a tar or zip archive. Can be used as a context manager.
+
+    Example:
+        >>> with ArchiveWriter('/home/mike/corpora/Mini-CORE_tagd_H_BTT.tar.gz') as a:
+        ...     a.write('1/some_file.tec', 'word ^++++ ^NN1')
+
+    Arguments:
+        file_name: path of the new archive
+
+    Keyword arguments:
+        encoding: character encoding of the texts
+        errors: how encoding errors are handled when encoding the texts
+    """
+
+    def __init__(self, file_name, encoding='UTF-8', errors='ignore'):
+        self.file_name = file_name
+        self.type = archive_type(file_name)
+        self.encoding = encoding
+        self.errors = errors
+        # Allows several threads to write into the same archive
+        self.lock = Lock()
+
+        if self.type == 'tar':
+            mode = [m for ext, m in tar_write_modes.items() if file_name.lower().endswith(ext)][-1]
+            self.archive = tarfile.open(file_name, mode)
+        elif self.type == 'zip':
+            self.archive = zipfile.ZipFile(file_name, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            raise CorpusError('Can only write tar or zip archives: ' + file_name)
+
+    def write(self, name, text):
+        """Adds text to the archive as a file called name."""
+        data = text.encode(self.encoding, self.errors)
+
+        with self.lock:
+            if self.type == 'tar':
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                self.archive.addfile(info, fileobj=BytesIO(data))
+            else:
+                self.archive.writestr(name, data)
+
+    def close(self):
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
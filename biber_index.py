@@ -0,0 +1,420 @@
+"""
+Persistent index of the Biber tag fields of a Biber tagged corpus.
+
+For every field (f0 to f5) and every value in it, the index stores the sorted ids of the tokens with that value, so
+queries for rare features only read the tokens they need instead of every file of the corpus. Token ids are mapped back
+to (file, sentence, position) with the file and sentence offsets saved with the index.
+
+Queries combine field conditions with & (and), | (or), ! (not) and parentheses:
+
+    f2=AGLS                 tokens with AGLS in field 2
+    f0=VL & f3=PNM          VL with PNM
+    *=EXT                   EXT in any field
+    claws=VVN & !f0=VL      CLAWS tag VVN without VL in field 0
+    f0="!"                  values with special characters are quoted
+
+Build an index and query it from the command line:
+
+    python3 biber_index.py build /home/mike/corpora/Mini-CORE_tagd_H_BTT /home/mike/corpora/Mini-CORE_index
+    python3 biber_index.py query /home/mike/corpora/Mini-CORE_index 'f0=VL & f3=PNM'
+
+Example:
+    >>> with BiberIndex('/home/mike/corpora/Mini-CORE_index') as index:
+    ...     print(len(index.search('f0=VL & f3=PNM')))
+    ...     for hit in index.kwic('*=EXT', limit=3):
+    ...         print(hit.left, '[' + hit.keyword + ']', hit.right)
+    212
+"""
+
+import io
+import json
+import re
+import sys
+from array import array
+from bisect import bisect_right, bisect_left
+from collections import defaultdict, namedtuple
+from heapq import merge
+from os import path, makedirs, replace, stat
+
+from archive import ArchiveReader
+from errors import CorpusError
+
+# Version of the index format
+INDEX_VERSION = 1
+
+# Fields that can be queried. '*' matches any of the Biber tag fields.
+biber_fields = tuple('f{0}'.format(i) for i in range(6))
+query_fields = biber_fields + ('claws', '*')
+
+# A token matching a query
+#   file: path of the file
+#   sent: index of the sentence in the file
+#   position: index of the token in the sentence
+#   token_id: id of the token in the index
+Hit = namedtuple('Hit', ['file', 'sent', 'position', 'token_id'])
+
+# A token matching a query with the words around it in its sentence
+KwicLine = namedtuple('KwicLine', ['file', 'sent', 'position', 'left', 'keyword', 'right', 'tag'])
+
+_query_token = re.compile(r'\s*(?:([()&|!])|([^\s=()&|!]+)\s*=\s*("[^"]*"|[^\s()&|]+))')
+
+
+def build_index(biber_corpus, index_folder):
+    """
+    Indexes every token of a BiberCorpus and saves the index in index_folder. Returns a BiberIndex. The corpus can be
+    an archive, which kwic() then reads the files from.
+
+    Files of the index:
+        meta.json: format version, the archive of the corpus, files with their sizes and modification times (those of
+        the archive for files in one), and the file and value offsets
+        postings.bin: token ids of every (field, value), one sorted block after the other
+        sents.bin: id of the first token of every sentence
+    """
+    files = []
+    file_tokens = []
+    file_sents = []
+    sent_starts = array('q')
+    postings = defaultdict(lambda: array('q'))
+    token_id = 0
+    archive = biber_corpus.folder if biber_corpus.archive is not None else None
+
+    for file_name, tokens in biber_corpus.file_tokens():
+        files.append(file_name)
+        file_tokens.append(token_id)
+        file_sents.append(len(sent_starts))
+        sent_start = True
+
+        for token in tokens:
+            if sent_start:
+                sent_starts.append(token_id)
+                sent_start = False
+
+            for field, value in zip(biber_fields, token.fields):
+                if value:
+                    postings[field, value].append(token_id)
+            if token.claws:
+                postings['claws', token.claws].append(token_id)
+
+            if 'clp' in token.tag.lower():
+                sent_start = True
+
+            token_id += 1
+
+    makedirs(index_folder, exist_ok=True)
+    terms = defaultdict(dict)
+    offset = 0
+
+    with open(path.join(index_folder, 'postings.bin.tmp'), 'wb') as f:
+        for (field, value), ids in sorted(postings.items()):
+            ids.tofile(f)
+            terms[field][value] = [offset, len(ids)]
+            offset += len(ids)
+
+    with open(path.join(index_folder, 'sents.bin.tmp'), 'wb') as f:
+        sent_starts.tofile(f)
+
+    meta = {
+        'version': INDEX_VERSION,
+        'corpus': biber_corpus.folder,
+        'archive': archive,
+        'files': [[file_name, *file_stamp(file_name, archive)] for file_name in files],
+        'file_tokens': file_tokens,
+        'file_sents': file_sents,
+        'tokens': token_id,
+        'terms': terms,
+    }
+
+    with open(path.join(index_folder, 'meta.json.tmp'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+    # meta.json is put in place last, so an index is only used once it is complete
+    for name in ('postings.bin', 'sents.bin', 'meta.json'):
+        replace(path.join(index_folder, name + '.tmp'), path.join(index_folder, name))
+
+    return BiberIndex(index_folder)
+
+
+def file_stamp(file_name, archive=None):
+    """
+    Returns [size, modification time] of file_name, or [None, None] if it can't be found. Files in an archive have
+    the size and modification time of the archive, so they change when it does.
+    """
+    try:
+        st = stat(archive or file_name)
+        return [st.st_size, st.st_mtime]
+    except OSError:
+        return [None, None]
+
+
+def intersect(a, b):
+    """Returns the sorted ids in both a and b."""
+    if len(a) > len(b):
+        a, b = b, a
+
+    result = []
+    for token_id in a:
+        i = bisect_left(b, token_id)
+        if i < len(b) and b[i] == token_id:
+            result.append(token_id)
+    return result
+
+
+def union(a, b):
+    """Returns the sorted ids in a or b."""
+    result = []
+    for token_id in merge(a, b):
+        if not result or result[-1] != token_id:
+            result.append(token_id)
+    return result
+
+
+def difference(a, b):
+    """Returns the sorted ids in a but not in b."""
+    result = []
+    for token_id in a:
+        i = bisect_left(b, token_id)
+        if i == len(b) or b[i] != token_id:
+            result.append(token_id)
+    return result
+
+
+class BiberIndex:
+    """
+    Reads an index saved by build_index(). Only the offsets are loaded; token ids are read from postings.bin when
+    they are needed by a query.
+
+    Arguments:
+        index_folder: folder of the index
+    """
+
+    def __init__(self, index_folder):
+        self.index_folder = index_folder
+
+        try:
+            with open(path.join(index_folder, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except OSError:
+            raise CorpusError('No index found in ' + index_folder)
+
+        if meta['version'] != INDEX_VERSION:
+            raise CorpusError('{0} is version {1} of the index format, not {2}. Build it again.'.format(
+                index_folder, meta['version'], INDEX_VERSION))
+
+        self.corpus = meta['corpus']
+        self.archive = meta.get('archive')
+        self.files = [file_name for file_name, size, mtime in meta['files']]
+        self.stamps = [[size, mtime] for file_name, size, mtime in meta['files']]
+        self.file_tokens = meta['file_tokens']
+        self.file_sents = meta['file_sents']
+        self.tokens = meta['tokens']
+        self.terms = meta['terms']
+
+        self.sent_starts = array('q')
+        with open(path.join(index_folder, 'sents.bin'), 'rb') as f:
+            self.sent_starts.frombytes(f.read())
+
+        self.postings_file = open(path.join(index_folder, 'postings.bin'), 'rb')
+        self.item_size = array('q').itemsize
+
+    def stale_files(self):
+        """Returns the files that have changed or disappeared since the index was built."""
+        return [file_name for file_name, stamp in zip(self.files, self.stamps)
+                if file_stamp(file_name, self.archive) != stamp]
+
+    def values(self, field):
+        """Returns a dict of every value of field in the corpus and the number of tokens with it."""
+        return {value: count for value, (offset, count) in self.terms.get(field, {}).items()}
+
+    def postings(self, field, value):
+        """Returns the sorted ids of the tokens with value in field. field can be '*' for any Biber tag field."""
+        if field == '*':
+            ids = []
+            for biber_field in biber_fields:
+                ids = union(ids, self.postings(biber_field, value))
+            return ids
+
+        if field not in query_fields:
+            raise CorpusError('Unknown field {0}. Fields are {1}'.format(field, ', '.join(query_fields)))
+
+        term = self.terms.get(field, {}).get(value)
+        if term is None:
+            return []
+
+        offset, count = term
+        ids = array('q')
+        self.postings_file.seek(offset * self.item_size)
+        ids.frombytes(self.postings_file.read(count * self.item_size))
+        return ids
+
+    def token_ids(self, query):
+        """Returns the sorted ids of the tokens matching query. See the module docstring for the query syntax."""
+        tokens = _tokenize_query(query)
+        negated, ids = self._parse_or(tokens)
+
+        if tokens:
+            raise CorpusError('Unexpected {0!r} in query {1!r}'.format(tokens[0][0] or tokens[0][1], query))
+
+        # Queries like !f0=VL match every token but the ones in ids
+        return difference(range(self.tokens), ids) if negated else list(ids)
+
+    def _parse_or(self, tokens):
+        negated, ids = self._parse_and(tokens)
+        while tokens and tokens[0][0] == '|':
+            tokens.pop(0)
+            other_negated, other = self._parse_and(tokens)
+            # Results are (True, ids) for every token except ids
+            if negated and other_negated:
+                ids = intersect(ids, other)
+            elif negated:
+                ids = difference(ids, other)
+            elif other_negated:
+                negated, ids = True, difference(other, ids)
+            else:
+                ids = union(ids, other)
+        return negated, ids
+
+    def _parse_and(self, tokens):
+        negated, ids = self._parse_not(tokens)
+        while tokens and tokens[0][0] == '&':
+            tokens.pop(0)
+            other_negated, other = self._parse_not(tokens)
+            if negated and other_negated:
+                ids = union(ids, other)
+            elif negated:
+                negated, ids = False, difference(other, ids)
+            elif other_negated:
+                ids = difference(ids, other)
+            else:
+                ids = intersect(ids, other)
+        return negated, ids
+
+    def _parse_not(self, tokens):
+        if not tokens:
+            raise CorpusError('Query ends too early')
+
+        operator, field, value = tokens.pop(0)
+
+        if operator == '!':
+            negated, ids = self._parse_not(tokens)
+            return not negated, ids
+        elif operator == '(':
+            result = self._parse_or(tokens)
+            if not tokens or tokens.pop(0)[0] != ')':
+                raise CorpusError('Missing ) in query')
+            return result
+        elif operator:
+            raise CorpusError('Unexpected {0!r} in query'.format(operator))
+
+        return False, self.postings(field, value)
+
+    def locate(self, token_id):
+        """Returns the Hit of the token with id token_id."""
+        file_i = bisect_right(self.file_tokens, token_id) - 1
+        sent_i = bisect_right(self.sent_starts, token_id) - 1
+        return Hit(self.files[file_i], sent_i - self.file_sents[file_i], token_id - self.sent_starts[sent_i], token_id)
+
+    def search(self, query, limit=None):
+        """
+        Returns a list of the Hits of the tokens matching query, in corpus order. Hits are found with the index only,
+        so hits in files listed by stale_files() may point at the wrong tokens.
+        """
+        return [self.locate(token_id) for token_id in self.token_ids(query)[:limit]]
+
+    def kwic(self, query, width=5, limit=None):
+        """
+        Returns a list of KwicLines of the tokens matching query, with up to width words on each side from the same
+        sentence. Only the files with matches are read. Raises CorpusError if one of them has changed since the index
+        was built.
+        """
+        hits = self.search(query, limit)
+        by_file = defaultdict(list)
+        for hit in hits:
+            by_file[hit.file].append(hit)
+
+        for file_name in by_file:
+            # Token ids of a changed file no longer match its tokens
+            if file_stamp(file_name, self.archive) != self.stamps[self.files.index(file_name)]:
+                raise CorpusError('{0} has changed since {1} was built. Build the index again.'.format(
+                    file_name, self.index_folder))
+
+        lines = []
+
+        for file_name, tokens in self.read_files(list(by_file)):
+            file_hits = by_file[file_name]
+            file_i = self.files.index(file_name)
+            first_token = self.file_tokens[file_i]
+
+            for hit in file_hits:
+                i = hit.token_id - first_token
+                sent_start = self.sent_starts[self.file_sents[file_i] + hit.sent] - first_token
+                next_sent = self.file_sents[file_i] + hit.sent + 1
+                sent_end = (self.sent_starts[next_sent] if next_sent < len(self.sent_starts) else self.tokens)
+                sent_end = min(sent_end - first_token, len(tokens))
+
+                left = ' '.join(token.token for token in tokens[max(sent_start, i - width):i])
+                right = ' '.join(token.token for token in tokens[i + 1:min(sent_end, i + 1 + width)])
+                lines.append(KwicLine(file_name, hit.sent, hit.position, left, tokens[i].token, right, tokens[i].tag))
+
+        return lines
+
+    def read_files(self, file_names):
+        """
+        Yields (file name, list of BiberTokens) for the files in file_names. Files in an archive are read in the order
+        they are stored in, with one pass through the archive.
+        """
+        from dev_tools import read_biber_file, read_biber_lines
+
+        if self.archive is None:
+            for file_name in file_names:
+                yield file_name, list(read_biber_file(file_name))
+            return
+
+        names = [file_name[len(self.archive) + 1:] for file_name in file_names]
+        for name, raw_text in ArchiveReader(self.archive).texts(encoding='ascii', names=names):
+            yield path.join(self.archive, name), list(read_biber_lines(io.StringIO(raw_text)))
+
+    def close(self):
+        self.postings_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _tokenize_query(query):
+    """Returns a list of (operator, field, value) tuples for query."""
+    tokens = []
+    position = 0
+    query = query.strip()
+
+    while position < len(query):
+        match = _query_token.match(query, position)
+        if not match:
+            raise CorpusError('Can\'t read query {0!r} at {1!r}'.format(query, query[position:]))
+
+        operator, field, value = match.groups()
+        if value and value[0] == '"':
+            value = value[1:-1]
+        tokens.append((operator, field, value))
+        position = match.end()
+        while position < len(query) and query[position].isspace():
+            position += 1
+
+    return tokens
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == 'build':
+        from dev_tools import BiberCorpus
+        with build_index(BiberCorpus(sys.argv[2], filter_files=False), sys.argv[3]) as index:
+            print('Indexed', index.tokens, 'tokens in', len(index.files), 'files')
+    elif len(sys.argv) == 4 and sys.argv[1] == 'query':
+        with BiberIndex(sys.argv[2]) as index:
+            for line in index.kwic(sys.argv[3]):
+                print('{0:>50} [{1}] {2:<50} {3} {4}:{5}'.format(line.left[-50:], line.keyword, line.right[:50],
+                                                                   line.tag, line.file, line.sent))
+    else:
+        print('Usage: python3 biber_index.py build corpus-folder index-folder\n'
+              '       python3 biber_index.py query index-folder query')
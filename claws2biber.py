@@ -16,6 +16,80 @@ How to use:
     to be saved as a .txt file:
     
     python3 claws2biber.py /home/mike/corpora/Minicore /home/mike/corpora/Minicore-BT --ext txt
+
+    The corpus can also be a .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz, .zip or .gz file, and the new corpus can be
+    saved as a .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz or .zip file. Nothing is extracted to disk:
+
+    python3 claws2biber.py /home/mike/corpora/Minicore.tar.gz /home/mike/corpora/Minicore-BT.zip
+
+    Use - as the corpus to read CLAWS tagged text from stdin and write the tagged text to stdout (or to the file given
+    as the second argument). --doc-separator sets a line that separates documents, which are then tagged as separate
+    texts. The separator lines are kept in the output:
+
+    zcat Minicore.txt.gz | python3 claws2biber.py - > Minicore.tec
+    cat Minicore/*.txt | python3 claws2biber.py - --doc-separator '<doc>' | grep EXT
+
+    Use --include and --exclude to choose files with glob patterns, --lazy to start converting before every file has
+    been found, and --file-list to save the list of files so that the folder doesn't need to be searched next time:
+
+    python3 claws2biber.py /home/mike/corpora/Minicore /home/mike/corpora/Minicore-BT --include '*.txt' --lazy
+
+    Use --parsers to only run some of the parser stages in Text.parser_stages, --disable to skip stages, and
+    --fields to skip stages that cannot change the given Biber tag fields (0-5). Since basic_matcher reads every
+    field, stages are only skipped this way when it is disabled. For example, to only tag passives and modals:
+
+    python3 claws2biber.py /home/mike/corpora/Minicore /home/mike/corpora/Minicore-BT --parsers passives modal_types
+
+    Use --features to save a table of feature frequencies per 1,000 tokens instead of tagged texts. The second
+    argument is then the path of the table. The value of --features is the format of the table (csv or jsonl):
+
+    python3 claws2biber.py /home/mike/corpora/Minicore /home/mike/corpora/Minicore-features.csv --features csv
+
+    Use --columnar to save the corpus as NumPy columns (see columnar.py) instead of tagged texts. The second argument
+    is then the folder of the columns, or a file name ending in .npz. Use --compress to compress the .npz file. NumPy
+    must be installed:
+
+    python3 claws2biber.py /home/mike/corpora/Minicore /home/mike/corpora/Minicore-columns --columnar
+    python3 claws2biber.py /home/mike/corpora/Minicore /home/mike/corpora/Minicore-columns.npz --columnar --compress
+
+    Use --prefetch to read files ahead of parsing and write them in the background, and --workers to parse with
+    several processes. --readers sets the number of threads reading files. For example:
+
+    python3 claws2biber.py /home/mike/corpora/Minicore /home/mike/corpora/Minicore-BT --prefetch 32 --workers 4
+
+    Use --chunk-sents to parse large files in chunks of sentences on several processes instead of one file per
+    process:
+
+    python3 claws2biber.py /home/mike/corpora/Giant /home/mike/corpora/Giant-BT --workers 8 --chunk-sents 5000
+
+    Use --memory-budget to keep the memory used for parsing under a limit. Files too large for their share of the
+    budget are parsed in chunks, and fewer files are parsed at once when memory runs short (see resources.py):
+
+    python3 claws2biber.py /home/mike/corpora/Giant /home/mike/corpora/Giant-BT --workers 8 --memory-budget 16G
+
+    Use --shard to split the conversion between several machines. Each machine converts one shard of the files, and
+    the manifests saved by the shards are merged with shards.py once they have all finished:
+
+    python3 claws2biber.py /home/mike/corpora/Minicore /home/mike/corpora/Minicore-BT --shard 1/4
+    python3 shards.py merge /home/mike/corpora/Minicore-BT
+
+    Use --dedup to compare texts before they are parsed. Texts with the same tokens and tags as an earlier text are
+    saved with its tagged text instead of being parsed. --dedup near also reports near duplicates and --dedup skip
+    leaves them out. The duplicates are listed in Minicore-BT.manifest.json:
+
+    python3 claws2biber.py /home/mike/corpora/Minicore /home/mike/corpora/Minicore-BT --dedup skip
+
+    A run report with the time taken by every file, the slowest files, the time spent in every parser stage and the
+    errors is saved next to the new corpus, e.g. as Minicore-BT.report.json. Use --report to save it somewhere else,
+    --no-report to not save it, and --prometheus to also save the metrics in a Prometheus textfile as the conversion
+    goes on (see telemetry.py):
+
+    python3 claws2biber.py /home/mike/corpora/Minicore /home/mike/corpora/Minicore-BT --prometheus biber_tagger.prom
+
+    Sentences longer than 1,000 tokens, e.g. in files without <s> tags, are split at sentence-final punctuation and
+    parsed in overlapping windows. Use --max-sent-length to change the limit (0 turns this off):
+
+    python3 claws2biber.py /home/mike/corpora/Minicore /home/mike/corpora/Minicore-BT --max-sent-length 500
     
     NOTE: If python3 is not the environmental variable for Python 3 on your computer, then replace
     python3 with either
@@ -26,17 +100,73 @@ How to use:
     
 """
 import argparse
+import io
+import sys
 
 from corpus import Corpus
+from dedup import dedup_modes
+from stream import tag_stream
 
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser()
     parser.add_argument('folder')
-    parser.add_argument('new_folder')
+    parser.add_argument('new_folder', nargs='?', default='-')
     parser.add_argument('--ext', dest='ext', default='tec', type=str)
+    parser.add_argument('--parsers', dest='parsers', nargs='+', default=None)
+    parser.add_argument('--disable', dest='disabled_parsers', nargs='+', default=())
+    parser.add_argument('--fields', dest='fields', nargs='+', default=None, type=int)
+    parser.add_argument('--features', dest='features', default=None, choices=['csv', 'jsonl'])
+    parser.add_argument('--columnar', dest='columnar', action='store_true')
+    parser.add_argument('--compress', dest='compress', action='store_true')
+    parser.add_argument('--prefetch', dest='prefetch', default=None, type=int)
+    parser.add_argument('--readers', dest='readers', default=1, type=int)
+    parser.add_argument('--workers', dest='workers', default=1, type=int)
+    parser.add_argument('--chunk-sents', dest='chunk_sents', default=None, type=int)
+    parser.add_argument('--include', dest='include', nargs='+', default=None)
+    parser.add_argument('--exclude', dest='exclude', nargs='+', default=None)
+    parser.add_argument('--lazy', dest='lazy', action='store_true')
+    parser.add_argument('--file-list', dest='file_list', default=None)
+    parser.add_argument('--shard', dest='shard', default=None)
+    parser.add_argument('--max-sent-length', dest='max_sent_length', default=1000, type=int)
+    parser.add_argument('--doc-separator', dest='doc_separator', default=None)
+    parser.add_argument('--dedup', dest='dedup', default=None, choices=dedup_modes)
+    parser.add_argument('--memory-budget', dest='memory_budget', default=None)
+    parser.add_argument('--report', dest='report', default=True)
+    parser.add_argument('--no-report', dest='report', action='store_false')
+    parser.add_argument('--prometheus', dest='prometheus', default=None)
 
     args = parser.parse_args()
 
-    c = Corpus(args.folder)
-    c.convert(args.new_folder, ext=args.ext)
+    if args.folder == '-':
+        lines = io.TextIOWrapper(sys.stdin.buffer, encoding='UTF-8', errors='ignore')
+        out = sys.stdout if args.new_folder == '-' else open(args.new_folder, 'w', encoding='UTF-8', errors='ignore')
+
+        with out:
+            tag_stream(lines, out, doc_separator=args.doc_separator, parsers=args.parsers,
+                       disabled_parsers=args.disabled_parsers, fields=args.fields,
+                       max_sent_length=args.max_sent_length)
+        sys.exit()
+
+    if args.new_folder == '-':
+        parser.error('the new corpus can only be - (stdout) when the corpus is - (stdin)')
+
+    c = Corpus(args.folder, include=args.include, exclude=args.exclude, lazy=args.lazy, file_list=args.file_list,
+               shard=args.shard)
+
+    if args.columnar:
+        c.save_columnar(args.new_folder, compress=args.compress, parsers=args.parsers,
+                        disabled_parsers=args.disabled_parsers, fields=args.fields,
+                        max_sent_length=args.max_sent_length)
+    elif args.features:
+        c.count_features(args.new_folder, output_format=args.features,
+                         report=args.new_folder + '.report.json' if args.report is True else args.report,
+                         prometheus=args.prometheus, parsers=args.parsers,
+                         disabled_parsers=args.disabled_parsers, fields=args.fields,
+                         max_sent_length=args.max_sent_length)
+    else:
+        c.convert(args.new_folder, ext=args.ext, prefetch=args.prefetch, readers=args.readers, workers=args.workers,
+                  chunk_sents=args.chunk_sents, dedup=args.dedup, memory_budget=args.memory_budget,
+                  report=args.report, prometheus=args.prometheus,
+                  parsers=args.parsers, disabled_parsers=args.disabled_parsers, fields=args.fields,
+                  max_sent_length=args.max_sent_length)
@@ -0,0 +1,169 @@
+"""
+Collocations of Biber tagged corpora counted in one pass.
+
+Collocations keeps integer counts in arrays indexed by the code of each word or tag, so only one sentence is held in
+memory at a time and the counts grow with the vocabulary, not with the corpus. Association measures are computed for
+every collocate at once with NumPy when they are asked for.
+
+For a node and a collocate c, with N tokens in the corpus, R the number of tokens that can be collocates in the windows
+around the nodes, C the frequency of c and O the frequency of c in the windows, the expected frequency is E = R * C / N
+and:
+
+    mi: log2(O / E)
+    t: (O - E) / sqrt(O)
+    ll: log-likelihood (G2) of the 2 x 2 table of O, R - O, C - O and N - R - C + O
+
+NumPy is only needed for the association measures.
+
+Example:
+    >>> bc = BiberCorpus('/home/mike/corpora/Mini-CORE_tagd_H_BTT', filter_files=False)
+    >>> colls = bc.collocations(['VL++AGLS+++'], left=4, right=0)
+    >>> colls.table(min_freq=5, sort_by='ll')[:3]
+"""
+
+from array import array
+
+from errors import CorpusError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Association measures returned by Collocations().table()
+measures = ('mi', 't', 'll')
+
+
+class Collocations:
+    """
+    Counts the words or tags around nodes in a window of the same sentence.
+
+    Arguments:
+        is_node: function of a BiberToken that returns True for nodes, e.g. lambda token: token.tag in tags
+
+    Keyword arguments:
+        left: number of tokens before a node in its window
+        right: number of tokens after a node in its window
+        key: function of a BiberToken that returns what is counted, e.g. the lowercased word (the default) or the tag
+        is_collocate: function of a BiberToken that returns True for tokens that can be collocates. Every token can if
+        None. Tokens that can't still take up their place in the window.
+
+    Tokens in the windows of several nodes of a sentence are only counted once, so O is never more than C.
+    """
+
+    def __init__(self, is_node, left=4, right=4, key=None, is_collocate=None):
+        self.is_node = is_node
+        self.left = left
+        self.right = right
+        self.key = key or (lambda token: token.token.lower())
+        self.is_collocate = is_collocate
+
+        self.codes = {}
+        self.keys = []
+        # Frequency of every key in the corpus and in the windows of the nodes
+        self.freqs = array('q')
+        self.window_freqs = array('q')
+        self.token_n = 0
+        self.node_n = 0
+        self.window_n = 0
+
+    def code(self, key):
+        """Returns the code of key, adding it if it is new."""
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.keys)
+            self.keys.append(key)
+            self.freqs.append(0)
+            self.window_freqs.append(0)
+        return code
+
+    def add_sent(self, sent):
+        """Adds the counts of a sentence, a list of BiberTokens."""
+        codes = [self.code(self.key(token)) for token in sent]
+        freqs = self.freqs
+        for code in codes:
+            freqs[code] += 1
+        self.token_n += len(sent)
+
+        # Tokens in the window of any node but their own, so tokens in overlapping windows are counted once
+        in_window = [False] * len(sent)
+        for i, token in enumerate(sent):
+            if not self.is_node(token):
+                continue
+
+            self.node_n += 1
+            for j in range(max(0, i - self.left), min(len(sent), i + self.right + 1)):
+                if j != i:
+                    in_window[j] = True
+
+        window_freqs = self.window_freqs
+        is_collocate = self.is_collocate
+
+        for j, token in enumerate(sent):
+            if in_window[j] and (is_collocate is None or is_collocate(token)):
+                self.window_n += 1
+                window_freqs[codes[j]] += 1
+
+    def add_sents(self, sents):
+        """Adds every sentence in sents, an iterable of (file name, list of BiberTokens), e.g. BiberCorpus().sents()."""
+        for file_name, sent in sents:
+            self.add_sent(sent)
+        return self
+
+    def merge(self, other):
+        """Adds the counts of other, e.g. Collocations of another part of the corpus."""
+        for key, freq, window_freq in zip(other.keys, other.freqs, other.window_freqs):
+            code = self.code(key)
+            self.freqs[code] += freq
+            self.window_freqs[code] += window_freq
+
+        self.token_n += other.token_n
+        self.node_n += other.node_n
+        self.window_n += other.window_n
+        return self
+
+    def table(self, min_freq=1, sort_by='ll'):
+        """
+        Returns a list of (collocate, frequency in the windows, frequency in the corpus, mi, t, ll) tuples for every
+        collocate seen at least min_freq times in the windows, from the strongest to the weakest by sort_by, which can
+        be 'mi', 't', 'll' or 'freq'.
+        """
+        if np is None:
+            raise CorpusError('NumPy is needed for association measures. Install it with: pip install numpy')
+        if sort_by not in measures + ('freq',):
+            raise CorpusError('sort_by must be one of: ' + ', '.join(measures + ('freq',)))
+
+        o11 = np.frombuffer(self.window_freqs, dtype=np.int64).astype(np.float64)
+        c1 = np.frombuffer(self.freqs, dtype=np.int64).astype(np.float64)
+        selected = np.flatnonzero(o11 >= max(min_freq, 1))
+        o11, c1 = o11[selected], c1[selected]
+        n = float(self.token_n)
+        r1 = float(self.window_n)
+
+        e11 = r1 * c1 / n
+        mi = np.log2(o11 / e11)
+        t = (o11 - e11) / np.sqrt(o11)
+
+        # Observed and expected frequencies of the other cells of the 2 x 2 table
+        observed = (o11, r1 - o11, c1 - o11, n - r1 - c1 + o11)
+        expected = (e11, r1 * (n - c1) / n, (n - r1) * c1 / n, (n - r1) * (n - c1) / n)
+        ll = np.zeros_like(o11)
+        for o, e in zip(observed, expected):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ll += np.where(o > 0, o * np.log(o / e), 0)
+        ll *= 2
+        # Collocates seen less often than expected are repelled by the node
+        ll = np.where(o11 < e11, -ll, ll)
+
+        columns = {'freq': o11, 'mi': mi, 't': t, 'll': ll}
+        order = np.argsort(-columns[sort_by], kind='stable')
+
+        return [(self.keys[selected[i]], int(o11[i]), int(c1[i]), float(mi[i]), float(t[i]), float(ll[i]))
+                for i in order.tolist()]
+
+    def most_common(self, n=None):
+        """Returns a list of (collocate, frequency in the windows) tuples from the most to the least frequent."""
+        pairs = sorted(((key, freq) for key, freq in zip(self.keys, self.window_freqs) if freq),
+                       key=lambda pair: pair[1], reverse=True)
+        return pairs[:n]
+
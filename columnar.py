@@ -0,0 +1,264 @@
+"""
+Columnar binary format for Biber tagged corpora.
+
+A columnar corpus is a folder of NumPy .npy files that can be memory mapped, so analyses can read millions of tokens
+without parsing .tec lines:
+
+    word.npy, claws.npy, f0.npy ... f5.npy     codes of the word, CLAWS tag and Biber tag fields of every token
+    sent_offsets.npy                           int64 index of the first token of every sentence, and the token count
+    doc_offsets.npy                            int64 index of the first sentence of every text, and the sentence count
+    meta.json                                  format version, text names and the strings of the codes of each column
+
+Every column is dictionary encoded: the code of a token is the index of its string in meta['vocab'][column]. Codes are
+saved in the smallest unsigned integer type that fits the vocabulary of their column, so the tag columns usually take
+one byte per token. If the name of the corpus ends in .npz, the columns are saved in one .npz file instead, which can't
+be memory mapped and can be compressed.
+
+NumPy is only needed to read and write columnar corpora.
+
+Example:
+    >>> c = Corpus('/home/mike/corpora/Mini-CORE_tagd_H')
+    >>> c.save_columnar('/home/mike/corpora/Mini-CORE_columns')
+    >>> cc = ColumnarCorpus('/home/mike/corpora/Mini-CORE_columns')
+    >>> passives = cc.column('f2') == cc.code('f2', 'AGLS')
+"""
+
+import json
+import shutil
+from array import array
+from os import path, listdir, makedirs, remove, replace
+
+from text import Text
+from errors import CorpusError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Version of the columnar format
+COLUMNAR_VERSION = 2
+
+# Columns with one code per token
+token_columns = ('word', 'claws') + tuple('f{0}'.format(i) for i in range(Text.tag_field_n))
+
+# Number of codes converted at a time when the .npy files are written
+block_codes = 1 << 20
+
+
+def require_numpy():
+    """Raises CorpusError if NumPy is not installed."""
+    if np is None:
+        raise CorpusError('NumPy is needed for columnar corpora. Install it with: pip install numpy')
+
+
+def code_dtype(vocab_size):
+    """Returns the smallest unsigned integer NumPy dtype that can hold the codes of a vocabulary of vocab_size."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if vocab_size <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    return np.dtype(np.uint64)
+
+
+class ColumnarWriter:
+    """
+    Saves parsed texts as a columnar corpus. Codes are written to temporary files as texts are added, so only the
+    vocabularies are kept in memory.
+
+    Example:
+        >>> with ColumnarWriter('/home/mike/corpora/Mini-CORE_columns') as w:
+        ...     t = Text('some_file.cls')
+        ...     w.add(t.filepath, t.parse())
+
+    Arguments:
+        output: folder the corpus is saved in, or a file name ending in .npz
+
+    Keyword arguments:
+        compress: compresses the .npz file if True. Folders are not compressed.
+    """
+
+    def __init__(self, output, compress=False):
+        require_numpy()
+
+        self.output = output
+        self.compress = compress
+        self.npz = output.lower().endswith('.npz')
+        self.folder = output + '.tmp' if self.npz else output
+        # Folders made here are removed again if the corpus is not finished
+        self.made_folder = not path.isdir(self.folder)
+        makedirs(self.folder, exist_ok=True)
+
+        self.vocab = {column: {} for column in token_columns}
+        self.code_files = {column: open(path.join(self.folder, column + '.codes'), 'wb') for column in token_columns}
+        self.sent_offsets = array('q', [0])
+        self.doc_offsets = array('q', [0])
+        self.names = []
+        self.token_n = 0
+
+    def add(self, name, parsed_sents):
+        """Adds a text. parsed_sents is the output of Text().parse()."""
+        columns = {column: array('i') for column in token_columns}
+        vocab = self.vocab
+
+        for sent in parsed_sents:
+            for word, tag, biber_tag in sent:
+                for column, value in zip(token_columns, (word, tag) + tuple(biber_tag)):
+                    codes = vocab[column]
+                    code = codes.get(value)
+                    if code is None:
+                        code = codes[value] = len(codes)
+                    columns[column].append(code)
+
+            self.token_n += len(sent)
+            self.sent_offsets.append(self.token_n)
+
+        for column, codes in columns.items():
+            codes.tofile(self.code_files[column])
+
+        self.doc_offsets.append(len(self.sent_offsets) - 1)
+        self.names.append(name)
+
+    def close(self):
+        """Writes the .npy files and meta.json, or the .npz file."""
+        arrays = {}
+
+        for column, f in self.code_files.items():
+            f.close()
+            code_file = path.join(self.folder, column + '.codes')
+            npy_file = path.join(self.folder, column + '.npy')
+
+            dtype = code_dtype(len(self.vocab[column]))
+
+            # Writes a .npy header and converts the codes to dtype a block at a time, without loading them into memory
+            with open(npy_file, 'wb') as npy, open(code_file, 'rb') as codes:
+                np.lib.format.write_array_header_1_0(
+                    npy, {'descr': dtype.str, 'fortran_order': False, 'shape': (self.token_n,)})
+                while True:
+                    block = np.fromfile(codes, dtype=np.int32, count=block_codes)
+                    if not len(block):
+                        break
+                    npy.write(block.astype(dtype).tobytes())
+
+            remove(code_file)
+            arrays[column] = npy_file
+
+        sent_offsets = np.frombuffer(self.sent_offsets, dtype=np.int64)
+        doc_offsets = np.frombuffer(self.doc_offsets, dtype=np.int64)
+        meta = {
+            'version': COLUMNAR_VERSION,
+            'columns': list(token_columns),
+            'names': self.names,
+            'vocab': {column: list(codes) for column, codes in self.vocab.items()},
+        }
+
+        if self.npz:
+            savez = np.savez_compressed if self.compress else np.savez
+            savez(self.output + '.tmp.npz', sent_offsets=sent_offsets, doc_offsets=doc_offsets,
+                  meta=np.array(json.dumps(meta)),
+                  **{column: np.load(npy_file, mmap_mode='r') for column, npy_file in arrays.items()})
+            replace(self.output + '.tmp.npz', self.output)
+            shutil.rmtree(self.folder)
+        else:
+            np.save(path.join(self.folder, 'sent_offsets.npy'), sent_offsets)
+            np.save(path.join(self.folder, 'doc_offsets.npy'), doc_offsets)
+            with open(path.join(self.folder, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+    def abort(self):
+        """
+        Removes the files written so far without saving the corpus. The .npy files and meta.json of a corpus saved
+        in the folder before are only replaced by close(), so they are left as they were.
+        """
+        for column, f in self.code_files.items():
+            f.close()
+            code_file = path.join(self.folder, column + '.codes')
+            if path.exists(code_file):
+                remove(code_file)
+
+        if self.npz or self.made_folder and not listdir(self.folder):
+            shutil.rmtree(self.folder)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # A corpus of the texts added before an exception would look complete, so it is not saved
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class ColumnarCorpus:
+    """
+    Reads a columnar corpus. Columns of corpora saved as folders are memory mapped, so nothing is read until it is
+    used.
+
+    Example:
+        >>> cc = ColumnarCorpus('/home/mike/corpora/Mini-CORE_columns')
+        >>> cc.sents(0)[0][:2]
+        [('It', 'PPH1', ['', '', '', '', '', '']), ('was', 'VBDZ', ['vbd', 'bedz', 'aux', '', '', ''])]
+
+    Arguments:
+        corpus: folder or .npz file saved by ColumnarWriter
+
+    Keyword arguments:
+        mmap: memory maps the columns if True. Columns are read into memory if False or if corpus is a .npz file.
+    """
+
+    def __init__(self, corpus, mmap=True):
+        require_numpy()
+
+        if corpus.lower().endswith('.npz'):
+            npz = np.load(corpus)
+            meta = json.loads(str(npz['meta']))
+            self.arrays = {name: npz[name] for name in npz.files if name != 'meta'}
+        else:
+            with open(path.join(corpus, 'meta.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            mmap_mode = 'r' if mmap else None
+            self.arrays = {name: np.load(path.join(corpus, name + '.npy'), mmap_mode=mmap_mode)
+                           for name in meta['columns'] + ['sent_offsets', 'doc_offsets']}
+
+        if meta['version'] != COLUMNAR_VERSION:
+            raise CorpusError('{0} was saved in version {1} of the columnar format, not {2}'.format(
+                corpus, meta['version'], COLUMNAR_VERSION))
+
+        self.corpus = corpus
+        self.names = meta['names']
+        self.vocab = meta['vocab']
+        self.sent_offsets = self.arrays['sent_offsets']
+        self.doc_offsets = self.arrays['doc_offsets']
+        self.codes = {column: {value: code for code, value in enumerate(values)}
+                      for column, values in self.vocab.items()}
+
+    def __len__(self):
+        """Returns the number of texts."""
+        return len(self.names)
+
+    def column(self, name):
+        """Returns the codes of column name for every token in the corpus, e.g. column('f2')."""
+        return self.arrays[name]
+
+    def code(self, column, value):
+        """Returns the code of the string value in column, or -1 if it is not in the corpus."""
+        return self.codes[column].get(value, -1)
+
+    def token_range(self, doc):
+        """Returns (index of the first token, index after the last token) of the text with index doc."""
+        return int(self.sent_offsets[self.doc_offsets[doc]]), int(self.sent_offsets[self.doc_offsets[doc + 1]])
+
+    def sents(self, doc):
+        """Returns the sentences of the text with index doc in the format returned by Text().parse()."""
+        first_sent, last_sent = int(self.doc_offsets[doc]), int(self.doc_offsets[doc + 1])
+        start, end = self.token_range(doc)
+        decoded = [[self.vocab[column][code] for code in self.arrays[column][start:end].tolist()]
+                   for column in token_columns]
+        tokens = [(word, tag, list(biber_tag)) for word, tag, *biber_tag in zip(*decoded)]
+
+        offsets = self.sent_offsets[first_sent:last_sent + 1].tolist()
+        return [tokens[s - start:e - start] for s, e in zip(offsets, offsets[1:])]
+
+    def tagged_text(self, doc, keep_claws=True):
+        """Returns the text with index doc in the format saved by Text().write()."""
+        return Text.serialize(self.sents(doc), 'tec', keep_claws=keep_claws)
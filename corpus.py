@@ -1,11 +1,42 @@
-from os import walk, mkdir, path
+from os import makedirs, path
 from time import time
-from collections import defaultdict
+from collections import defaultdict, Counter
+from itertools import islice
+import csv
+import json
+import random
 
 from text import Text
+from pipeline import ConversionPipeline, tag_text, report_text
+from archive import ArchiveReader, ArchiveWriter, archive_type, read_text_file
+from discovery import scan_files, is_included, save_file_list, load_file_list, file_list_matches
+from columnar import ColumnarWriter
+from sketches import FrequencySketch
+from telemetry import RunReport, report_path
+from shards import parse_shard, shard_files, shard_output, save_manifest, file_size, relative_path
+from dedup import DuplicateFinder, dedup_modes
 from errors import CorpusError
 
 
+def reservoir_sample(items, k, seed=None):
+    """
+    Returns a list of k items picked at random from the iterable items, in their order, keeping only k items in
+    memory. Returns every item if there are k or fewer.
+    """
+    rng = random.Random(seed)
+    sample = []
+
+    for i, item in enumerate(items):
+        if i < k:
+            sample.append((i, item))
+        else:
+            j = rng.randint(0, i)
+            if j < k:
+                sample[j] = (i, item)
+
+    return [item for i, item in sorted(sample, key=lambda pair: pair[0])]
+
+
 class Corpus:
     """
     Used to manage corpora of CLAWS-tagged texts.
@@ -13,57 +44,494 @@ class Corpus:
     Example:
         >>> c = Corpus('/home/mike/corpora/Mini-CORE_tagd_H')
         >>> c.convert('/home/mike/corpora/Mini-CORE_tagd_H_BTT')
+
+        Reads texts straight out of an archive and saves the new texts in another archive
+        >>> c = Corpus('/home/mike/corpora/Mini-CORE_tagd_H.tar.gz')
+        >>> c.convert('/home/mike/corpora/Mini-CORE_tagd_H_BTT.zip')
         
     Arguments:
-        folder: Directory containing corpus. Can have one ore more level of subfolders.
+        folder: Directory containing corpus. Can have one ore more level of subfolders. Can also be a .tar, .tar.gz,
+        .tgz, .tar.bz2, .tar.xz, .zip or .gz file, in which case texts are read from it without extracting them.
         encoding_in: Character set of corpus files e.g. UTF-8, ascii-us
+
+    Keyword arguments:
+        include: glob patterns matched against file paths relative to folder and file names. If given, only
+        matching files are in the corpus.
+        exclude: glob patterns. Files and folders matching any of them are not in the corpus, and excluded folders
+        are not searched.
+        lazy: if True, files are found while the corpus is being used instead of when it is made. self.files is
+        only made if it is used.
+        file_list: path of a file where the list of files is saved the first time they are found. Later corpora
+        made with the same folder and patterns read the list instead of searching the folder.
+        shard: a string like '2/4' or a tuple like (2, 4). If given, the corpus only has the files of that shard
+        (see shards.py), and convert() saves a manifest of the files it converted.
     """
 
 
-    def __init__(self, folder, encoding_in='UTF-8'):
-        self.files = []
+    def __init__(self, folder, encoding_in='UTF-8', include=None, exclude=None, lazy=False, file_list=None,
+                 shard=None):
         self.folder = folder
         self.dirs = []
+        self.encoding_in = encoding_in
+        self.include = list(include) if include else None
+        self.exclude = list(exclude) if exclude else None
+        self.file_list = file_list
+        self.archive = None
+        self._files = None
+        self.shard = None if shard is None else parse_shard(shard)
+        # Every file in the corpus, including the files of other shards. Made by self.iter_files() if shard is set.
+        self.all_files = None
+
+        if path.isfile(folder) and archive_type(folder):
+            self.archive = ArchiveReader(folder)
+
+        if not lazy:
+            self._files = list(self.iter_files())
+
+    @property
+    def files(self):
+        """List of the paths of the files in the corpus. Files in archives are named as if the archive was a folder."""
+        if self._files is None:
+            self._files = list(self.iter_files())
+        return self._files
+
+    @files.setter
+    def files(self, files):
+        self._files = files
+
+    def iter_files(self):
+        """Yields the paths of the files in the corpus as they are found. Also fills self.dirs."""
+        if self._files is not None:
+            yield from self._files
+            return
+
+        self.dirs = []
+
+        if self.file_list and file_list_matches(self.file_list, self.folder, self.include, self.exclude):
+            files = self.track_dirs(load_file_list(self.file_list, self.folder, self.include, self.exclude))
+        elif self.archive is not None:
+            files = self.track_dirs(path.join(self.folder, name) for name in self.archive.names()
+                                    if is_included(name, self.include, self.exclude))
+        else:
+            files = scan_files(self.folder, self.include, self.exclude, dirs=self.dirs)
+
+        if self.file_list and not file_list_matches(self.file_list, self.folder, self.include, self.exclude):
+            files = save_file_list(self.file_list, self.folder, files, self.include, self.exclude)
+
+        if self.shard is not None:
+            # Every file has to be found before the shards can be made
+            self.all_files = list(files)
+            files = shard_files(self.all_files, self.folder, self.shard)
+
+        yield from files
+
+    def track_dirs(self, files):
+        """Yields every item in files and adds the folders they are in to self.dirs."""
+        seen = set(self.dirs)
+
+        for file_name in files:
+            dir_path = path.dirname(file_name)
+
+            # Adds parent folders first so that copy_dir_tree() can make them in order
+            new_dirs = []
+            while dir_path not in seen and len(dir_path) >= len(self.folder):
+                new_dirs.append(dir_path)
+                seen.add(dir_path)
+                dir_path = path.dirname(dir_path)
+            self.dirs += reversed(new_dirs)
+
+            yield file_name
+
+    def read_texts(self, files=None, encoding='UTF-8', errors='ignore'):
+        """
+        Yields (file name, text) for files in the corpus. Texts in archives are read in the order they are stored
+        in, other texts in the order of files.
+
+        Keyword arguments:
+            files: file names to read. All files in the corpus are read as they are found if None.
+            encoding: character encoding of the files
+            errors: how encoding errors are handled when reading the files
+        """
+        if self.archive is not None:
+            if files is None and self._files is None and self.shard is None:
+                # Streams through the archive without listing it first
+                for name, raw_text in self.archive.texts(encoding, errors):
+                    if is_included(name, self.include, self.exclude):
+                        yield path.join(self.folder, name), raw_text
+                return
+
+            names = [f[len(self.folder) + 1:] for f in (self.files if files is None else files)]
+            for name, raw_text in self.archive.texts(encoding, errors, names=names):
+                yield path.join(self.folder, name), raw_text
+        else:
+            for file_name in (self.iter_files() if files is None else files):
+                yield file_name, read_text_file(file_name, encoding, errors)
+
+    def texts(self, files=None, **kwargs):
+        """
+        Yields a Text for files in the corpus.
 
-        for dir_path, dir_names, file_names in walk(folder):
-            for fn in file_names:
-                self.files.append(path.join(dir_path, fn))
-            self.dirs.append(dir_path)
+        Keyword arguments:
+            files: file names to read. All files in the corpus are read as they are found if None.
+            **kwargs: passed to Text()
+        """
+        encoding = kwargs.get('input_encoding', 'UTF-8')
+        errors = kwargs.get('input_open_errors', 'ignore')
+
+        for file_name, raw_text in self.read_texts(files, encoding, errors):
+            yield Text(file_name, text=raw_text, **kwargs)
 
-    def convert(self, new_folder, ext='tec', stop_at=None, **kwargs):
+    def convert(self, new_folder, ext='tec', stop_at=None, prefetch=None, readers=1, workers=1, chunk_sents=None,
+                dedup=None, near_threshold=0.9, memory_budget=None, report=None, prometheus=None, **kwargs):
         """Converts all CLAWS tagged texts in a directory to Biber tagged texts.
         
         Arguments:
             new_folder: Path to the new folder. New folder and subdirectories matching self.folder will be made if 
-            they do not already exist.
+            they do not already exist. If new_folder ends in .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz or .zip, the
+            new texts are saved in an archive instead.
         
         Keyword arguments:
             ext: File extension for new files.
-            stop_at: maximum number of files to convert
+            stop_at: index of the last file to convert, so that stop_at + 1 files are converted
+            prefetch: if set, files are read, parsed and written concurrently by a ConversionPipeline, and prefetch
+            is the maximum number of texts waiting between stages
+            readers: number of threads reading files when the pipeline is used
+            workers: number of processes parsing texts. The pipeline is used if this is more than 1.
+            chunk_sents: if set, texts with more than this many sentences are parsed in chunks of chunk_sents
+            sentences by different worker processes, so that large files are parsed on every core. Texts without
+            sentence tags are one sentence and are not split.
+            dedup: if set, texts are compared by their tokens and tags before they are parsed (see dedup.py). Texts
+            that are exact duplicates of an earlier text are saved with its tagged text instead of being parsed.
+            'exact' only looks for exact duplicates, 'near' also reports near duplicates, 'skip' does not convert
+            near duplicates of earlier texts.
+            near_threshold: estimated Jaccard similarity at or above which texts are near duplicates
+            memory_budget: bytes of memory, or a string like '16G', that parsing is kept under (see resources.py).
+            Texts too large for their share are parsed in chunks if they have sentence tags, fewer texts are parsed
+            at once when memory runs short, and files are only read when they fit. The pipeline is used if this is
+            set.
+            report: path of a JSON run report of the conversion (see telemetry.py), with the time taken by every
+            file, the time spent in every parser stage and the errors. If True, it is saved next to new_folder, e.g.
+            as Mini-CORE_tagd_H_BTT.report.json. No report is saved if None.
+            prometheus: path of a Prometheus textfile the metrics of the conversion are saved to while it goes on
+            **kwargs: passed to Text(). Use parsers, disabled_parsers and fields to choose which parser stages run.
+
+        If the corpus is a shard, a manifest of the converted files and stats is saved next to new_folder, and archives
+        are saved with the shard in their name (see shards.py). If dedup is set, a manifest with the duplicates found is
+        saved, for a shard or for the whole corpus. Shards only look for duplicates among their own files.
+
+        Example:
+            Only tags passives and modals
+            >>> c.convert('/home/mike/corpora/Mini-CORE_tagd_H_BTT', parsers=['passives', 'modal_types'])
+            Reads up to 32 files ahead while 4 processes parse
+            >>> c.convert('/home/mike/corpora/Mini-CORE_tagd_H_BTT', prefetch=32, workers=4)
+            Parses large files in chunks of 5000 sentences on 8 processes
+            >>> c.convert('/home/mike/corpora/Mini-CORE_tagd_H_BTT', workers=8, chunk_sents=5000)
+            Parses on 8 processes without using more than 16 GB, however large the files are
+            >>> c.convert('/home/mike/corpora/Giant-BT', workers=8, memory_budget='16G')
+            Parses texts that are copies of other texts once and leaves out near duplicates
+            >>> c.convert('/home/mike/corpora/Mini-CORE_tagd_H_BTT', dedup='skip')
+            Saves a run report as /home/mike/corpora/Mini-CORE_tagd_H_BTT.report.json
+            >>> c.convert('/home/mike/corpora/Mini-CORE_tagd_H_BTT', workers=8, report=True)
+        """
+        if dedup is not None and dedup not in dedup_modes:
+            raise CorpusError('dedup must be one of: ' + ', '.join(dedup_modes))
+
+        t = time()
+        output_archive = None
+        lazy = self._files is None
+        manifest_folder = new_folder
+        # (input file, output file) of every text saved, for the manifest of a shard
+        converted = []
+        # Input file of every output file name given out
+        inputs = {}
+
+        if self.shard is not None:
+            new_folder = shard_output(new_folder, self.shard)
+        output = new_folder
+
+        if archive_type(new_folder) in ('tar', 'zip'):
+            output_archive = ArchiveWriter(new_folder)
+            new_folder = ''
+        elif not lazy:
+            self.copy_dir_tree(new_folder)
+
+        files = None if stop_at is None else list(islice(self.iter_files(), stop_at + 1))
+        encoding = kwargs.get('input_encoding', 'UTF-8')
+        errors = kwargs.get('input_open_errors', 'ignore')
+
+        def new_file_name(file_name):
+            new_name = self.new_file_name(file_name, new_folder, ext)
+            # Folders of lazily found files are made as they are needed
+            if lazy and output_archive is None:
+                makedirs(path.dirname(new_name), exist_ok=True)
+            inputs[new_name] = file_name
+            return new_name
+
+        long_sent_counts = Counter()
+        # Output file names of the first text of every group of exact duplicates and the output file names of the rest
+        duplicates = {}
+        duplicate_report = None
+
+        if dedup is not None:
+            all_files = list(self.iter_files()) if files is None else files
+            finder = self.find_duplicates(all_files, near=dedup != 'exact', threshold=near_threshold, **kwargs)
+            duplicate_of = finder.duplicate_of()
+            near_pairs = finder.near_pairs() if dedup != 'exact' else []
+            skipped = finder.near_duplicates() if dedup == 'skip' else set()
+            # Exact copies of a skipped text are skipped with it, since there is no tagged text to copy
+            skipped.update(f for f, first in duplicate_of.items() if first in skipped)
+            files = [f for f in all_files if f not in duplicate_of and f not in skipped]
+
+            for file_name in all_files:
+                if file_name in duplicate_of and file_name not in skipped:
+                    # new_file_name() is called for the first text by the conversion
+                    first = self.new_file_name(duplicate_of[file_name], new_folder, ext)
+                    duplicates.setdefault(first, []).append(new_file_name(file_name))
+
+            duplicate_report = {
+                'mode': dedup,
+                'exact': [[relative_path(f, self.folder) for f in group] for group in finder.exact_groups()],
+                'near': [[relative_path(a, self.folder), relative_path(b, self.folder), similarity]
+                         for a, b, similarity in near_pairs],
+                'skipped': [relative_path(f, self.folder) for f in all_files if f in skipped],
+            }
+            print('Found {0} exact duplicates and {1} near duplicates of earlier texts'.format(
+                len(duplicate_of), len(set(b for a, b, similarity in near_pairs))))
+
+        run_report = None
+        if report or prometheus:
+            run_report = RunReport('convert', prometheus_file=prometheus, folder=self.folder, output=output,
+                                   shard=None if self.shard is None else list(self.shard), workers=workers)
+            if report is True:
+                report = report_path(manifest_folder, self.shard)
+
+        n = 0
+
+        try:
+            if prefetch or workers > 1 or memory_budget:
+                if self.archive is not None:
+                    # Archives are read by a single reader in the order they are stored in
+                    jobs = ((file_name, new_file_name(file_name), raw_text)
+                            for file_name, raw_text in self.read_texts(files, encoding, errors))
+                else:
+                    jobs = ((file_name, new_file_name(file_name))
+                            for file_name in (self.iter_files() if files is None else files))
+
+                pipeline = ConversionPipeline(jobs, prefetch=prefetch or 8, readers=readers, workers=workers,
+                                              chunk_sents=chunk_sents, output_archive=output_archive,
+                                              duplicates=duplicates, memory_budget=memory_budget,
+                                              report=run_report, **kwargs)
+                n = pipeline.run()
+                long_sent_counts = pipeline.long_sent_counts
+                converted.extend((inputs[name], name) for name in pipeline.written_files)
+
+                if pipeline.scheduler is not None:
+                    print('Parsed {0} texts in chunks to stay within the memory budget. Peak memory: {1:.0f} MB'.format(
+                        pipeline.scheduler.oversized, pipeline.scheduler.peak_rss / 2 ** 20))
+            else:
+                text_kwargs = dict(kwargs, time_parsers=True) if run_report is not None else kwargs
+
+                for file_name, raw_text in self.read_texts(files, encoding, errors):
+                    first_name = new_file_name(file_name)
+
+                    try:
+                        tagged, counts, stats = tag_text(file_name, raw_text, text_kwargs, {})
+                    except Exception as e:
+                        if run_report is not None:
+                            run_report.add_error(file_name, e)
+                        raise
+
+                    for name in [first_name] + duplicates.get(first_name, []):
+                        print(name)
+                        if output_archive is not None:
+                            output_archive.write(name, tagged)
+                        else:
+                            with open(name, 'w', encoding='UTF-8', errors='ignore') as f:
+                                f.write(tagged)
+                        n += 1
+                        converted.append((inputs[name], name))
+
+                        if run_report is not None:
+                            report_text(run_report, name, first_name, tagged, stats)
+
+                    long_sent_counts.update(counts)
+        finally:
+            if output_archive is not None:
+                output_archive.close()
+
+            if run_report is not None:
+                run_report.add_stats(texts=n, **long_sent_counts)
+                if duplicate_report is not None:
+                    run_report.add_stats(duplicate_texts=sum(len(names) for names in duplicates.values()),
+                                         skipped_texts=len(duplicate_report['skipped']))
+                run_report.finish()
+                if report:
+                    run_report.save(report)
+                    print('Saved run report', report)
+
+        seconds = time() - t
+        print('Converted', n, 'texts in', seconds, 'seconds')
+
+        if long_sent_counts['long_sentences']:
+            print('Parsed {long_sentences} long sentences in {split_sentences} pieces split at punctuation and '
+                  '{windows} windows'.format(**long_sent_counts))
+
+        if self.shard is not None or duplicate_report is not None:
+            stats = {'texts': n, 'bytes': sum(file_size(f) for f, new_f in converted), 'seconds': seconds}
+            stats.update(long_sent_counts)
+
+            if duplicate_report is not None:
+                # Skipped texts are listed without an output file so that merged shards still cover every file
+                converted += [(f, None) for f in all_files if f in skipped]
+                stats['duplicate_texts'] = sum(len(names) for names in duplicates.values())
+                stats['duplicate_bytes'] = sum(file_size(f) for f in all_files
+                                               if f in duplicate_of and f not in skipped)
+                stats['near_duplicate_pairs'] = len(duplicate_report['near'])
+                stats['skipped_texts'] = len(duplicate_report['skipped'])
+
+            all_files = self.all_files if self.shard is not None else self.files
+            print('Saved manifest', save_manifest(manifest_folder, self.shard, self.folder, all_files, converted,
+                                                  output, stats, duplicate_report))
+
+    def new_file_name(self, file_name, new_folder, ext):
+        """Returns the path in new_folder that file_name is converted to."""
+        file_name = file_name[len(self.folder) + 1:]
+
+        if file_name.lower().endswith('.gz'):
+            file_name = file_name[:-3]
+
+        return path.join(new_folder, file_name[:-3] + ext)
+
+    def find_duplicates(self, files=None, near=True, threshold=0.9, **kwargs):
+        """
+        Returns a DuplicateFinder (see dedup.py) with every text of the corpus added. Texts are tokenized but not
+        parsed.
+
+        Keyword arguments:
+            files: file names to compare. All files in the corpus are compared if None.
+            near: finds near duplicates as well as exact duplicates if True
+            threshold: estimated Jaccard similarity at or above which texts are near duplicates
+            **kwargs: passed to Text()
+        """
+        finder = DuplicateFinder(threshold=threshold, near=near)
+
+        for text in self.texts(files, **kwargs):
+            finder.add(text.filepath, text.sents)
+
+        return finder
+
+    def count_features(self, output_file, output_format='csv', per=1000, stop_at=None, report=None, prometheus=None,
+                       **kwargs):
+        """
+        Parses every text and saves a table of Biber feature frequencies with one row per text instead of writing
+        tagged texts. Features are defined in Text.feature_dict.
+
+        Example:
+            >>> c = Corpus('/home/mike/corpora/Mini-CORE_tagd_H')
+            >>> c.count_features('/home/mike/corpora/Mini-CORE_features.csv')
+
+        Arguments:
+            output_file: path of the table
+
+        Keyword arguments:
+            output_format: 'csv' for a comma-separated table or 'jsonl' for one JSON object per line
+            per: frequencies are normalised per this many tokens. Raw counts are saved if per is None or 0.
+            stop_at: index of the last file to count, as in convert()
+            report: path of a JSON run report of the count (see telemetry.py)
+            prometheus: path of a Prometheus textfile the metrics are saved to while the count goes on
+            **kwargs: passed to Text()
+        """
+        if output_format not in ('csv', 'jsonl'):
+            raise CorpusError("output_format must be 'csv' or 'jsonl'")
+
+        t = time()
+        n = 0
+        run_report = None
+        if report or prometheus:
+            run_report = RunReport('count_features', prometheus_file=prometheus, folder=self.folder,
+                                   output=output_file)
+            kwargs['time_parsers'] = True
+
+        with open(output_file, 'w', encoding='utf-8', newline='') as f:
+            writer = None
+
+            encoding = kwargs.get('input_encoding', 'UTF-8')
+            errors = kwargs.get('input_open_errors', 'ignore')
+
+            for i, (file_name, raw_text) in enumerate(self.read_texts(None, encoding, errors)):
+                text_t = time()
+                hits, misses = Text.type_cache.hits, Text.type_cache.misses
+                text = Text(file_name, text=raw_text, **kwargs)
+                row = {'file': text.filepath[len(self.folder) + 1:]}
+                row.update(text.feature_counts(per=per))
+                n += 1
+
+                if run_report is not None:
+                    run_report.add_file(file_name, seconds=time() - text_t, tokens=row['tokens'],
+                                        bytes_in=len(raw_text), parser_seconds=text.parser_seconds,
+                                        cache_hits=Text.type_cache.hits - hits,
+                                        cache_misses=Text.type_cache.misses - misses)
+
+                if output_format == 'jsonl':
+                    f.write(json.dumps(row) + '\n')
+                else:
+                    if writer is None:
+                        writer = csv.DictWriter(f, fieldnames=list(row))
+                        writer.writeheader()
+                    writer.writerow(row)
+
+                if i == stop_at:
+                    break
+
+        print('Counted features in', n, 'texts in', time() - t, 'seconds')
+
+        if run_report is not None:
+            run_report.finish()
+            if report:
+                run_report.save(report)
+
+    def save_columnar(self, output, stop_at=None, compress=False, **kwargs):
+        """
+        Parses every text and saves the corpus in the columnar format of columnar.py instead of writing tagged texts.
+        Needs NumPy.
+
+        Example:
+            >>> c = Corpus('/home/mike/corpora/Mini-CORE_tagd_H')
+            >>> c.save_columnar('/home/mike/corpora/Mini-CORE_columns')
+
+        Arguments:
+            output: folder the columns are saved in, or a file name ending in .npz
+
+        Keyword arguments:
+            stop_at: index of the last file to save, as in convert()
+            compress: compresses the columns if output ends in .npz
+            **kwargs: passed to Text()
         """
         t = time()
-        self.copy_dir_tree(new_folder)
+        n = 0
 
-        for i, file_name in enumerate(self.files):
-            text = Text(file_name, **kwargs)
-            file_name = path.join(new_folder, file_name[len(self.folder) + 1:-3] + ext)
-            text.write(file_name)
+        with ColumnarWriter(output, compress=compress) as writer:
+            for i, text in enumerate(self.texts(**kwargs)):
+                writer.add(text.filepath[len(self.folder) + 1:], text.parse())
+                n += 1
 
-            if i == stop_at:
-                break
+                if i == stop_at:
+                    break
 
-        print('Converted', len(self.files), 'texts in', time() - t, 'seconds')
+        print('Saved', n, 'texts as columns in', time() - t, 'seconds')
 
     def copy_dir_tree(self, new_folder):
         """Makes new folder containing subfolders structured in the same way as the self.folder"""
         for d in self.dirs:
             d = new_folder + d[len(self.folder):]
             if not path.exists(d):
-                mkdir(d)
+                makedirs(d)
 
-    def find(self, *token_tags, lowercase=True, whole_sent=False, sent_tail=False, save=False):
+    def find(self, *token_tags, lowercase=True, whole_sent=False, sent_tail=False, save=False, limit=None,
+             sample=None, seed=None, report=None):
         """
-        Finds words and ngrams in a CLAWS tagged text.
+        Finds words and ngrams in a CLAWS tagged text. Returns a list of (file name, match) tuples, or the number of
+        matches saved if save is given. Matches are found with self.iter_find().
         
         Arguments:
             token_tags: A tuple or tuples with token-tag pairs. Tuple item values must be str or NoneType.
@@ -71,6 +539,14 @@ class Corpus:
         Keyword Arguments:
             lowercase: Makes the CLAWS tagged text tokens lowercase before comparing them with the token strings in token_tags
             whole_sent: Returns the whole sentence of a match if true or only the matching token_tag pair if False.
+            sent_tail: Returns the sentence from the last token of a match if True.
+            save: path of a file the matches are written to, one per line, as they are found. Asks for the path if
+            True.
+            limit: stops after this many matches
+            sample: returns this many matches picked at random from all of them (or from the first limit), in corpus
+            order
+            seed: seed of the random sample
+            report: path of a JSON run report of the search (see telemetry.py)
         
         Examples:
              >>> c = Corpus('/home/mike/corpora/Mini-CORE_tagd_H')
@@ -80,15 +556,56 @@ class Corpus:
              >>> r = c.find(('people', None), ('in', None))
              Find a 'people' token with a 'NN' tag followed by anything followed by any token with a 'VBZ' tag
              >>> r = c.find(('people', 'NN'), (None, None), (None, 'VBZ'))
+             Save 100 random concordance lines of 'people' without keeping the rest in memory
+             >>> c.find(('people', None), whole_sent=True, sample=100, save='people.txt')
         """
+        run_report = None
+        if report:
+            run_report = RunReport('find', folder=self.folder, query=[list(item) for item in token_tags])
+        matches = self.iter_find(*token_tags, lowercase=lowercase, whole_sent=whole_sent, sent_tail=sent_tail,
+                                 limit=limit, report=run_report)
 
-        matches = []
+        if sample is not None:
+            matches = reservoir_sample(matches, sample, seed)
 
+        if save:
+            if save is True:
+                save = input('Save as: ')
+            result = self.save_matches(matches, save)
+        else:
+            result = list(matches)
+
+        if run_report is not None:
+            run_report.finish()
+            run_report.save(report)
+
+        return result
+
+    def iter_find(self, *token_tags, lowercase=True, whole_sent=False, sent_tail=False, limit=None, report=None):
+        """
+        Yields (file name, match) for the matches of token_tags as they are found, so that texts after the last match
+        needed are not read. See self.find() for the arguments. report can be a RunReport the texts searched and the
+        number of matches are added to.
+
+        Example:
+            >>> c = Corpus('/home/mike/corpora/Mini-CORE_tagd_H')
+            >>> for file_name, match in c.iter_find(('people', None), ('in', None), limit=10):
+            ...     print(file_name, match)
+        """
         if [item for item in token_tags if type(item) != tuple or len(item) != 2]:
             raise CorpusError("Token_tags must be tuples with two items having str or NoneType values")
 
-        for file_name in self.files:
-            text = Text(file_name, lowercase=lowercase)
+        if limit is not None and limit <= 0:
+            return
+
+        found = 0
+
+        for text in self.texts(lowercase=lowercase):
+            file_name = text.filepath
+
+            if report is not None:
+                report.add_file(file_name, tokens=sum(len(sent) for sent in text.sents), bytes_in=len(text.text))
+                report.add_stats(matches=found)
 
             for sent in text.sents:
                 match = []
@@ -120,56 +637,114 @@ class Corpus:
                     # Adds to matches when finished
                     if ngram_ind == len(token_tags):
                         if whole_sent:
-                            matches.append((file_name, sent))
+                            yield file_name, sent
                         elif sent_tail:
-                            matches.append((file_name, sent[i:]))
+                            yield file_name, sent[i:]
                         else:
-                            matches.append((file_name, match))
+                            yield file_name, match
+
+                        found += 1
+                        if report is not None:
+                            report.add_stats(matches=found)
+                        if found == limit:
+                            return
 
                         ngram_ind = 0
                         match = []
-        if save:
-            save_as = input('Save as: ')
-            output = '\n'.join(' '.join(tok + '_' + tag for tok, tag in line) for fn, line in matches)
 
-            with open(save_as, 'w', encoding='utf-8') as f:
-                f.write(output)
+    @staticmethod
+    def save_matches(matches, file_name):
+        """
+        Writes matches from self.find() or self.iter_find() to file_name as they come, one per line of word_TAG
+        tokens. Returns the number of matches written.
+        """
+        n = 0
 
-        else:
-            return matches
+        with open(file_name, 'w', encoding='utf-8') as f:
+            for fn, line in matches:
+                if n:
+                    f.write('\n')
+                f.write(' '.join(tok + '_' + tag for tok, tag in line))
+                n += 1
+
+        return n
 
-    def lex_freq(self, *tags, lowercase=True):
+    def lex_freq(self, *tags, lowercase=True, sketch=None):
         """
         Makes conditional frequency distribution of words and tags in a claws tagged text with tags as search string.
+
+        Keyword arguments:
+            sketch: a FrequencySketch (see sketches.py). If given, (word, tag) pairs are added to it and it is returned
+            instead of a dict.
         """
         freq_dist = {}
 
-        for file_name in self.files:
-            text = Text(file_name, lowercase=lowercase)
-
+        for text in self.texts(lowercase=lowercase):
             for sent in text.sents:
                 for word, tag in sent:
                     if tag in tags:
+                        if sketch is not None:
+                            sketch.add((word, tag))
+                            continue
                         if not freq_dist.get(word, False):
                             freq_dist[word] = defaultdict(int)
                         freq_dist[word][tag] += 1
 
-        return freq_dist
+        return freq_dist if sketch is None else sketch
 
-    def tag_freq(self, *words, lowercase=True):
+    def tag_freq(self, *words, lowercase=True, sketch=None):
         """
         Makes conditional frequency distribution of words and tags in a claws tagged text with words as search string.
+
+        Keyword arguments:
+            sketch: a FrequencySketch (see sketches.py). If given, (word, tag) pairs are added to it and it is returned
+            instead of a dict.
         """
         freq_dist = {}
 
-        for file_name in self.files:
-            text = Text(file_name, lowercase=lowercase)
-
+        for text in self.texts(lowercase=lowercase):
             for sent in text.sents:
                 for word, tag in sent:
                     if word in words:
+                        if sketch is not None:
+                            sketch.add((word, tag))
+                            continue
                         if not freq_dist.get(word, False):
                             freq_dist[word] = defaultdict(int)
                         freq_dist[word][tag] += 1
 
-        return freq_dist
\ No newline at end of file
+        return freq_dist if sketch is None else sketch
+
+    def freq_sketch(self, element_i=1, n=1, sketch=None, files=None, lowercase=True, **kwargs):
+        """
+        Returns a FrequencySketch (see sketches.py) of the tags, words, (word, tag) pairs or n-grams of the corpus,
+        which takes the same memory however large the corpus is.
+
+        Sketches of parts of a corpus, e.g. counted by different processes from different files, can be combined with
+        FrequencySketch().merge() if they were made with the same sizes.
+
+        Example:
+            >>> c = Corpus('/home/mike/corpora/Mini-CORE_tagd_H')
+            >>> fs = c.freq_sketch(0, n=2)
+            >>> fs.most_common(10)
+
+        Keyword arguments:
+            element_i: 0 for words, 1 for tags, None for (word, tag) tuples
+            n: length of the n-grams counted. N-grams are tuples of elements and don't cross sentence boundaries.
+            sketch: FrequencySketch the items are added to. A new one is made with **kwargs if None.
+            files: file names to read. All files in the corpus are read if None.
+            lowercase: lowercases words if True
+        """
+        if sketch is None:
+            sketch = FrequencySketch(**kwargs)
+
+        for text in self.texts(files, lowercase=lowercase):
+            for sent in text.sents:
+                elements = [tuple(token) if element_i is None else token[element_i] for token in sent]
+
+                if n == 1:
+                    sketch.update(elements)
+                else:
+                    sketch.update(tuple(elements[i:i + n]) for i in range(len(elements) - n + 1))
+
+        return sketch
@@ -0,0 +1,147 @@
+"""
+Finding exact and near duplicate texts before a corpus is converted.
+
+Texts are compared by their (token, tag) content, so differences in headers and line breaks don't matter:
+
+    exact duplicates: texts with the same tokens and tags. Only the first is parsed; its tagged text is saved for the
+    others, since it is exactly what parsing them would give.
+    near duplicates: texts whose sets of 5 token shingles have an estimated Jaccard similarity of at least the
+    threshold. They are reported, and the later text of each pair can be skipped.
+
+Near duplicates are estimated with one permutation MinHash: every shingle is hashed once, the hash picks one of
+num_perm bins and every bin keeps its lowest hash. Texts whose signatures are equal in every row of at least one band
+are compared, so only likely pairs are compared and most pairs never are.
+
+Example:
+    >>> c = Corpus('/home/mike/corpora/Mini-CORE_tagd_H')
+    >>> finder = c.find_duplicates()
+    >>> finder.exact_groups()
+    [['/home/mike/corpora/Mini-CORE_tagd_H/a.txt', '/home/mike/corpora/Mini-CORE_tagd_H/copy of a.txt']]
+    >>> finder.near_pairs()
+    [('/home/mike/corpora/Mini-CORE_tagd_H/b.txt', '/home/mike/corpora/Mini-CORE_tagd_H/c.txt', 0.93)]
+"""
+
+import hashlib
+from collections import defaultdict
+
+from errors import CorpusError
+
+# Values of the dedup argument of Corpus().convert()
+dedup_modes = ('exact', 'near', 'skip')
+
+
+def shingle_hash(shingle):
+    """Returns a 64 bit hash of a tuple of token strings."""
+    return int.from_bytes(hashlib.blake2b('\x1f'.join(shingle).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class DuplicateFinder:
+    """
+    Keeps a content hash and a MinHash signature of every text added, in the order they are added.
+
+    Keyword arguments:
+        threshold: estimated Jaccard similarity at or above which two texts are near duplicates
+        num_perm: number of MinHash bins
+        bands: number of bands the signatures are split into to find candidate pairs. num_perm must be a multiple
+        of bands. More bands find more pairs with a similarity below threshold, which are then left out.
+        shingle: number of tokens in a shingle
+        near: if False, only exact duplicates are found
+    """
+
+    def __init__(self, threshold=0.9, num_perm=64, bands=16, shingle=5, near=True):
+        if num_perm % bands:
+            raise CorpusError('num_perm must be a multiple of bands')
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle = shingle
+        self.near = near
+
+        self.names = []
+        # Content hash of every text and the names of the texts with each hash
+        self.hashes = {}
+        self.groups = defaultdict(list)
+        self.signatures = {}
+
+    def add(self, name, sents):
+        """Adds a text. sents is a list of sentences of [token, tag] lists, e.g. Text().sents."""
+        tokens = [token + '_' + tag for sent in sents for token, tag in sent]
+
+        content_hash = hashlib.sha1('\n'.join(tokens).encode('utf-8')).hexdigest()
+        self.names.append(name)
+        self.hashes[name] = content_hash
+        self.groups[content_hash].append(name)
+
+        # Only the first text with some content needs a signature
+        if self.near and len(self.groups[content_hash]) == 1:
+            self.signatures[name] = self.signature(tokens)
+
+    def signature(self, tokens):
+        """Returns the MinHash signature of a list of token strings, with None for empty bins."""
+        num_perm = self.num_perm
+        bins = [None] * num_perm
+        n = max(1, len(tokens) - self.shingle + 1)
+
+        for i in range(n):
+            h = shingle_hash(tokens[i:i + self.shingle])
+            b, value = h % num_perm, h // num_perm
+            if bins[b] is None or value < bins[b]:
+                bins[b] = value
+
+        return tuple(bins)
+
+    @staticmethod
+    def similarity(a, b):
+        """Returns the estimated Jaccard similarity of two signatures, counting only bins that are not empty in both."""
+        used = sum(1 for x, y in zip(a, b) if x is not None or y is not None)
+        same = sum(1 for x, y in zip(a, b) if x is not None and x == y)
+        return same / used if used else 1.0
+
+    def exact_groups(self):
+        """Returns lists of the names of texts with the same content, each in the order they were added."""
+        return [names for names in self.groups.values() if len(names) > 1]
+
+    def duplicate_of(self):
+        """Returns a dict of the name of every exact duplicate and the name of the first text with its content."""
+        return {name: names[0] for names in self.exact_groups() for name in names[1:]}
+
+    def near_pairs(self):
+        """
+        Returns a list of (name, later name, estimated similarity) of near duplicates that are not exact duplicates,
+        in the order the later texts were added.
+        """
+        rows = self.num_perm // self.bands
+        order = {name: i for i, name in enumerate(self.names)}
+        candidates = set()
+
+        for band in range(self.bands):
+            buckets = defaultdict(list)
+            for name, signature in self.signatures.items():
+                key = signature[band * rows:(band + 1) * rows]
+                if any(value is not None for value in key):
+                    buckets[key].append(name)
+
+            for names in buckets.values():
+                for i, a in enumerate(names):
+                    for b in names[i + 1:]:
+                        candidates.add((a, b) if order[a] < order[b] else (b, a))
+
+        pairs = []
+        for a, b in candidates:
+            similarity = self.similarity(self.signatures[a], self.signatures[b])
+            if similarity >= self.threshold:
+                pairs.append((a, b, round(similarity, 4)))
+
+        return sorted(pairs, key=lambda pair: (order[pair[1]], order[pair[0]]))
+
+    def near_duplicates(self):
+        """
+        Returns the set of names of texts that can be skipped: the later text of every near duplicate pair whose
+        earlier text is not skipped itself.
+        """
+        skipped = set()
+        for a, b, similarity in self.near_pairs():
+            if a not in skipped:
+                skipped.add(b)
+        return skipped
@@ -4,11 +4,69 @@ They are not part of the tagger.
 """
 
 from corpus import Corpus
+from collocation import Collocations
+from sketches import FrequencySketch
 from text import Text
-from collections import defaultdict
+from collections import defaultdict, deque, namedtuple
+import gzip
+import io
 import re
 import time
 
+# A token in a Biber tagged file
+#   line_n: index of the line in the file
+#   line: the line without the line break
+#   token: the word
+#   tag: the Biber tag, e.g. 'vpsv++agls+xvbn+' or 'VL++AGLS+++'
+#   fields: the fields of the Biber tag, i.e. tag.split('+')
+#   claws: the CLAWS tag if the file has one, otherwise ''
+BiberToken = namedtuple('BiberToken', ['line_n', 'line', 'token', 'tag', 'fields', 'claws'])
+
+# Characters allowed in Biber tags. Tags with other characters come from encoding errors.
+valid_tag = re.compile("^[a-z0-9.,+\\-!@#$%^&*()_\\[\\]:;\"'<>?`=]*$", re.IGNORECASE)
+
+
+def read_biber_lines(lines, strict=False):
+    """
+    Yields a BiberToken for every token in lines of a Biber tagged text. Empty lines, metadata lines starting with {
+    and lines without a Biber tag are skipped.
+
+    Arguments:
+        lines: iterable of lines, e.g. a file object
+
+    Keyword arguments:
+        strict: if True, tokens whose Biber tag has characters that are not in valid_tag are skipped as well
+    """
+    for line_n, line in enumerate(lines):
+        # Skips metadata
+        if not line or line[0] == '{':
+            continue
+
+        line = line.rstrip('\r\n')
+        parts = line.split(' ^')
+
+        # Makes sure there is really a token tag pair
+        if len(parts) < 2:
+            continue
+
+        tag = parts[1].strip()
+
+        if strict and not valid_tag.match(tag):
+            continue
+
+        yield BiberToken(line_n, line, parts[0], tag, tuple(tag.split('+')), parts[2].strip() if len(parts) > 2 else '')
+
+
+def read_biber_file(file_name, encoding='ascii', errors='ignore', strict=False):
+    """Yields a BiberToken for every token in a Biber tagged file. Files ending in .gz are decompressed."""
+    if file_name.lower().endswith('.gz'):
+        f = gzip.open(file_name, 'rt', encoding=encoding, errors=errors)
+    else:
+        f = open(file_name, encoding=encoding, errors=errors, buffering=1 << 20)
+
+    with f:
+        yield from read_biber_lines(f, strict)
+
 
 class CorpusTester(Corpus):
     """
@@ -36,6 +94,11 @@ class CorpusTester(Corpus):
 
 
 class BiberCorpus(Corpus):
+    """
+    Biber tagged corpus, e.g. the output of Corpus().convert() or the Longman Corpus.
+
+    Every method reads the files with self.tokens() or self.sents(), so lines are only split and checked in one place.
+    """
     nouns = ['nn++++', 'nn+nom+++', 'nvbg+++xvbg+', 'nn+++xvbn+', 'nns++++',
              'nns+nom+++', 'nnu++++', 'np++++', 'nps++++', 'npl++++', 'npt++++', 'npts++++',
              'nr++++', 'nrs++++']
@@ -46,50 +109,72 @@ class BiberCorpus(Corpus):
                 'pp$$++++', 'pn"++++', 'pn++++']
 
 
-    def __init__(self, folder, filter_files=True):
-        super().__init__(folder, encoding_in='ascii')
-
+    def __init__(self, folder, filter_files=True, **kwargs):
         if filter_files:
-            # If using the Longman Corpus, this excludes untagged and old directories
-            self.files = [f for f in self.files if 'Old' not in f and 'Tagd' in f]
-
-    def tagset(self, freqs=False):
-        """Returns a set of tags in a corpus."""
-        all_tags = []
+            # If using the Longman Corpus, this excludes untagged and old directories while they are searched. Files
+            # are kept if their full path has Tagd and not Old in it, so the corpus folder itself is checked as well
+            # as the paths matched by the patterns, which are relative to it.
+            if 'Old' in folder:
+                kwargs.setdefault('exclude', ['*'])
+            elif 'Tagd' in folder:
+                kwargs.setdefault('exclude', ['*Old*'])
+            else:
+                kwargs.setdefault('include', ['*Tagd*'])
+                kwargs.setdefault('exclude', ['*Old*'])
+
+        super().__init__(folder, encoding_in='ascii', **kwargs)
+
+    def file_tokens(self, encoding_errors='ignore', strict=False):
+        """
+        Yields (file name, iterator of the BiberTokens of the file) for every file in the corpus. Files are read as
+        they are used.
 
-        if freqs:
-            freq_dist = defaultdict(int)
+        Keyword arguments:
+            encoding_errors: how encoding errors are handled when reading the files
+            strict: if True, tokens with invalid Biber tags are skipped (see read_biber_lines())
+        """
+        if self.archive is not None:
+            for file_name, raw_text in self.read_texts(encoding=self.encoding_in, errors=encoding_errors):
+                yield file_name, read_biber_lines(io.StringIO(raw_text), strict)
+        else:
+            for file_name in self.iter_files():
+                yield file_name, read_biber_file(file_name, self.encoding_in, encoding_errors, strict)
 
+    def tokens(self, encoding_errors='ignore', strict=False):
+        """Yields (file name, BiberToken) for every token in the corpus."""
+        for file_name, tokens in self.file_tokens(encoding_errors, strict):
+            for token in tokens:
+                yield file_name, token
 
-        for file in self.files:
-            with open(file, encoding=self.encoding_in, errors="ignore") as f:
-                text = f.read().splitlines()
+    def sents(self, encoding_errors='ignore', strict=False):
+        """
+        Yields (file name, list of BiberTokens) for every sentence in the corpus. Sentences end with tokens whose tag
+        contains clp or CLP. The last sentence of a file ends with the file.
+        """
+        for file_name, tokens in self.file_tokens(encoding_errors, strict):
+            sent = []
 
-            text_tags = []
+            for token in tokens:
+                sent.append(token)
 
-            for i, line in enumerate(text):
-                # Skips metadata
-                if not line or line[0] == '{':
-                    continue
+                if 'clp' in token.tag.lower():
+                    yield file_name, sent
+                    sent = []
 
-                line = line.strip().split(' ')
-                # Regexp makes this super slow but couldn't think of a better way to exclude tags with unicode decode errors
-                if len(line) != 2 or line[1][0] != '^' \
-                    or not re.match("^[a-z0-9\.\,\+\-\!\@\#\$\%\^\&\*\(\)\_\[\]\:\;\"\'\<\>\?\`\=]*$", line[1][1:], re.IGNORECASE):
-                    continue
+            if sent:
+                yield file_name, sent
 
-                if freqs:
-                    freq_dist[line[1][1:]] += 1
-                else:
-                    text_tags.append(line[1][1:])
+    def tagset(self, freqs=False):
+        """Returns a set of tags in a corpus, or a dict of their frequencies if freqs is True."""
+        freq_dist = defaultdict(int)
 
-            all_tags += text_tags
-            all_tags = list(set(all_tags))
+        for file_name, token in self.tokens(strict=True):
+            freq_dist[token.tag] += 1
 
         if freqs:
             return freq_dist
         else:
-            return set(all_tags)
+            return set(freq_dist)
 
 
     def word_list(self, tag):
@@ -122,67 +207,67 @@ class BiberCorpus(Corpus):
             . ^.+clp+++ ^.
             I ^ppla+pp1+++ ^PPIS1
 
+        Matches are shown with up to `before` tokens before them and `after` tokens after them.
         """
         if tag[0] == '^':
             tag = tag[1:]
 
+        before = max(before, 0)
         results = []
 
-        for file in self.files:
-            with open(file, encoding=self.encoding_in, errors=encoding_errors) as f:
-                text = f.read().splitlines()
-
-            for i, line in enumerate(text):
-                # Skips metadata
-                if not line or line[0] == '{':
-                    continue
-
-                line = line.split(' ^')
-
-                if len(line) >= 2 and tag == line[1][:len(tag)]:
-                    b_ind = i - before
+        def found(file_name, line_n, lines):
+            if printing:
+                # Adds filename, index of match, and match with surrounding lines
+                print(file_name, line_n, '\n', '\n'.join(lines), sep='\n', end='\n\n--------------------\n\n')
+            else:
+                results.append(lines)
 
-                    if before < 0:
-                        b_ind = 0
+        for file_name, tokens in self.file_tokens(encoding_errors):
+            previous = deque(maxlen=before)
+            # Matches waiting for the tokens after them: [line index, lines, number of lines still needed]
+            waiting = []
 
-                    if printing:
-                        # Adds filename, index of match, and match with surrounding lines
-                        print(file, i, '\n', '\n'.join(text[b_ind:i + 1 + after]), sep='\n',
-                              end='\n\n--------------------\n\n')
-                    else:
-                        results.append(text[b_ind:i + 1 + after])
+            for token in tokens:
+                for match in waiting:
+                    match[1].append(token.line)
+                    match[2] -= 1
 
-        if not printing:
-            return results
+                while waiting and waiting[0][2] == 0:
+                    found(file_name, *waiting.pop(0)[:2])
 
-    def tag_freq(self, token, encoding_errors='ignore'):
-        """Returns conditional frequency distribution of tag based on token"""
-        freq_dist = defaultdict(int)
+                if token.tag.startswith(tag):
+                    waiting.append([token.line_n, list(previous) + [token.line], after])
 
-        for file in self.files:
-            with open(file, encoding=self.encoding_in, errors=encoding_errors) as f:
-                text = f.read().splitlines()
+                    if not after:
+                        found(file_name, *waiting.pop()[:2])
 
-            for i, line in enumerate(text):
-                # Skips metadata
-                if not line or line[0] == '{':
-                    continue
+                previous.append(token.line)
 
-                line = line.split(' ^')
+            for line_n, lines, needed in waiting:
+                found(file_name, line_n, lines)
 
-                # Makes sure there is really a token tag pair
-                if len(line) < 2:
-                    continue
+        if not printing:
+            return results
 
-                w, t = line[0].lower(), line[1].strip()
+    def tag_freq(self, token, encoding_errors='ignore', sketch=None):
+        """
+        Returns conditional frequency distribution of tag based on token. If sketch, a FrequencySketch, is given, the
+        tags are added to it and it is returned instead.
+        """
+        freq_dist = defaultdict(int) if sketch is None else sketch
+        token = token.lower()
 
-                if token.lower() == w.lower():
-                    freq_dist[t] += 1
+        for file_name, biber_token in self.tokens(encoding_errors):
+            if token == biber_token.token.lower():
+                if sketch is None:
+                    freq_dist[biber_token.tag] += 1
+                else:
+                    sketch.add(biber_token.tag)
 
         return freq_dist
 
 
-    def lex_freq(self, *tags, encoding_errors='ignore', partial_tag_keys=False):
+    def lex_freq(self, *tags, encoding_errors='ignore', partial_tag_keys=False, sketch=None):
         """
         Returns conditional frequency distribution of words based on the beginning of * tags.
         
@@ -195,98 +280,90 @@ class BiberCorpus(Corpus):
             *tags: tags to use in the search
         Keyword Arguments:
             encoding: encoding of input files
+            sketch: a FrequencySketch (see sketches.py). If given, (word, tag) pairs are added to it and it is returned
+            instead of a dict of dicts.
         """
         freq_dist = {}
-        tags = list(tags)
-
         # Cleans *tags items
-        for i, tag in enumerate(tags):
-            if tag[0] == '^':
-                tags[i] = tags[1:]
-
-
-        for file in self.files:
-            with open(file, encoding=self.encoding_in, errors=encoding_errors) as f:
-                text = f.read().splitlines()
+        tags = [tag[1:] if tag[0] == '^' else tag for tag in tags]
+
+        for file_name, token in self.tokens(encoding_errors):
+            w, t = token.token.lower(), token.tag
+
+            for tag in tags:
+                if t.startswith(tag):
+
+                    if sketch is not None:
+                        sketch.add((w, tag.strip() if partial_tag_keys else t))
+                    # Adds tag from arg as key
+                    elif partial_tag_keys:
+                        if not freq_dist.get(w, False):
+                            freq_dist[w] = {tg.strip(): 0 for tg in tags}
+                        freq_dist[w][tag.strip()] += 1
+                    # Adds tag from token-tag dyad as key
+                    else:
+                        if not freq_dist.get(w, False):
+                            freq_dist[w] = {t: 0}
+                        elif not freq_dist[w].get(t, False):
+                            freq_dist[w][t] = 0
 
-            for i, line in enumerate(text):
-                # Skips metadata
-                if not line or line[0] == '{':
-                    continue
+                        freq_dist[w][t] += 1
 
-                line = line.split(' ^')
+        return freq_dist if sketch is None else sketch
 
-                # Makes sure there is really a token tag pair
-                if len(line) < 2:
-                    continue
+    def freq_sketch(self, fields=('token', 'tag'), n=1, sketch=None, encoding_errors='ignore', **kwargs):
+        """
+        Returns a FrequencySketch of BiberToken fields or n-grams of them, e.g. (word, CLAWS tag, Biber tag) triples
+        of a corpus too large for lex_freq(). Words are lowercased.
 
-                w, t = line[0].lower(), line[1]
+        >>> bc = BiberCorpus('/home/mike/corpora/Mini-CORE_tagd_H_BTT', filter_files=False)
+        >>> fs = bc.freq_sketch(('token', 'claws', 'tag'))
+        >>> fs.most_common(20), fs.types()
 
-                for tag in tags:
-                    if tag == t[:len(tag)]:
+        Keyword arguments:
+            fields: names of the BiberToken fields in each item. Items are single strings if only one is given.
+            n: length of the n-grams counted. N-grams don't cross sentence boundaries.
+            sketch: FrequencySketch the items are added to. A new one is made with **kwargs if None.
+        """
+        if sketch is None:
+            sketch = FrequencySketch(**kwargs)
 
-                        # Adds tag from arg as key
-                        if partial_tag_keys:
-                            if not freq_dist.get(w, False):
-                                freq_dist[w] = {tg.strip(): 0 for tg in tags}
-                            freq_dist[w][tag.strip()] += 1
-                        # Adds tag from token-tag dyad as key
-                        else:
-                            if not freq_dist.get(w, False):
-                                freq_dist[w] = {t.strip(): 0}
-                            elif not freq_dist[w].get(t.strip(), False):
-                                freq_dist[w][t.strip()] = 0
+        for file_name, sent in self.sents(encoding_errors):
+            items = [tuple(token.token.lower() if field == 'token' else getattr(token, field) for field in fields)
+                     for token in sent]
+            if len(fields) == 1:
+                items = [item[0] for item in items]
 
-                            freq_dist[w][t.strip()] += 1
+            if n == 1:
+                sketch.update(items)
+            else:
+                sketch.update(tuple(items[i:i + n]) for i in range(len(items) - n + 1))
 
-        return freq_dist
+        return sketch
 
 
 
 
     def find_in_sent(self, tags, encoding_errors='ignore'):
-
-        for i, tag in enumerate(tags):
-            if tag[0] == '^':
-                tag[i] = tag[1:]
-
+        """
+        Returns a dict with a list of the sentences containing each tag in tags, as lists of [word, tag] lists, and the
+        number of sentences in the corpus as 'sent_count'.
+        """
+        tags = [tag[1:] if tag[0] == '^' else tag for tag in tags]
         results = {tag: [] for tag in tags}
-        cur_sent = []
-        add_sent = False
-        tag_cat = []
         sent_count = 0
 
-        for file in self.files:
-            with open(file, encoding=self.encoding_in, errors=encoding_errors) as f:
-                text = f.read().splitlines()
-
-            for i, line in enumerate(text):
-                # Skips metadata
-                if not line or line[0] == '{':
-                    continue
+        for file_name, sent in self.sents(encoding_errors):
+            tag_cat = set(token.tag for token in sent if token.tag in results)
 
-                line = line.split(' ^')
+            if tag_cat:
+                cur_sent = [[token.token, token.tag] for token in sent]
+                for tc in tag_cat:
+                    results[tc].append(cur_sent)
 
-                if len(line) < 2:
-                    continue
-
-                w, t = line[0], line[1]
-                cur_sent.append([w, t])
-
-                if t in tags:
-                    add_sent = True
-                    tag_cat.append(t)
-
-                if 'clp' in t:
-                    if add_sent:
-
-                        for tc in set(tag_cat):
-                            results[tc].append(cur_sent)
-
-                    cur_sent = []
-                    tag_cat = []
-                    add_sent = False
-                    sent_count += 1
+            # Only sentences ending in clp are counted
+            if 'clp' in sent[-1].tag.lower():
+                sent_count += 1
 
         results['sent_count'] = sent_count
         return results
@@ -298,16 +375,20 @@ class BiberCorpus(Corpus):
         >>> mc = bc.colloc(['vpsv++agls+xvbn+', 'vpsv++by+xvbn+'], bc.nouns + bc.pronouns)
         >>> pnm = bc.colloc(['vwbn+++xvbn+', 'vwbn+vprv++xvbn+', 'vwbn+vpub++xvbn+', 'vwbn+vsua++xvbn+'], bc.nouns + bc.pronouns)
         """
-        sents = self.find_in_sent(tags)
-        matches = []
-        for tag in tags:
-            matches += sents[tag]
-
         results = {tag: [] for tag in tags}
+        match_to = set(match_to)
+        sent_count = 0
+
+        # Sentences are read one at a time instead of keeping every matching sentence in memory
+        for file_name, biber_sent in self.sents():
+            # Only sentences ending in clp are counted
+            if 'clp' in biber_sent[-1].tag.lower():
+                sent_count += 1
+
+            sent = [(token.token, token.tag) for token in biber_sent]
 
-        for sent in matches:
             for i, (word, tag) in enumerate(sent):
-                if tag in tags:
+                if tag in results:
                     bound = i + within
                     if 0 > bound:
                         bound = 0
@@ -347,10 +428,40 @@ class BiberCorpus(Corpus):
                                        reverse=True,
                                        key=lambda x: x[1])
 
-        results['sent_count'] = sents['sent_count']
+        results['sent_count'] = sent_count
 
         return results
 
+    def collocations(self, tags, left=4, right=4, by='word', match_to=None, encoding_errors='ignore'):
+        """
+        Returns Collocations of the words or tags within left tokens before and right tokens after the tokens with a
+        tag in tags, counted in one pass over the corpus. Call table() on the result for MI, t-scores and
+        log-likelihoods.
+
+        >>> bc = BiberCorpus('/home/mike/corpora/Longman Spoken and Written Corpus (FOR GRAMMAR PROJECT USE ONLY!)')
+        >>> colls = bc.collocations(['vpsv++agls+xvbn+', 'vpsv++by+xvbn+'], right=0, match_to=bc.nouns + bc.pronouns)
+        >>> colls.table(min_freq=10, sort_by='t')[:10]
+
+        Arguments:
+            tags: Biber tags of the nodes
+
+        Keyword arguments:
+            left: size of the window before a node
+            right: size of the window after a node
+            by: 'word' counts lowercased words, 'tag' counts Biber tags
+            match_to: Biber tags of the tokens that can be collocates. Any token can if None.
+        """
+        tags = set(tag[1:] if tag[0] == '^' else tag for tag in tags)
+        key = (lambda token: token.tag) if by == 'tag' else None
+        is_collocate = None
+
+        if match_to is not None:
+            match_to = set(match_to)
+            is_collocate = lambda token: token.tag in match_to
+
+        colls = Collocations(lambda token: token.tag in tags, left, right, key, is_collocate)
+        return colls.add_sents(self.sents(encoding_errors))
+
 
 def txt_to_list(txt_file):
     "Returns the content of a txt file as a list of lists. Each item in a sublist is a token."
@@ -0,0 +1,160 @@
+"""
+Finding the files in a corpus.
+
+Folders are walked lazily with os.scandir() so that files can be used as soon as they are found, and include and
+exclude patterns are applied during the walk so that excluded folders are never opened.
+"""
+
+import json
+from fnmatch import fnmatch
+from os import scandir, remove, replace, path
+
+from errors import CorpusError
+
+# Version of the file list format saved by save_file_list()
+FILE_LIST_VERSION = 1
+
+
+def matches(rel_path, patterns):
+    """Returns True if rel_path or its last part matches any of the glob patterns."""
+    name = rel_path.rsplit('/', 1)[-1]
+    return any(fnmatch(rel_path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+
+def is_included(rel_path, include=None, exclude=None):
+    """
+    Returns True if a file should be in the corpus.
+
+    Arguments:
+        rel_path: path of the file relative to the corpus folder, with / as separator
+
+    Keyword arguments:
+        include: glob patterns. If given, files must match at least one of them.
+        exclude: glob patterns. Files and folders matching any of them are skipped.
+    """
+    if exclude:
+        # Checks the folders the file is in as well as the file
+        parts = rel_path.split('/')
+        for i in range(1, len(parts) + 1):
+            if matches('/'.join(parts[:i]), exclude):
+                return False
+
+    if include and not matches(rel_path, include):
+        return False
+
+    return True
+
+
+def scan_files(folder, include=None, exclude=None, dirs=None):
+    """
+    Yields the paths of files in folder and its subfolders in the same order as os.walk().
+
+    Example:
+        >>> for f in scan_files('/home/mike/corpora/Longman', include=['*.txt'], exclude=['Old']):
+        ...     print(f)
+
+    Arguments:
+        folder: directory to search
+
+    Keyword arguments:
+        include: glob patterns matched against the path relative to folder and the file name. If given, only
+        matching files are yielded.
+        exclude: glob patterns matched against the relative path and the name of files and folders. Matching
+        folders are not searched.
+        dirs: if a list is given, the path of every folder searched is appended to it
+    """
+    def walk(dir_path, rel_dir):
+        if dirs is not None:
+            dirs.append(dir_path)
+
+        sub_dirs = []
+
+        try:
+            entries = list(scandir(dir_path))
+        except OSError:
+            return
+
+        for entry in entries:
+            rel_path = rel_dir + entry.name
+
+            try:
+                is_dir = entry.is_dir()
+                # Like os.walk(), links to folders are neither searched, which could loop, nor yielded as files
+                if is_dir and entry.is_symlink():
+                    continue
+            except OSError:
+                is_dir = False
+
+            if is_dir:
+                if not (exclude and matches(rel_path, exclude)):
+                    sub_dirs.append((path.join(dir_path, entry.name), rel_path + '/'))
+            elif not (exclude and matches(rel_path, exclude)) and (not include or matches(rel_path, include)):
+                yield path.join(dir_path, entry.name)
+
+        for sub_dir in sub_dirs:
+            yield from walk(*sub_dir)
+
+    yield from walk(folder, '')
+
+
+def save_file_list(list_file, folder, files, include=None, exclude=None):
+    """
+    Saves the files found in folder so that they don't need to be searched for again. Files are saved as they are
+    yielded, and the list is only put in place once every file has been found. If the caller stops before the end,
+    e.g. because of stop_at or an exception, no list is saved.
+
+    Yields every item in files.
+
+    Arguments:
+        list_file: path of the file list
+        folder: corpus folder the files were found in
+        files: iterable of file paths
+
+    Keyword arguments:
+        include: include patterns used to find the files
+        exclude: exclude patterns used to find the files
+    """
+    header = {'version': FILE_LIST_VERSION, 'folder': folder, 'include': include, 'exclude': exclude}
+    tmp_file = list_file + '.tmp'
+
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(header) + '\n')
+
+            for file_name in files:
+                f.write(file_name[len(folder) + 1:] + '\n')
+                yield file_name
+
+        replace(tmp_file, list_file)
+    finally:
+        if path.exists(tmp_file):
+            remove(tmp_file)
+
+
+def load_file_list(list_file, folder, include=None, exclude=None):
+    """
+    Yields the file paths saved by save_file_list(). Raises CorpusError if the list was made for another folder or
+    with other patterns.
+    """
+    with open(list_file, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+
+        if header != {'version': FILE_LIST_VERSION, 'folder': folder, 'include': include, 'exclude': exclude}:
+            raise CorpusError('File list {0} was not made for {1} with these patterns'.format(list_file, folder))
+
+        for line in f:
+            yield path.join(folder, line.rstrip('\n'))
+
+
+def file_list_matches(list_file, folder, include=None, exclude=None):
+    """Returns True if list_file exists and was saved for folder with the same patterns."""
+    if not path.isfile(list_file):
+        return False
+
+    with open(list_file, encoding='utf-8') as f:
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            return False
+
+    return header == {'version': FILE_LIST_VERSION, 'folder': folder, 'include': include, 'exclude': exclude}
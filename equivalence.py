@@ -0,0 +1,451 @@
+"""
+Checking that another engine tags texts exactly like Text().parse().
+
+A faster way of parsing texts, e.g. a Text subclass with fused parsers or a cache, must give the same Biber tags as the
+reference parser for every token. compare() parses every text of a corpus with both, compares the tags token by token
+and times both engines in the same run. The texts are split between worker processes, and every worker parses each of
+its texts with both engines, so both are timed on the same machine under the same load. Which engine goes first is
+switched from one text to the next, so neither always runs with warmer caches.
+
+An engine is one of:
+
+    a Text subclass, whose parse() is compared
+    a function called as engine(file_name, raw_text, **kwargs) that returns sentences in the format of Text().parse()
+    a string 'module:name' naming either of these, which is how engines are given on the command line
+
+Engines given to worker processes must be importable, i.e. defined at the top level of a module.
+
+Texts can also be generated from a corpus with generate_texts(). Generated sentences follow the CLAWS tag bigrams of
+the corpus with words seen with each tag, so they put words and tags together in ways the corpus doesn't, which finds
+divergences that natural texts only show rarely.
+
+How to use:
+
+    python3 equivalence.py /corpora/Minicore fast_text:FastText --workers 8
+    python3 equivalence.py /corpora/Minicore fast_text:FastText --generate 500 --seed 1 --save Minicore-fast.json
+
+The exit status is 1 if any token was tagged differently.
+
+Example:
+    >>> c = Corpus('/home/mike/corpora/Mini-CORE_tagd_H')
+    >>> result = compare(c.read_texts(), 'fast_text:FastText', workers=4)
+    >>> result.identical()
+    True
+    >>> result.summary()['speedup']
+"""
+
+import argparse
+import importlib
+import json
+import random
+import sys
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from os import replace
+from time import perf_counter
+
+from errors import CorpusError
+from text import Text
+
+
+def load_engine(engine):
+    """Returns the engine named by a string like 'module:name', or engine itself if it isn't a string."""
+    if not isinstance(engine, str):
+        return engine
+
+    module_name, _, name = engine.partition(':')
+    if not module_name or not name:
+        raise CorpusError("Engines must be given as 'module:name', not {0!r}".format(engine))
+
+    try:
+        return getattr(importlib.import_module(module_name), name)
+    except (ImportError, AttributeError) as e:
+        raise CorpusError('Could not load engine {0!r}: {1}'.format(engine, e))
+
+
+def run_engine(engine, file_name, raw_text, kwargs):
+    """Returns the sentences of raw_text parsed by engine and the seconds it took."""
+    engine = load_engine(engine)
+    t = perf_counter()
+
+    if isinstance(engine, type) and issubclass(engine, Text):
+        parsed_sents = engine(file_name, text=raw_text, **kwargs).parse()
+    else:
+        parsed_sents = engine(file_name, raw_text, **kwargs)
+
+    return parsed_sents, perf_counter() - t
+
+
+def token_string(token):
+    """Returns a parsed token as 'word_TAG'."""
+    return '{0}_{1}'.format(token[0], token[1])
+
+
+def diff_parsed(file_name, reference, parsed, context=5, max_divergences=10):
+    """
+    Compares the Biber tags of two lists of parsed sentences token by token. Returns (number of tokens tagged
+    differently, Counter of the Biber tag fields that differ, list of at most max_divergences divergences).
+
+    Each divergence is a dict with the file, the sentence and token numbers, the word and CLAWS tag, the Biber tags of
+    both engines, the numbers of the fields that differ, and context tokens before and after it. If the sentences or
+    tokens themselves differ, the tags after that point can't be lined up, so a divergence of kind 'tokens' is
+    returned and the rest of the text is not compared.
+    """
+    divergence_n = 0
+    field_counts = Counter()
+    divergences = []
+
+    def tokens_divergence(sent_i, token_i, message):
+        sent = reference[sent_i] if sent_i < len(reference) else []
+        return {'kind': 'tokens', 'file': file_name, 'sent': sent_i, 'token': token_i, 'message': message,
+                'left': [token_string(token) for token in sent[max(0, token_i - context):token_i]],
+                'right': [token_string(token) for token in sent[token_i:token_i + context + 1]]}
+
+    if len(reference) != len(parsed):
+        return 1, field_counts, [tokens_divergence(min(len(reference), len(parsed)), 0, '{0} sentences, not {1}'.format(
+            len(parsed), len(reference)))]
+
+    for sent_i, (ref_sent, sent) in enumerate(zip(reference, parsed)):
+        for token_i, (ref_token, token) in enumerate(zip(ref_sent, sent)):
+            if ref_token[0] != token[0] or ref_token[1] != token[1]:
+                divergences.append(tokens_divergence(sent_i, token_i, '{0} instead of {1}'.format(
+                    token_string(token), token_string(ref_token))))
+                return divergence_n + 1, field_counts, divergences[:max_divergences]
+
+            ref_tag, tag = ref_token[2], token[2]
+            if list(ref_tag) == list(tag):
+                continue
+
+            fields = [i for i, (a, b) in enumerate(zip(ref_tag, tag)) if a != b]
+            if len(ref_tag) != len(tag):
+                fields.append(min(len(ref_tag), len(tag)))
+
+            divergence_n += 1
+            field_counts.update(fields)
+
+            if len(divergences) < max_divergences:
+                divergences.append({
+                    'kind': 'tags', 'file': file_name, 'sent': sent_i, 'token': token_i,
+                    'word': ref_token[0], 'tag': ref_token[1],
+                    'reference': '+'.join(ref_tag), 'engine': '+'.join(tag), 'fields': fields,
+                    'left': [token_string(t) for t in ref_sent[max(0, token_i - context):token_i]],
+                    'right': [token_string(t) for t in ref_sent[token_i + 1:token_i + context + 1]],
+                })
+
+        if len(ref_sent) != len(sent):
+            token_i = min(len(ref_sent), len(sent))
+            divergences.append(tokens_divergence(sent_i, token_i, '{0} tokens in the sentence, not {1}'.format(
+                len(sent), len(ref_sent))))
+            return divergence_n + 1, field_counts, divergences[:max_divergences]
+
+    return divergence_n, field_counts, divergences
+
+
+def compare_text(file_name, raw_text, reference, engine, reference_kwargs, engine_kwargs, context=5,
+                 max_divergences=10, engine_first=False):
+    """
+    Parses a text with both engines and returns a dict of the time each took and how their tags differ. Defined at
+    module level so that it can be sent to worker processes.
+    """
+    result = {'file': file_name, 'tokens': 0, 'reference_seconds': 0.0, 'engine_seconds': 0.0,
+              'divergence_count': 0, 'field_counts': {}, 'divergences': []}
+    runs = [('reference', reference, reference_kwargs), ('engine', engine, engine_kwargs)]
+    if engine_first:
+        runs.reverse()
+
+    parsed = {}
+    for name, run, kwargs in runs:
+        try:
+            parsed[name], result[name + '_seconds'] = run_engine(run, file_name, raw_text, kwargs)
+        except Exception as e:
+            result['divergences'] = [{'kind': 'error', 'file': file_name, 'engine': name,
+                                      'message': '{0}: {1}'.format(type(e).__name__, e)}]
+            return result
+
+    result['tokens'] = sum(len(sent) for sent in parsed['reference'])
+    divergence_n, field_counts, divergences = diff_parsed(file_name, parsed['reference'], parsed['engine'], context,
+                                                          max_divergences)
+    result['divergence_count'] = divergence_n
+    result['field_counts'] = dict(field_counts)
+    result['divergences'] = divergences
+    return result
+
+
+def format_divergence(divergence):
+    """Returns a divergence as a line of text for people to read."""
+    if divergence['kind'] == 'error':
+        return '{file}: the {engine} raised {message}'.format(**divergence)
+
+    where = '{file} sentence {sent} token {token}'.format(**divergence)
+
+    if divergence['kind'] == 'tokens':
+        context = ' '.join(divergence['left'] + ['[['] + divergence['right'])
+        return '{0}: {1}\n    {2}'.format(where, divergence['message'], context)
+
+    token = '{word}_{tag}'.format(**divergence)
+    context = ' '.join(divergence['left'] + ['[[', token, ']]'] + divergence['right'])
+    return '{0}: {1} ^{2} (reference) != ^{3} (engine), fields {4}\n    {5}'.format(
+        where, token, divergence['reference'], divergence['engine'], ', '.join(map(str, divergence['fields'])),
+        context)
+
+
+class Comparison:
+    """
+    Results of comparing an engine with the reference parser on a number of texts, added in corpus order.
+
+    Keyword arguments:
+        max_divergences: number of divergences kept, from the start of the corpus
+    """
+
+    def __init__(self, max_divergences=20):
+        self.max_divergences = max_divergences
+        self.texts = 0
+        self.tokens = 0
+        self.divergent_texts = 0
+        self.divergence_count = 0
+        self.errors = 0
+        self.field_counts = Counter()
+        self.divergences = []
+        self.seconds = defaultdict(float)
+        # Seconds taken by each engine per text, to find the texts an engine is slowest on compared to the other
+        self.text_seconds = []
+
+    def add(self, result):
+        """Adds a dict returned by compare_text()."""
+        self.texts += 1
+        self.tokens += result['tokens']
+        self.seconds['reference'] += result['reference_seconds']
+        self.seconds['engine'] += result['engine_seconds']
+        self.text_seconds.append((result['file'], result['reference_seconds'], result['engine_seconds']))
+
+        if result['divergences']:
+            self.divergent_texts += 1
+            self.divergence_count += result['divergence_count']
+            self.errors += sum(1 for divergence in result['divergences'] if divergence['kind'] == 'error')
+            self.field_counts.update(result['field_counts'])
+            self.divergences.extend(result['divergences'][:self.max_divergences - len(self.divergences)])
+
+    def identical(self):
+        """Returns True if both engines tagged every token of every text the same, without errors."""
+        return self.divergence_count == 0 and self.errors == 0
+
+    def slowest_texts(self, n=5):
+        """Returns (file, reference seconds, engine seconds) of the n texts with the lowest speedup."""
+        return sorted(self.text_seconds, key=lambda item: item[1] / max(item[2], 1e-9))[:n]
+
+    def summary(self):
+        """Returns the results as a dict."""
+        reference, engine = self.seconds['reference'], self.seconds['engine']
+        return {
+            'texts': self.texts,
+            'tokens': self.tokens,
+            'identical': self.identical(),
+            'divergent_texts': self.divergent_texts,
+            'divergence_count': self.divergence_count,
+            'errors': self.errors,
+            'field_counts': {str(field): n for field, n in sorted(self.field_counts.items())},
+            'reference_seconds': reference,
+            'engine_seconds': engine,
+            'reference_tokens_per_second': self.tokens / reference if reference else 0.0,
+            'engine_tokens_per_second': self.tokens / engine if engine else 0.0,
+            'speedup': reference / engine if engine else 0.0,
+            'slowest_texts': [{'file': file_name, 'reference_seconds': r, 'engine_seconds': e}
+                              for file_name, r, e in self.slowest_texts()],
+            'divergences': self.divergences,
+        }
+
+    def save(self, file_name):
+        """Saves the summary as JSON. The file is replaced in one step."""
+        tmp_file = file_name + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=1)
+        replace(tmp_file, file_name)
+
+    def print_report(self, file=sys.stdout):
+        """Prints the timings and the first divergences."""
+        summary = self.summary()
+        print('Compared', summary['texts'], 'texts with', summary['tokens'], 'tokens', file=file)
+        print('Reference: {0:.2f} seconds, {1:.0f} tokens per second'.format(
+            summary['reference_seconds'], summary['reference_tokens_per_second']), file=file)
+        print('Engine:    {0:.2f} seconds, {1:.0f} tokens per second ({2:.2f}x)'.format(
+            summary['engine_seconds'], summary['engine_tokens_per_second'], summary['speedup']), file=file)
+
+        if self.identical():
+            print('Identical output', file=file)
+            return
+
+        if summary['divergence_count']:
+            print(summary['divergence_count'], 'tokens tagged differently in', summary['divergent_texts'] -
+                  summary['errors'], 'texts', file=file)
+        if summary['errors']:
+            print(summary['errors'], 'texts could not be parsed by both engines', file=file)
+        if self.field_counts:
+            print('Divergent fields:', ', '.join('{0}: {1}'.format(field, n)
+                                                 for field, n in summary['field_counts'].items()), file=file)
+        for divergence in self.divergences:
+            print(format_divergence(divergence), file=file)
+
+
+def compare(texts, engine, reference=Text, workers=1, reference_kwargs=None, engine_kwargs=None, context=5,
+            max_divergences=20, stop_after=None):
+    """
+    Parses texts with engine and the reference parser, and returns a Comparison of their tags and timings.
+
+    Arguments:
+        texts: iterable of (file name, CLAWS tagged text), e.g. Corpus().read_texts() or generate_texts()
+        engine: engine compared with the reference (see the top of this module)
+
+    Keyword arguments:
+        reference: engine whose tags are taken to be right
+        workers: number of processes parsing texts. Texts are parsed in this process if 1.
+        reference_kwargs: passed to the reference, e.g. parsers or max_sent_length for a Text subclass
+        engine_kwargs: passed to engine. Same as reference_kwargs if None.
+        context: number of tokens shown before and after every divergence
+        max_divergences: number of divergences kept, from the start of the corpus
+        stop_after: stops once this many tokens were tagged differently
+    """
+    reference_kwargs = reference_kwargs or {}
+    engine_kwargs = reference_kwargs if engine_kwargs is None else engine_kwargs
+    comparison = Comparison(max_divergences)
+
+    # Engines are loaded here so that a wrong name is found before any text is parsed
+    load_engine(reference)
+    load_engine(engine)
+
+    def jobs():
+        for i, (file_name, raw_text) in enumerate(texts):
+            yield (file_name, raw_text, reference, engine, reference_kwargs, engine_kwargs, context,
+                   max_divergences, i % 2 == 1)
+
+    def stop():
+        return stop_after is not None and comparison.divergence_count >= stop_after
+
+    if workers <= 1:
+        for job in jobs():
+            comparison.add(compare_text(*job))
+            if stop():
+                break
+        return comparison
+
+    # Results are added in corpus order, so the divergences kept are the first ones
+    in_flight = deque()
+    with ProcessPoolExecutor(workers) as executor:
+        for job in jobs():
+            if len(in_flight) >= 2 * workers:
+                comparison.add(in_flight.popleft().result())
+                if stop():
+                    break
+            in_flight.append(executor.submit(compare_text, *job))
+
+        for future in in_flight:
+            if stop():
+                future.cancel()
+            else:
+                comparison.add(future.result())
+
+    return comparison
+
+
+def generate_texts(texts, n_texts=100, sents_per_text=50, max_sent_length=60, sample_texts=200, seed=None):
+    """
+    Yields (file name, CLAWS tagged text) of n_texts texts made up from the CLAWS tag bigrams of texts and the words
+    seen with each tag.
+
+    Arguments:
+        texts: iterable of (file name, CLAWS tagged text), e.g. Corpus().read_texts()
+
+    Keyword arguments:
+        n_texts: number of texts made
+        sents_per_text: number of sentences in every text
+        max_sent_length: largest number of tokens in a sentence
+        sample_texts: number of texts of the corpus the bigrams are counted in
+        seed: seed of the random texts
+    """
+    rng = random.Random(seed)
+    transitions = defaultdict(Counter)
+    words = defaultdict(Counter)
+
+    for i, (file_name, raw_text) in enumerate(texts):
+        if i == sample_texts:
+            break
+        for sent in Text(file_name, text=raw_text).sents:
+            previous = '<s>'
+            for word, tag in sent:
+                transitions[previous][tag] += 1
+                words[tag][word] += 1
+                previous = tag
+            transitions[previous]['</s>'] += 1
+
+    if not transitions:
+        raise CorpusError('Texts can only be generated from a corpus with tagged sentences')
+
+    # Lists for random.choices()
+    transitions = {tag: (list(counts), list(counts.values())) for tag, counts in transitions.items()}
+    words = {tag: (list(counts), list(counts.values())) for tag, counts in words.items()}
+
+    for text_i in range(n_texts):
+        lines = []
+        for sent_i in range(sents_per_text):
+            tokens = []
+            tag = '<s>'
+            while len(tokens) < max_sent_length:
+                tags, weights = transitions.get(tag, ((), ()))
+                if not tags:
+                    break
+                tag = rng.choices(tags, weights)[0]
+                if tag == '</s>':
+                    break
+                word_list, word_weights = words[tag]
+                tokens.append('{0}_{1}'.format(rng.choices(word_list, word_weights)[0], tag))
+            lines.append('<s> ' + ' '.join(tokens) + ' </s>')
+
+        yield 'generated-{0:05d}.txt'.format(text_i + 1), '\n'.join(lines) + '\n'
+
+
+if __name__ == '__main__':
+    from corpus import Corpus
+
+    parser = argparse.ArgumentParser(description='Checks that an engine tags a corpus exactly like Text().parse().')
+    parser.add_argument('folder')
+    parser.add_argument('engine', help="engine compared with the reference, as 'module:name'")
+    parser.add_argument('--reference', dest='reference', default=None,
+                        help="engine whose tags are taken to be right, as 'module:name'. Text if not given.")
+    parser.add_argument('--workers', dest='workers', default=1, type=int)
+    parser.add_argument('--parsers', dest='parsers', nargs='+', default=None)
+    parser.add_argument('--disable', dest='disabled_parsers', nargs='+', default=())
+    parser.add_argument('--max-sent-length', dest='max_sent_length', default=1000, type=int)
+    parser.add_argument('--stop-at', dest='stop_at', default=None, type=int, help='largest number of texts compared')
+    parser.add_argument('--generate', dest='generate', default=None, type=int,
+                        help='compares this many texts generated from the corpus instead of the corpus')
+    parser.add_argument('--seed', dest='seed', default=None, type=int)
+    parser.add_argument('--context', dest='context', default=5, type=int)
+    parser.add_argument('--max-divergences', dest='max_divergences', default=20, type=int)
+    parser.add_argument('--stop-after', dest='stop_after', default=None, type=int)
+    parser.add_argument('--save', dest='save', default=None, help='saves the results as JSON')
+
+    args = parser.parse_args()
+
+    texts = Corpus(args.folder).read_texts()
+    if args.generate:
+        texts = generate_texts(texts, n_texts=args.generate, seed=args.seed)
+    if args.stop_at is not None:
+        texts = islice(texts, args.stop_at)
+
+    text_kwargs = {'parsers': args.parsers, 'disabled_parsers': args.disabled_parsers,
+                   'max_sent_length': args.max_sent_length}
+
+    try:
+        result = compare(texts, args.engine, reference=args.reference or Text, workers=args.workers,
+                         reference_kwargs=text_kwargs, context=args.context, max_divergences=args.max_divergences,
+                         stop_after=args.stop_after)
+    except CorpusError as e:
+        sys.exit(str(e))
+
+    result.print_report()
+
+    if args.save:
+        result.save(args.save)
+        print('Saved', args.save)
+
+    sys.exit(0 if result.identical() else 1)
@@ -0,0 +1,60 @@
+"""
+Biber features counted by Text.feature_counts() and Corpus.count_features().
+
+A token counts as an instance of a feature if all the Biber tag fields in the feature's value match.
+
+Format:
+
+    feature_name:  ( (biber_tag, biber_tag_index), ...)
+
+NOTE: Define a single-item tuple like this: (('NOM', 3),) and NOT like this (('NOM', 3))
+
+Multi-word features (e.g. have to) are tagged on every word, so each word is counted.
+"""
+
+features = {
+
+    ### PASSIVES ###
+
+    'agentless_passive': (('VL', 0), ('AGLS', 2)),                      # VL++AGLS+++
+    'by_passive': (('VL', 0), ('BY', 2)),                               # VL++BY+++
+    'passive_post_nominal_modifier': (('VL', 0), ('PNM', 3)),           # VL+++PNM++
+
+    ### MODALS ###
+
+    'necessity_modal': (('VM', 0), ('NEC', 2)),                         # VM++NEC+++
+    'possibility_modal': (('VM', 0), ('POS', 2)),                       # VM++POS+++
+    'prediction_modal': (('VM', 0), ('PRD', 2)),                        # VM++PRD+++
+    'necessity_modal_multi': (('VM', 0), ('NEC', 1), ('MULTI', 4)),     # VM+NEC+++MULTI+
+    'possibility_modal_multi': (('VM', 0), ('POS', 1), ('MULTI', 4)),   # VM+POS+++MULTI+
+    'prediction_modal_multi': (('VM', 0), ('PRD', 1), ('MULTI', 4)),    # VM+PRD+++MULTI+
+
+    ### NOUNS ###
+
+    'nominalization': (('NOM', 3),),                                    # +++NOM++
+    'proper_noun': (('nps', 0),),                                       # nps+++++
+
+    ### EXTRAPOSITION ###
+
+    'extraposed_it': (('P', 0), ('IM', 1), ('EXT', 4)),                 # P+IM++3+EXT+
+    'extraposed_that_clause': (('THT', 1), ('EXT', 4)),                 # +THT++CLS+EXT+
+    'extraposed_wh_clause': (('WH', 1), ('CLS', 3), ('EXT', 4)),        # D+WH++CLS+EXT+
+    'extraposed_to_clause': (('TO', 0), ('EXT', 4)),                    # TO++++EXT+
+
+    ### VERBS AND ADVERBS ###
+
+    'phrasal_verb': (('rb', 0), ('phrv', 1)),                           # rb+phrv++++
+    'split_adverb': (('R', 0), ('SPLT', 3)),                            # R+++SPLT++
+
+    ### CONJUNCTIONS ###
+
+    'coordinating_conjunction': (('C', 0), ('C', 1)),                   # C+C++++
+    'phrasal_coordination': (('C', 0), ('C', 1), ('PHRS', 2)),          # C+C+PHRS+++
+    'clausal_coordination': (('C', 0), ('C', 1), ('CLS', 2)),           # C+C+CLS+++
+    'adversative_conjunction': (('C', 0), ('C', 1), ('ADVS', 3)),       # C+C++ADVS++
+    'subordinating_conjunction': (('C', 0), ('S', 1)),                  # C+S++++
+    'causative_subordinator': (('C', 0), ('S', 1), ('CAUS', 2)),        # C+S+CAUS+++
+    'conditional_subordinator': (('C', 0), ('S', 1), ('CND', 2)),       # C+S+CND+++
+    'concessive_subordinator': (('C', 0), ('S', 1), ('CONC', 2)),       # C+S+CONC+++
+
+}
@@ -113,6 +113,21 @@ lexicon = {
                                          ['on', 'condition', 'that'], ['provided', 'that'], ['except', 'that'],
                                          ['in', 'that'], ['in', 'order', 'that'], ['so', 'that'], ['such', 'that'],
                                          ['as', 'if'], ['as', 'though'], ['even', 'if'], ['even', 'though']],
+    # single-word subordinating and coordinating conjunction classes used by Text.conjunction_types()
+    'adversative_conjunctions': {'but', 'yet', 'nor'},
+    'causative_subordinators': {'because', 'cuz', 'cos', 'cause'},
+    'conditional_subordinators': {'unless', 'if'},
+    'wh_subordinators': {'what', 'how', 'whether', 'whoever', 'where', 'wherein', 'when', 'why', 'whomever',
+                         'whichever', 'wherever', 'whenever', 'whatever'},
+    'concessive_subordinators': {'although', 'though', 'while'},
+
+    # words after a comma and a coordinator that mark clausal coordination
+    'clausal_coordination_subjects': {'it', 'so', 'then', 'you', 'there', 'this', 'these', 'those', 'that', 'i', 'we',
+                                      'he', 'she', 'they'},
+
+    # forms of get that can be the auxiliary verb in a passive
+    'get_passive_verbs': {'get', 'gets', 'got', 'gotten'},
+
     # noun types
     'noun_types': {
         'communication': {'announcement', 'announcements', 'comment', 'comments', 'declaration', 'declarations',
@@ -0,0 +1,157 @@
+"""
+Precompiled lexicon and rule tables used by Text.
+
+The lexicon, the lexicon index, the match dicts and the feature definitions are saved in one marshal file the first
+time they are needed. Later processes, including every worker of a process pool, load that file instead of
+evaluating lexicon.py and compiling the index again. The file stores a hash of the source modules and is rebuilt
+whenever one of them changes.
+
+marshal is used instead of pickle because it is built into the interpreter and the tables only hold dicts, sets,
+lists, tuples, strings and integers.
+
+Build the file and benchmark it from the command line:
+
+    python3 lexicon_cache.py build
+    python3 lexicon_cache.py benchmark
+"""
+
+import hashlib
+import marshal
+import sys
+from os import path, makedirs, replace, getpid
+
+# Changes whenever the format of the tables changes. marshal files can only be read by the Python version that wrote
+# them, so the Python version is part of it.
+TABLES_VERSION = '1-' + sys.version.split()[0]
+
+# Modules the tables are made from
+source_modules = ('lexicon', 'lexicon_index', 'tag_match', 'token_match', 'token_tag_match', 'claws_replacements',
+                  'features')
+
+here = path.dirname(path.abspath(__file__))
+default_file = path.join(here, '__pycache__', 'tagger_tables.marshal')
+
+
+def source_hash():
+    """Returns a hash of the source files of source_modules."""
+    h = hashlib.sha256()
+    for module in source_modules:
+        with open(path.join(here, module + '.py'), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def build_tables():
+    """Imports source_modules and returns the dict of tables used by Text."""
+    import lexicon
+    import lexicon_index
+    import tag_match
+    import token_match
+    import token_tag_match
+    import claws_replacements
+    import features
+
+    return {
+        'version': TABLES_VERSION,
+        'hash': source_hash(),
+        'lexicon': lexicon.lexicon,
+        'lexicon_bits': lexicon_index.bits,
+        'lexicon_index': lexicon_index.index,
+        'tag_match': tag_match.tag_match,
+        'token_match': token_match.token_match,
+        'token_tag_match': token_tag_match.token_tag_match,
+        'claws_replacements': claws_replacements.replacements,
+        'features': features.features,
+    }
+
+
+def save(tables, file_name=default_file):
+    """Saves tables as file_name. The file is replaced in one step so that other processes never read half of it."""
+    makedirs(path.dirname(file_name), exist_ok=True)
+    tmp_file = '{0}.{1}.tmp'.format(file_name, getpid())
+
+    with open(tmp_file, 'wb') as f:
+        marshal.dump(tables, f)
+
+    replace(tmp_file, file_name)
+
+
+def load(file_name=default_file):
+    """
+    Returns the tables saved in file_name. If the file is missing, was made by another version of this module or
+    from other source files, the tables are built from the source modules and saved again.
+    """
+    current_hash = source_hash()
+
+    try:
+        with open(file_name, 'rb') as f:
+            tables = marshal.loads(f.read())
+        if tables.get('version') == TABLES_VERSION and tables.get('hash') == current_hash:
+            return tables
+    except (OSError, EOFError, ValueError, TypeError, AttributeError):
+        pass
+
+    tables = build_tables()
+
+    try:
+        save(tables, file_name)
+    except OSError:
+        # The tables still work if they can't be saved, e.g. on a read-only file system
+        pass
+
+    return tables
+
+
+def _spawn_worker():
+    """Imports text in a new worker process and tags a sentence."""
+    from text import Text
+    return len(Text('', text='<s> It_PPH1 was_VBDZ written_VVN ._. </s>').parse())
+
+
+def benchmark(runs=5):
+    """
+    Prints how long it takes to (a) build the tables from the source modules, (b) load the saved tables, (c) import
+    text.py, and (d) start a spawned worker process that imports text.py and tags a sentence. Every measurement is
+    made in a new process and the fastest of runs is printed.
+    """
+    import subprocess
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+
+    save(build_tables())
+
+    def fastest(code):
+        times = []
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, '-c', code], cwd=here, capture_output=True, text=True, check=True)
+            times.append(float(out.stdout))
+        return min(times)
+
+    timer = 'import time; t = time.perf_counter(); {0}; print(time.perf_counter() - t)'
+    results = [
+        ('build tables from lexicon.py', fastest(timer.format('import lexicon_cache; lexicon_cache.build_tables()'))),
+        ('load saved tables', fastest(timer.format('import lexicon_cache; lexicon_cache.load()'))),
+        ('import text', fastest(timer.format('import text'))),
+    ]
+
+    spawn_times = []
+    for _ in range(runs):
+        t = time.perf_counter()
+        with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as executor:
+            executor.submit(_spawn_worker).result()
+        spawn_times.append(time.perf_counter() - t)
+    results.append(('spawn worker and tag a sentence', min(spawn_times)))
+
+    for name, seconds in results:
+        print('{0:<35}{1:>10.2f} ms'.format(name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark':
+        benchmark()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'build':
+        save(build_tables())
+        print('Saved', default_file)
+    else:
+        print('Usage: python3 lexicon_cache.py build|benchmark')
@@ -0,0 +1,73 @@
+"""
+Compiles lexicon.py into one dict mapping lowercase words to an integer bitmask of the lexicon categories they are in.
+
+Each category gets one bit:
+
+    - sets of words, e.g. 'extraposing_verbs'
+    - subcategories of dicts, named with a dot, e.g. 'verb_types.communication'
+    - one-word items of lists of word lists, e.g. 'necessity_modals' for must and should
+    - first words of multi-word items, named with '.first', e.g. 'necessity_modals.first' for have (to)
+
+Example:
+    >>> import lexicon_index as lxi
+    >>> bool(lxi.lookup('Seems') & lxi.bits['extraposing_verbs'])
+    True
+"""
+
+import lexicon as lx
+
+# Categories in lexicon.py that are not sets of words
+not_indexed = {'nominalization_suffices'}
+
+
+def compile_index(lexicon):
+    """Returns (bits, index) for a lexicon dict in the format of lexicon.py."""
+    bits = {}
+    index = {}
+
+    def bit(category):
+        if category not in bits:
+            bits[category] = 1 << len(bits)
+        return bits[category]
+
+    def add(word, category):
+        word = word.lower()
+        index[word] = index.get(word, 0) | bit(category)
+
+    def add_entries(category, entries):
+        for entry in entries:
+            if isinstance(entry, str):
+                add(entry, category)
+            elif len(entry) == 1:
+                add(entry[0], category)
+            # Items like (('turn', 'turns', 'turned', 'turning'), 'out') have alternatives for their first word
+            elif isinstance(entry[0], str):
+                add(entry[0], category + '.first')
+            else:
+                for word in entry[0]:
+                    add(word, category + '.first')
+
+    for category, entries in lexicon.items():
+        if category in not_indexed:
+            continue
+
+        if isinstance(entries, dict):
+            for subcategory, sub_entries in entries.items():
+                add_entries(category + '.' + subcategory, sub_entries)
+        else:
+            add_entries(category, entries)
+
+    return bits, index
+
+
+bits, index = compile_index(lx.lexicon)
+
+
+def lookup(word):
+    """Returns the bitmask of lexicon categories word is in."""
+    return index.get(word.lower(), 0)
+
+
+def categories(mask):
+    """Returns the names of the lexicon categories in mask."""
+    return [category for category, bit in bits.items() if mask & bit]
@@ -0,0 +1,449 @@
+"""
+Pipelined conversion of CLAWS tagged texts to Biber tagged texts.
+
+Used by Corpus.convert() when prefetch or workers is set. Reading, parsing and writing are done in separate stages
+connected by bounded queues, so parsing keeps going while files are being read from or written to slow storage.
+"""
+
+from collections import deque, Counter
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue, Empty, Full
+from threading import Thread, Lock, Event
+from time import perf_counter
+
+from text import Text
+from archive import read_text_file
+from resources import MemoryScheduler
+from shards import file_size
+from errors import CorpusError
+
+# Put in a queue by a stage when it has no more items
+_DONE = object()
+
+
+def tag_text(file_name, raw_text, text_kwargs, tagged_text_kwargs):
+    """
+    Returns raw_text with Biber tags added, Text().long_sent_counts and the stats of the text (see text_stats()).
+    Defined at module level so that it can be sent to worker processes.
+    """
+    t, hits, misses = perf_counter(), Text.type_cache.hits, Text.type_cache.misses
+    text = Text(file_name, text=raw_text, **text_kwargs)
+    tagged = text.tagged_text(**tagged_text_kwargs)
+    return tagged, text.long_sent_counts, text_stats(text, len(raw_text), perf_counter() - t, hits, misses)
+
+
+def tag_sents(file_name, raw_sents, text_kwargs, keep_claws):
+    """
+    Returns the sentence strings raw_sents with Biber tags added, without a header, Text().long_sent_counts and the
+    stats of the chunk. Used to parse chunks of the sentences of large texts in worker processes.
+    """
+    t, hits, misses = perf_counter(), Text.type_cache.hits, Text.type_cache.misses
+    text = Text(file_name, text='', **text_kwargs)
+
+    if text.lowercase:
+        raw_sents = [sent.lower() for sent in raw_sents]
+
+    text.sents = text.tokenize_sents(raw_sents)
+    tagged = text.tagged_text(keep_claws=keep_claws)
+    chars = sum(len(sent) for sent in raw_sents)
+    return tagged, text.long_sent_counts, text_stats(text, chars, perf_counter() - t, hits, misses)
+
+
+def text_stats(text, chars, seconds, hits, misses):
+    """
+    Returns a dict of the stats of a parsed text for a RunReport (see telemetry.py). hits and misses are the counts of
+    the type cache before the text was parsed.
+    """
+    return {
+        'file': text.filepath,
+        'chars': chars,
+        'seconds': seconds,
+        'tokens': sum(len(sent) for sent in text.sents),
+        'parser_seconds': dict(text.parser_seconds or {}),
+        'cache_hits': Text.type_cache.hits - hits,
+        'cache_misses': Text.type_cache.misses - misses,
+    }
+
+
+def report_text(report, name, new_file_name, tagged, stats, encoding='UTF-8', errors='ignore'):
+    """
+    Adds a text saved as name to a RunReport. Texts saved under another name than new_file_name, i.e. as duplicates of
+    the text, are added as not parsed.
+    """
+    bytes_out = len(tagged.encode(encoding, errors))
+
+    if name != new_file_name:
+        report.add_file(name, bytes_out=bytes_out)
+        return
+
+    file_name = stats['file']
+    report.add_file(file_name, seconds=stats['seconds'], tokens=stats['tokens'],
+                    bytes_in=file_size(file_name) or stats['chars'], bytes_out=bytes_out,
+                    parser_seconds=stats['parser_seconds'], cache_hits=stats['cache_hits'],
+                    cache_misses=stats['cache_misses'])
+
+
+def merge_stats(stats, other):
+    """Adds the stats of a chunk to the stats of the chunks before it."""
+    if stats is None:
+        return dict(other, parser_seconds=dict(other['parser_seconds']))
+
+    for key in ('chars', 'seconds', 'tokens', 'cache_hits', 'cache_misses'):
+        stats[key] += other[key]
+    for name, seconds in other['parser_seconds'].items():
+        stats['parser_seconds'][name] = stats['parser_seconds'].get(name, 0.0) + seconds
+    return stats
+
+
+class ConversionPipeline:
+    """
+    Reads, parses and writes texts concurrently.
+
+    Example:
+        >>> p = ConversionPipeline([('in/a.txt', 'out/a.tec'), ('in/b.txt', 'out/b.tec')], prefetch=16, workers=4)
+        >>> p.run()
+        2
+
+    Arguments:
+        jobs: iterable of (input file name, output file name) tuples. A job can also be an (input file name,
+        output file name, text) tuple if the text has already been read, e.g. from an archive.
+
+    Keyword arguments:
+        prefetch: maximum number of texts waiting to be parsed and of texts waiting to be written
+        readers: number of threads reading input files
+        workers: number of processes parsing texts. Texts are parsed in the calling thread if workers is 1.
+        chunk_sents: if set and workers is more than 1, texts with more than this many sentences are split into
+        chunks of chunk_sents sentences that are parsed by different worker processes. The chunks are put back
+        together in order before the text is written, so one large file is parsed on every core. Texts without
+        sentence tags are one sentence and are not split.
+        header: passed to Text().tagged_text()
+        keep_claws: passed to Text().tagged_text()
+        encoding: character encoding of the saved files
+        errors: how encoding errors are handled when writing the files
+        output_archive: an ArchiveWriter. If given, output file names are names of files in the archive.
+        duplicates: dict of output file names and lists of more output file names the same tagged text is saved as,
+        e.g. for texts that are exact duplicates of the input file (see dedup.py)
+        report: a RunReport (see telemetry.py). If given, the time, tokens, bytes, parser stage timings and type
+        cache hits of every text are added to it.
+        memory_budget: if set, bytes of memory (or a string like '16G') the texts being parsed are kept under (see
+        resources.py). Texts too large for their share of the budget are parsed in chunks, also when workers is 1,
+        and fewer texts are parsed at once while the memory used is near the budget. Files are only read once the
+        texts already read and being parsed leave room for them.
+        **text_kwargs: passed to Text()
+    """
+
+    def __init__(self, jobs, prefetch=8, readers=1, workers=1, chunk_sents=None, header='', keep_claws=True,
+                 encoding='UTF-8', errors='ignore', output_archive=None, duplicates=None, memory_budget=None,
+                 report=None, **text_kwargs):
+        if prefetch < 1 or readers < 1 or workers < 1:
+            raise CorpusError('prefetch, readers and workers must be at least 1')
+        if chunk_sents is not None and chunk_sents < 1:
+            raise CorpusError('chunk_sents must be at least 1')
+
+        self.jobs = iter(jobs)
+        self.prefetch = prefetch
+        self.readers = readers
+        self.workers = workers
+        self.chunk_sents = chunk_sents
+        self.tagged_text_kwargs = {'header': header, 'keep_claws': keep_claws}
+        self.encoding = encoding
+        self.errors = errors
+        self.output_archive = output_archive
+        self.duplicates = duplicates or {}
+        self.report = report
+        self.text_kwargs = dict(text_kwargs, time_parsers=True) if report is not None else text_kwargs
+
+        self.input_encoding = text_kwargs.get('input_encoding', 'UTF-8')
+        self.input_open_errors = text_kwargs.get('input_open_errors', 'ignore')
+
+        self.jobs_lock = Lock()
+        self.stopped = Event()
+        self.exceptions = []
+        # Totals of Text().long_sent_counts for every text parsed
+        self.long_sent_counts = Counter()
+
+        self.scheduler = None if memory_budget is None else MemoryScheduler(memory_budget, workers)
+
+        # Splits texts into sentence strings when they are parsed in chunks
+        self.sent_splitter = Text('', text='', **text_kwargs) if chunk_sents or self.scheduler else None
+        # Shortest match of the sentence delimiter, e.g. <s>, if it is the default one
+        default_delimiter = self.sent_splitter is not None and \
+            self.sent_splitter.sentence_delimiter == Text('', text='').sentence_delimiter
+        self.min_delimiter_chars = 3 if default_delimiter else 1
+        # Tagged chunks of the text waiting to be put together and their stats
+        self.chunks = []
+        self.chunk_stats = None
+
+    def run(self):
+        """
+        Converts every text in self.jobs and returns the number of texts written. The names of the files written are
+        in self.written_files.
+        """
+        read_queue = Queue(self.prefetch)
+        write_queue = Queue(self.prefetch)
+        self.written = 0
+        # Output file names in the order they were saved
+        self.written_files = []
+
+        threads = [Thread(target=self.read, args=(read_queue,), daemon=True) for _ in range(self.readers)]
+        threads.append(Thread(target=self.write, args=(write_queue,), daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            self.parse(read_queue, write_queue)
+        except BaseException:
+            self.stopped.set()
+            raise
+        finally:
+            self.put(write_queue, _DONE)
+            for thread in threads:
+                thread.join()
+
+        if self.exceptions:
+            raise self.exceptions[0]
+
+        return self.written
+
+    def put(self, queue, item):
+        """Puts item in queue unless the pipeline has been stopped."""
+        while not self.stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def get(self, queue):
+        """Returns the next item in queue or _DONE if the pipeline has been stopped."""
+        while not self.stopped.is_set():
+            try:
+                return queue.get(timeout=0.1)
+            except Empty:
+                continue
+        return _DONE
+
+    def read(self, read_queue):
+        """
+        Reader stage. Reads input files and puts (input file name, output file name, text, memory held for the text)
+        in read_queue. With a memory budget, files are only read once they fit in it (see MemoryScheduler.hold()).
+        """
+        job = None
+        try:
+            while not self.stopped.is_set():
+                with self.jobs_lock:
+                    job = next(self.jobs, None)
+
+                if job is None:
+                    break
+
+                if len(job) == 3:
+                    # Texts read by the jobs, e.g. from an archive, can only be held once they are read
+                    file_name, new_file_name, raw_text = job
+                    held = self.scheduler.hold(len(raw_text), self.stopped) if self.scheduler else 0
+                else:
+                    file_name, new_file_name = job
+                    held = self.scheduler.hold(file_size(file_name) or 0, self.stopped) if self.scheduler else 0
+                    raw_text = read_text_file(file_name, self.input_encoding, self.input_open_errors)
+                self.put(read_queue, (file_name, new_file_name, raw_text, held))
+        except Exception as e:
+            if self.report is not None:
+                self.report.add_error(job[0] if job else None, e)
+            self.exceptions.append(e)
+            self.stopped.set()
+        finally:
+            self.put(read_queue, _DONE)
+
+    def parse(self, read_queue, write_queue):
+        """Parse stage. Takes texts from read_queue and puts (output file name, tagged text) in write_queue."""
+        readers_done = 0
+
+        if self.workers == 1:
+            while readers_done < self.readers:
+                item = self.get(read_queue)
+                if item is _DONE:
+                    if self.stopped.is_set():
+                        return
+                    readers_done += 1
+                    continue
+
+                file_name, new_file_name, raw_text, held = item
+                chunks = self.split_chunks(raw_text)
+
+                try:
+                    if chunks:
+                        keep_claws = self.tagged_text_kwargs['keep_claws']
+                        results = [tag_sents(file_name, chunk, self.text_kwargs, keep_claws) for chunk in chunks]
+                        stats = None
+                        for tagged, counts, chunk_stats in results:
+                            self.long_sent_counts.update(counts)
+                            stats = merge_stats(stats, chunk_stats)
+                        tagged = self.join_chunks([tagged for tagged, counts, chunk_stats in results])
+                    else:
+                        tagged, counts, stats = tag_text(file_name, raw_text, self.text_kwargs,
+                                                         self.tagged_text_kwargs)
+                        self.long_sent_counts.update(counts)
+                except Exception as e:
+                    if self.report is not None:
+                        self.report.add_error(file_name, e)
+                    raise
+
+                if self.scheduler:
+                    self.scheduler.unhold(held)
+                    self.scheduler.adapt()
+
+                self.put(write_queue, (new_file_name, tagged, stats))
+            return
+
+        # Limits the number of texts and chunks held by the worker processes. Items are (output file name, future,
+        # True if this is the last chunk of the text, True if the text was split into chunks, estimated memory,
+        # memory held for the text by the converter, which is given with the last chunk).
+        in_flight = deque()
+
+        def submit(new_file_name, last, chunked, n_bytes, held, fn, *args):
+            estimate = self.scheduler.estimate(n_bytes) if self.scheduler else 0
+
+            while in_flight and (len(in_flight) >= self.workers + self.prefetch or
+                                 self.scheduler and not self.scheduler.fits(estimate, len(in_flight))):
+                self.put_result(write_queue, *in_flight.popleft())
+
+            if self.scheduler:
+                self.scheduler.reserve(estimate)
+            in_flight.append((new_file_name, executor.submit(fn, *args), last, chunked, estimate, held))
+
+        def next_item():
+            # Results that are done are written while waiting for texts, so that readers waiting for memory to be
+            # freed are not kept waiting by results that nobody collects
+            while self.scheduler and in_flight and not self.stopped.is_set():
+                try:
+                    return read_queue.get(timeout=0.1)
+                except Empty:
+                    if in_flight[0][1].done():
+                        self.put_result(write_queue, *in_flight.popleft())
+            return self.get(read_queue)
+
+        with ProcessPoolExecutor(self.workers) as executor:
+            while readers_done < self.readers:
+                item = next_item()
+                if item is _DONE:
+                    if self.stopped.is_set():
+                        return
+                    readers_done += 1
+                    continue
+
+                file_name, new_file_name, raw_text, held = item
+                chunks = self.split_chunks(raw_text)
+
+                if chunks:
+                    keep_claws = self.tagged_text_kwargs['keep_claws']
+                    for i, chunk in enumerate(chunks):
+                        last = i == len(chunks) - 1
+                        submit(new_file_name, last, True, sum(len(sent) for sent in chunk), held if last else 0,
+                               tag_sents, file_name, chunk, self.text_kwargs, keep_claws)
+                else:
+                    submit(new_file_name, True, False, len(raw_text), held,
+                           tag_text, file_name, raw_text, self.text_kwargs, self.tagged_text_kwargs)
+
+            while in_flight:
+                self.put_result(write_queue, *in_flight.popleft())
+
+    def split_chunks(self, raw_text):
+        """
+        Returns a list of the chunks of sentence strings raw_text is parsed in, or None if it is parsed whole. Texts
+        are split if they have more than chunk_sents sentences or are too large for their share of the memory budget.
+        Texts without sentence tags are one sentence, so they are never split.
+        """
+        if self.sent_splitter is None:
+            return None
+
+        scheduler = self.scheduler
+        oversized = scheduler is not None and scheduler.estimate(len(raw_text)) > scheduler.share()
+        # Every sentence delimiter takes at least min_delimiter_chars, so short texts can't have more than
+        # chunk_sents sentences and are not split just to count them
+        chunkable = self.chunk_sents and self.workers > 1 and \
+            len(raw_text) // self.min_delimiter_chars + 1 > self.chunk_sents
+
+        if not (oversized or chunkable):
+            return None
+
+        raw_sents = self.sent_splitter.split_sents(raw_text)
+        size = self.chunk_sents if self.chunk_sents and self.workers > 1 else None
+
+        if oversized:
+            budget_size = scheduler.chunk_sents(len(raw_text), len(raw_sents))
+            size = budget_size if size is None else min(size, budget_size)
+
+        if size is None or len(raw_sents) <= size:
+            return None
+
+        return [raw_sents[start:start + size] for start in range(0, len(raw_sents), size)]
+
+    def join_chunks(self, tagged_chunks):
+        """Returns the tagged text of a text parsed in chunks."""
+        header = self.tagged_text_kwargs['header']
+        tagged = '\n'.join(chunk for chunk in tagged_chunks if chunk)
+        if header:
+            tagged = header + '\n' + tagged
+        return tagged
+
+    def put_result(self, write_queue, new_file_name, future, last, chunked, estimate=0, held=0):
+        """
+        Waits for a text or chunk parsed by a worker process. Texts are put in write_queue once their last chunk has
+        been parsed.
+        """
+        try:
+            tagged, counts, stats = future.result()
+        except Exception as e:
+            if self.report is not None:
+                self.report.add_error(new_file_name, e)
+            raise
+
+        self.long_sent_counts.update(counts)
+
+        if self.scheduler:
+            self.scheduler.release(estimate)
+            if held:
+                self.scheduler.unhold(held)
+            self.scheduler.adapt()
+
+        if chunked:
+            self.chunks.append(tagged)
+            self.chunk_stats = merge_stats(self.chunk_stats, stats)
+            if not last:
+                return
+
+            tagged = self.join_chunks(self.chunks)
+            stats = self.chunk_stats
+            self.chunks = []
+            self.chunk_stats = None
+
+        self.put(write_queue, (new_file_name, tagged, stats))
+
+    def write(self, write_queue):
+        """Writer stage. Saves the tagged texts in write_queue."""
+        try:
+            while True:
+                item = self.get(write_queue)
+                if item is _DONE:
+                    break
+
+                new_file_name, tagged, stats = item
+
+                for name in [new_file_name] + self.duplicates.get(new_file_name, []):
+                    print(name)
+
+                    if self.output_archive is not None:
+                        self.output_archive.write(name, tagged)
+                    else:
+                        with open(name, 'w', encoding=self.encoding, errors=self.errors) as f:
+                            f.write(tagged)
+
+                    self.written += 1
+                    self.written_files.append(name)
+
+                    if self.report is not None:
+                        report_text(self.report, name, new_file_name, tagged, stats, self.encoding, self.errors)
+        except Exception as e:
+            self.exceptions.append(e)
+            self.stopped.set()
@@ -0,0 +1,205 @@
+"""
+Keeping the conversion of a corpus within a memory budget.
+
+Parsing a text takes memory proportional to its size, about memory_per_byte times the size of the CLAWS tagged file.
+With a budget, ConversionPipeline (see pipeline.py) estimates the memory of every text from its size and only starts a
+text if the estimates of the texts being parsed leave room for it:
+
+    texts read ahead of parsing are held in the converter itself, with the sentence strings they are split into and
+    the copies sent to the worker processes, so readers wait before reading a file until it fits with the texts
+    already held and parsed
+
+    texts estimated to need more than their share of the budget (budget / workers) are parsed in chunks of sentences
+    that fit in it, so one very large file can't take all the memory
+    the number of texts parsed at once goes down while the memory actually used by the converter and its worker
+    processes is near the budget and back up while it is well below it
+
+Memory used is read from /proc, so the number of texts parsed at once only adapts on Linux. Estimates are used
+everywhere.
+
+Example:
+    >>> c = Corpus('/home/mike/corpora/Giant')
+    >>> c.convert('/home/mike/corpora/Giant-BT', workers=8, memory_budget='16G')
+"""
+
+import os
+from threading import Condition
+from time import monotonic
+
+from errors import CorpusError
+
+# Bytes of memory used to parse one byte of CLAWS tagged text, measured on Mini-CORE texts
+default_memory_per_byte = 50
+# Bytes of memory the converter holds for one byte of a text it has read: the text, its sentence strings if it is
+# parsed in chunks, and the copies sent to the worker processes
+default_held_per_byte = 3
+
+_size_units = {'': 1, 'k': 2 ** 10, 'm': 2 ** 20, 'g': 2 ** 30, 't': 2 ** 40}
+
+
+def parse_size(size):
+    """Returns a number of bytes for an int or a string like '512M' or '16G'."""
+    if isinstance(size, (int, float)):
+        return int(size)
+
+    size = size.strip().lower().rstrip('b')
+    unit = size[-1] if size and size[-1] in _size_units else ''
+
+    try:
+        return int(float(size[:len(size) - len(unit)]) * _size_units[unit])
+    except ValueError:
+        raise CorpusError('Sizes must be a number of bytes or a number followed by K, M, G or T, not {0!r}'.format(
+            size))
+
+
+def process_rss(pid):
+    """Returns the resident memory of process pid in bytes, or None if it can't be read."""
+    try:
+        with open('/proc/{0}/statm'.format(pid)) as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def child_pids(pid=None):
+    """Returns the ids of the child processes of pid, or of this process if pid is None. Empty if /proc is missing."""
+    pid = str(os.getpid() if pid is None else pid)
+    children = []
+
+    try:
+        names = os.listdir('/proc')
+    except OSError:
+        return children
+
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/{0}/stat'.format(name)) as f:
+                # The process name in brackets can have spaces, so fields are counted after it
+                if f.read().rsplit(')', 1)[1].split()[1] == pid:
+                    children.append(int(name))
+        except (OSError, IndexError):
+            continue
+
+    return children
+
+
+def total_rss():
+    """Returns the resident memory of this process and its children in bytes, or None if it can't be read."""
+    rss = process_rss(os.getpid())
+    if rss is None:
+        return None
+    return rss + sum(process_rss(pid) or 0 for pid in child_pids())
+
+
+class MemoryScheduler:
+    """
+    Decides how many texts are parsed at once and which are parsed in chunks under a memory budget.
+
+    Arguments:
+        budget: memory budget in bytes, or a string like '16G'
+        workers: largest number of texts parsed at once
+
+    Keyword arguments:
+        memory_per_byte: estimated bytes of memory used to parse one byte of text
+        held_per_byte: estimated bytes of memory held by the converter for one byte of a text it has read
+        check_every: seconds between readings of the memory used
+    """
+
+    def __init__(self, budget, workers, memory_per_byte=default_memory_per_byte, held_per_byte=default_held_per_byte,
+                 check_every=0.5):
+        self.budget = parse_size(budget)
+        if self.budget <= 0:
+            raise CorpusError('The memory budget must be more than 0')
+
+        self.max_workers = workers
+        self.workers = workers
+        self.memory_per_byte = memory_per_byte
+        self.held_per_byte = held_per_byte
+        self.check_every = check_every
+        # Sum of the estimates of the texts and chunks being parsed, and of the texts read and not parsed yet. Readers
+        # wait on condition for them to go down.
+        self.reserved = 0
+        self.held = 0
+        self.condition = Condition()
+        self.last_check = None
+        self.peak_rss = 0
+        self.oversized = 0
+
+    def estimate(self, n_bytes):
+        """Returns the estimated memory needed to parse a text of n_bytes."""
+        return n_bytes * self.memory_per_byte
+
+    def share(self):
+        """Returns the memory a single text can take before it is parsed in chunks."""
+        return self.budget / self.max_workers
+
+    def chunk_sents(self, n_bytes, n_sents):
+        """
+        Returns the number of sentences in the chunks of a text of n_bytes with n_sents sentences, or None if it fits
+        in its share of the budget.
+        """
+        estimate = self.estimate(n_bytes)
+        if estimate <= self.share():
+            return None
+
+        self.oversized += 1
+        return max(1, int(n_sents * self.share() / estimate))
+
+    def fits(self, estimate, running):
+        """Returns True if a text or chunk with estimate can be started while running others are being parsed."""
+        if running == 0:
+            return True
+        with self.condition:
+            return running < self.workers and self.held + self.reserved + estimate <= self.budget
+
+    def reserve(self, estimate):
+        with self.condition:
+            self.reserved += estimate
+
+    def release(self, estimate):
+        with self.condition:
+            self.reserved -= estimate
+            self.condition.notify_all()
+
+    def hold(self, n_bytes, stopped=None):
+        """
+        Waits until a text of n_bytes fits in the budget with the texts already held and parsed, then adds it and
+        returns the memory held for it. Called by readers before they read a file. A text is always let through if
+        nothing else is held or parsed, however large it is. Stops waiting when the Event stopped is set.
+        """
+        memory = n_bytes * self.held_per_byte
+
+        with self.condition:
+            while self.held + self.reserved and self.held + self.reserved + memory > self.budget:
+                if stopped is not None and stopped.is_set():
+                    break
+                self.condition.wait(0.1)
+            self.held += memory
+
+        return memory
+
+    def unhold(self, memory):
+        """Removes the memory returned by hold() once the text has been parsed."""
+        with self.condition:
+            self.held -= memory
+            self.condition.notify_all()
+
+    def adapt(self):
+        """Reads the memory used, at most every check_every seconds, and changes self.workers if needed."""
+        now = monotonic()
+        if self.last_check is not None and now - self.last_check < self.check_every:
+            return
+
+        self.last_check = now
+        rss = total_rss()
+        if rss is None:
+            return
+
+        self.peak_rss = max(self.peak_rss, rss)
+
+        if rss > 0.9 * self.budget and self.workers > 1:
+            self.workers -= 1
+        elif rss < 0.6 * self.budget and self.workers < self.max_workers:
+            self.workers += 1
@@ -0,0 +1,293 @@
+"""
+Local tagging service.
+
+Keeps a pool of worker processes with Text imported and the lexicon loaded, so that snippets can be tagged on demand
+without starting Python for every request. Listens on a TCP port or a Unix socket:
+
+    python3 service.py --port 8765 --workers 4
+    python3 service.py --socket /tmp/biber-tagger.sock
+
+Endpoints:
+
+    POST /tag           body: CLAWS tagged text. Returns the tagged text.
+    POST /batch         body: {"texts": ["CLAWS tagged text", ...]}. Returns {"results": [tagged text, ...]}.
+    GET  /stats         latency and throughput of the requests served so far
+    GET  /health        {"status": "ok"}
+
+Tagged texts are returned as JSON, with every text a list of sentences of [word, CLAWS tag, [Biber tag fields]] lists,
+or as .tec lines like the files saved by Text().write(). Add ?format=tec to a request, or "format": "tec" to a batch,
+for .tec lines.
+
+Example:
+    $ curl -s --data-binary @text.txt 'localhost:8765/tag?format=tec'
+    $ curl -s -d '{"texts": ["<s> It_PPH1 was_VBDZ written_VVN ._. </s>"]}' localhost:8765/batch
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from threading import Lock
+from time import perf_counter, time
+from urllib.parse import urlsplit, parse_qs
+
+from text import Text
+from errors import TextError
+
+# Formats tagged texts can be returned in
+output_formats = ('json', 'tec')
+
+
+def tag_for_service(raw_text, output_format, keep_claws, text_kwargs):
+    """
+    Returns (tagged text, number of tokens) for raw_text. The tagged text is a string of .tec lines or a list of
+    parsed sentences. Defined at module level so that it can be sent to worker processes.
+    """
+    parsed_sents = Text.from_string(raw_text, '<service>', **text_kwargs).parse()
+    token_n = sum(len(sent) for sent in parsed_sents)
+
+    return Text.serialize(parsed_sents, 'tec' if output_format == 'tec' else 'lists', keep_claws=keep_claws), token_n
+
+
+def warm_worker():
+    """Imports text and tags a sentence so that the first request to a worker is not slower than the rest."""
+    return tag_for_service('<s> It_PPH1 was_VBDZ written_VVN ._. </s>', 'json', True, {})[1]
+
+
+class TaggingService:
+    """
+    Tags texts with a pool of warm worker processes and keeps stats of the requests served.
+
+    Example:
+        >>> service = TaggingService(workers=2)
+        >>> service.tag(['<s> It_PPH1 was_VBDZ written_VVN ._. </s>'], 'tec')
+        ['It ^+++++ ^PPH1\\nwas ^vbd+bedz+aux+++ ^VBDZ\\nwritten ^VL++AGLS+++ ^VVN\\n. ^Y+PER+CLP+++ ^.']
+        >>> service.close()
+
+    Keyword arguments:
+        workers: number of worker processes. Texts are tagged one request at a time in the thread handling the request
+        if 0. Defaults to the number of CPUs.
+        keep_claws: retains claws tags in .tec output if True
+        latency_window: number of recent requests latency percentiles are computed from
+        **text_kwargs: passed to Text()
+    """
+
+    def __init__(self, workers=None, keep_claws=True, latency_window=1000, **text_kwargs):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.keep_claws = keep_claws
+        self.text_kwargs = text_kwargs
+        self.executor = None
+        # Text.type_cache is shared by the handler threads when texts are tagged in them
+        self.tag_lock = Lock()
+
+        if self.workers:
+            self.executor = ProcessPoolExecutor(self.workers)
+            # Starts every worker before the first request comes in
+            for future in [self.executor.submit(warm_worker) for _ in range(self.workers)]:
+                future.result()
+        else:
+            warm_worker()
+
+        self.stats_lock = Lock()
+        self.started = time()
+        self.latencies = deque(maxlen=latency_window)
+        self.counts = {'requests': 0, 'errors': 0, 'texts': 0, 'tokens': 0}
+
+    def tag(self, raw_texts, output_format='json'):
+        """Returns a list with the tagged version of every CLAWS tagged text in raw_texts."""
+        if output_format not in output_formats:
+            raise TextError('format must be one of: ' + ', '.join(output_formats))
+
+        args = (output_format, self.keep_claws, self.text_kwargs)
+
+        if self.executor is None:
+            with self.tag_lock:
+                results = [tag_for_service(raw_text, *args) for raw_text in raw_texts]
+        else:
+            futures = [self.executor.submit(tag_for_service, raw_text, *args) for raw_text in raw_texts]
+            results = [future.result() for future in futures]
+
+        with self.stats_lock:
+            self.counts['texts'] += len(results)
+            self.counts['tokens'] += sum(token_n for tagged, token_n in results)
+
+        return [tagged for tagged, token_n in results]
+
+    def record(self, seconds, error=False):
+        """Adds a request that took seconds to the stats."""
+        with self.stats_lock:
+            self.counts['requests'] += 1
+            self.counts['errors'] += error
+            self.latencies.append(seconds)
+
+    def stats(self):
+        """Returns a dict of request counts, throughput since the service started and recent latencies in ms."""
+        with self.stats_lock:
+            latencies = sorted(self.latencies)
+            stats = dict(self.counts)
+
+        uptime = time() - self.started
+        stats['workers'] = self.workers
+        stats['uptime_seconds'] = uptime
+        stats['requests_per_second'] = stats['requests'] / uptime
+        stats['tokens_per_second'] = stats['tokens'] / uptime
+
+        if latencies:
+            def percentile(p):
+                return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+            stats['latency_ms'] = {'mean': sum(latencies) / len(latencies) * 1000, 'p50': percentile(0.5),
+                                   'p90': percentile(0.9), 'p99': percentile(0.99), 'max': latencies[-1] * 1000}
+
+        return stats
+
+    def close(self):
+        """Stops the worker processes."""
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+class TaggingHandler(BaseHTTPRequestHandler):
+    """Handles the HTTP requests of a TaggingServer. See the module docstring for the endpoints."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+
+        if path == '/stats':
+            self.send_json(200, self.server.service.stats())
+        elif path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': 'Not found: ' + path})
+
+    def do_POST(self):
+        t = perf_counter()
+        url = urlsplit(self.path)
+        service = self.server.service
+        error = True
+
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            output_format = parse_qs(url.query).get('format', ['json'])[0]
+
+            if url.path == '/tag':
+                tagged = service.tag([body.decode('utf-8', 'ignore')], output_format)[0]
+                if output_format == 'tec':
+                    self.send_text(200, tagged)
+                else:
+                    self.send_json(200, tagged)
+
+            elif url.path == '/batch':
+                request = json.loads(body.decode('utf-8'))
+                texts = request['texts']
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    raise TextError('texts must be a list of strings')
+                results = service.tag(texts, request.get('format', output_format))
+                self.send_json(200, {'results': results})
+
+            else:
+                self.send_json(404, {'error': 'Not found: ' + url.path})
+                return
+
+            error = False
+        except (ValueError, KeyError, TypeError, AttributeError, TextError) as e:
+            self.send_json(400, {'error': '{0}: {1}'.format(type(e).__name__, e)})
+        except Exception as e:
+            # E.g. a parser error or a broken worker pool: the client still gets a response
+            self.send_json(500, {'error': '{0}: {1}'.format(type(e).__name__, e)})
+        finally:
+            service.record(perf_counter() - t, error)
+
+    def send_json(self, status, data):
+        self.send_body(status, json.dumps(data).encode('utf-8'), 'application/json')
+
+    def send_text(self, status, text):
+        self.send_body(status, text.encode('utf-8'), 'text/plain; charset=utf-8')
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class TaggingServer(ThreadingHTTPServer):
+    """HTTP server on a TCP port with a TaggingService."""
+
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        self.service = service
+        self.verbose = verbose
+        super().__init__(address, TaggingHandler)
+
+
+class UnixTaggingServer(ThreadingMixIn, UnixStreamServer):
+    """HTTP server on a Unix socket with a TaggingService."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, service, verbose=False):
+        self.service = service
+        self.verbose = verbose
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        super().__init__(socket_path, TaggingHandler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves Biber tags over HTTP on localhost or a Unix socket.')
+    parser.add_argument('--host', dest='host', default='127.0.0.1')
+    parser.add_argument('--port', dest='port', default=8765, type=int)
+    parser.add_argument('--socket', dest='socket', default=None)
+    parser.add_argument('--workers', dest='workers', default=None, type=int)
+    parser.add_argument('--parsers', dest='parsers', nargs='+', default=None)
+    parser.add_argument('--disable', dest='disabled_parsers', nargs='+', default=())
+    parser.add_argument('--fields', dest='fields', nargs='+', default=None, type=int)
+    parser.add_argument('--verbose', dest='verbose', action='store_true')
+
+    args = parser.parse_args()
+
+    service = TaggingService(workers=args.workers, parsers=args.parsers, disabled_parsers=args.disabled_parsers,
+                             fields=args.fields)
+
+    if args.socket:
+        server = UnixTaggingServer(args.socket, service, args.verbose)
+        print('Serving on', args.socket, 'with', service.workers, 'workers')
+    else:
+        server = TaggingServer((args.host, args.port), service, args.verbose)
+        print('Serving on http://{0}:{1} with {2} workers'.format(args.host, args.port, service.workers))
+
+    # Shuts down cleanly when stopped by a process manager
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
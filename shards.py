@@ -0,0 +1,279 @@
+"""
+Splitting the conversion of a corpus between several machines.
+
+Corpus(..., shard='2/4') only has the files of the 2nd of 4 shards. Every file is put in exactly one shard, and every
+machine works out the same shards from the relative paths and sizes of the files, so the shards can be converted on
+different machines without talking to each other:
+
+    python3 claws2biber.py /corpora/Minicore /corpora/Minicore-BT --shard 1/4    (on machine 1)
+    python3 claws2biber.py /corpora/Minicore /corpora/Minicore-BT --shard 2/4    (on machine 2)
+    ...
+
+Each shard saves a manifest next to the new corpus, e.g. /corpora/Minicore-BT.shard-1-of-4.json, listing the files it
+converted and its stats. Once every shard has finished, merge the manifests. This checks that every file of the corpus
+was converted exactly once and saves the combined manifest as /corpora/Minicore-BT.manifest.json:
+
+    python3 shards.py merge /corpora/Minicore-BT
+"""
+
+import hashlib
+import json
+import sys
+from glob import glob, escape
+from os import path, replace, sep
+
+from archive import tar_write_modes
+from errors import CorpusError
+
+# Version of the manifest format
+MANIFEST_VERSION = 1
+
+
+def parse_shard(shard):
+    """
+    Returns (shard number, number of shards) for a string like '2/4' or a tuple like (2, 4). Shards are numbered
+    from 1.
+    """
+    try:
+        if isinstance(shard, str):
+            number, count = (int(part) for part in shard.split('/'))
+        else:
+            number, count = (int(part) for part in shard)
+    except ValueError:
+        raise CorpusError('Shards must be given as i/N, e.g. 2/4, not {0!r}'.format(shard))
+
+    if not 1 <= number <= count:
+        raise CorpusError('Shard {0}/{1} does not exist. Shards are numbered from 1 to {1}.'.format(number, count))
+
+    return number, count
+
+
+def relative_path(file_name, folder):
+    """Returns the path of file_name relative to folder with / as separator."""
+    return file_name[len(folder) + 1:].replace(sep, '/')
+
+
+def stable_hash(rel_path):
+    """Returns an integer hash of rel_path that is the same in every process and on every machine."""
+    return int.from_bytes(hashlib.sha1(rel_path.encode('utf-8')).digest()[:8], 'big')
+
+
+def file_size(file_name):
+    """Returns the size of file_name in bytes, or 0 if it can't be found, e.g. for files in archives."""
+    try:
+        return path.getsize(file_name)
+    except OSError:
+        return 0
+
+
+def files_hash(rel_paths):
+    """Returns a hash of a set of relative paths, used to check that shards were made from the same files."""
+    h = hashlib.sha256()
+    for rel_path in sorted(rel_paths):
+        h.update(rel_path.encode('utf-8') + b'\n')
+    return h.hexdigest()
+
+
+def partition(files, folder, count, sizes=None):
+    """
+    Returns a list of count lists with the files in each shard, in the order of files.
+
+    Files are assigned from the largest to the smallest, each to the shard with the fewest bytes so far. Files of the
+    same size are taken in the order of the stable hashes of their relative paths, and ties between shards go to the
+    shard the hash points to, so the shards only depend on the relative paths and sizes of the files.
+
+    Arguments:
+        files: paths of the files in the corpus
+        folder: folder the paths are relative to
+        count: number of shards
+
+    Keyword arguments:
+        sizes: dict of file sizes in bytes. Sizes are read from the files if None.
+    """
+    if sizes is None:
+        sizes = {file_name: file_size(file_name) for file_name in files}
+
+    hashes = {file_name: stable_hash(relative_path(file_name, folder)) for file_name in files}
+    loads = [0] * count
+    shard_of = {}
+
+    for file_name in sorted(files, key=lambda f: (-sizes[f], hashes[f])):
+        first = hashes[file_name] % count
+        # Looks at the shards starting from the one the hash points to
+        shard = min(((first + n) % count for n in range(count)), key=lambda s: (loads[s], (s - first) % count))
+        shard_of[file_name] = shard
+        # Files of unknown size, e.g. in archives, still count towards the load
+        loads[shard] += max(sizes[file_name], 1)
+
+    shards = [[] for _ in range(count)]
+    for file_name in files:
+        shards[shard_of[file_name]].append(file_name)
+
+    return shards
+
+
+def shard_files(files, folder, shard):
+    """Returns the files in shard, a (shard number, number of shards) tuple, in the order of files."""
+    number, count = shard
+    return partition(files, folder, count)[number - 1]
+
+
+def shard_output(new_folder, shard):
+    """
+    Returns where a shard saves its texts. Shards share output folders, but each shard saves its own archive, e.g.
+    Minicore-BT.shard-2-of-4.zip.
+    """
+    number, count = shard
+    lower = new_folder.lower()
+
+    for ext in sorted(tuple(tar_write_modes) + ('.zip',), key=len, reverse=True):
+        if lower.endswith(ext):
+            return '{0}.shard-{1}-of-{2}{3}'.format(new_folder[:-len(ext)], number, count, new_folder[-len(ext):])
+
+    return new_folder
+
+
+def manifest_path(new_folder, shard=None):
+    """Returns the path of the manifest of a shard, or of the merged manifest if shard is None."""
+    new_folder = new_folder.rstrip('/\\')
+
+    if shard is None:
+        return new_folder + '.manifest.json'
+
+    return '{0}.shard-{1}-of-{2}.json'.format(new_folder, *shard)
+
+
+def save_json(file_name, data):
+    """Saves data as JSON. The file is replaced in one step so that a finished manifest is never half written."""
+    tmp_file = file_name + '.tmp'
+
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+
+    replace(tmp_file, file_name)
+
+
+def save_manifest(new_folder, shard, folder, all_files, files, output, stats, duplicates=None):
+    """
+    Saves the manifest of a shard, or of a whole run if shard is None, and returns its path.
+
+    Arguments:
+        new_folder: folder or archive the corpus was converted to, without the shard suffix
+        shard: (shard number, number of shards) or None
+        folder: folder of the corpus
+        all_files: paths of every file in the corpus
+        files: list of (input file, output file) tuples converted by the shard
+        output: folder or archive the shard saved its texts in
+        stats: dict of numbers describing the run, e.g. the number of texts and seconds
+
+    Keyword arguments:
+        duplicates: dict of the exact and near duplicates found before converting (see Corpus().convert())
+    """
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'folder': folder,
+        'new_folder': new_folder,
+        'shard': None if shard is None else list(shard),
+        'output': output,
+        'corpus_files': len(all_files),
+        'corpus_hash': files_hash(relative_path(f, folder) for f in all_files),
+        'files': [[relative_path(f, folder), new_f, file_size(f)] for f, new_f in files],
+        'stats': stats,
+    }
+
+    if duplicates is not None:
+        manifest['duplicates'] = duplicates
+
+    file_name = manifest_path(new_folder, shard)
+    save_json(file_name, manifest)
+    return file_name
+
+
+def merge_manifests(new_folder):
+    """
+    Checks that the shard manifests of new_folder cover every file of the corpus exactly once, and saves and returns
+    the merged manifest. Raises CorpusError if a shard is missing, a file was converted by more than one shard or not
+    at all, or the shards were made from different files.
+
+    Stats are added up, except 'seconds', which is the longest time taken by a shard.
+    """
+    file_names = sorted(glob(escape(new_folder.rstrip('/\\')) + '.shard-*-of-*.json'))
+
+    if not file_names:
+        raise CorpusError('No shard manifests found for ' + new_folder)
+
+    manifests = []
+    for file_name in file_names:
+        with open(file_name, encoding='utf-8') as f:
+            manifests.append(json.load(f))
+
+    first = manifests[0]
+    count = first['shard'][1]
+    problems = []
+
+    for manifest in manifests:
+        for key in ('version', 'corpus_files', 'corpus_hash'):
+            if manifest[key] != first[key]:
+                problems.append('shard {0}/{1} has a different {2}'.format(*manifest['shard'], key))
+        if manifest['shard'][1] != count:
+            problems.append('shard {0}/{1} is from a run with another number of shards'.format(*manifest['shard']))
+
+    numbers = [manifest['shard'][0] for manifest in manifests]
+    missing = [n for n in range(1, count + 1) if n not in numbers]
+    if missing:
+        problems.append('missing shard(s) ' + ', '.join('{0}/{1}'.format(n, count) for n in missing))
+
+    seen = {}
+    for manifest in manifests:
+        for rel_path, new_file, size in manifest['files']:
+            if rel_path in seen:
+                problems.append('{0} was converted by shards {1}/{3} and {2}/{3}'.format(
+                    rel_path, seen[rel_path], manifest['shard'][0], count))
+            seen[rel_path] = manifest['shard'][0]
+
+    if len(seen) != first['corpus_files'] or files_hash(seen) != first['corpus_hash']:
+        problems.append('{0} of {1} files were converted'.format(len(seen), first['corpus_files']))
+
+    if problems:
+        raise CorpusError('Shards of {0} are not complete:\n  {1}'.format(new_folder, '\n  '.join(problems)))
+
+    stats = {}
+    for manifest in manifests:
+        for key, value in manifest['stats'].items():
+            if key == 'seconds':
+                stats[key] = max(stats.get(key, 0), value)
+            else:
+                stats[key] = stats.get(key, 0) + value
+
+    merged = {
+        'version': MANIFEST_VERSION,
+        'folder': first['folder'],
+        'new_folder': first['new_folder'],
+        'shards': count,
+        'outputs': [manifest['output'] for manifest in sorted(manifests, key=lambda m: m['shard'][0])],
+        'corpus_files': first['corpus_files'],
+        'corpus_hash': first['corpus_hash'],
+        'files': sorted(file for manifest in manifests for file in manifest['files']),
+        'stats': stats,
+    }
+
+    if any('duplicates' in manifest for manifest in manifests):
+        merged['duplicates'] = {key: [item for manifest in manifests
+                                      for item in manifest.get('duplicates', {}).get(key, [])]
+                                for key in ('exact', 'near', 'skipped')}
+
+    save_json(manifest_path(new_folder), merged)
+    return merged
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == 'merge':
+        try:
+            merged = merge_manifests(sys.argv[2])
+        except CorpusError as e:
+            sys.exit(str(e))
+        print('Merged {0} shards with {1} files into {2}'.format(merged['shards'], merged['corpus_files'],
+                                                                 manifest_path(sys.argv[2])))
+        print(json.dumps(merged['stats'], indent=1))
+    else:
+        print('Usage: python3 shards.py merge path-of-the-new-corpus')
@@ -0,0 +1,273 @@
+"""
+Frequency sketches for corpus statistics that don't fit in memory as dicts.
+
+    CountMinSketch: approximate frequencies of items. Estimates are never too low, and are too high by at most
+    total / width * e with probability 1 - e ** -depth.
+    SpaceSaving: the k most frequent items with their counts and the most each count can be too high by.
+    HyperLogLog: approximate number of different items, with a standard error of about 1.04 / sqrt(2 ** precision).
+    FrequencySketch: all three, used in place of the frequency dicts of Text().freq_dist(), Corpus().lex_freq(),
+    Corpus().tag_freq() and BiberCorpus().
+
+Each sketch takes the same memory however many items are added. Items are hashed the same way in every process, so
+sketches of different files or worker processes can be merged into the sketch of the whole corpus as long as they were
+made with the same sizes.
+
+Items can be strings or tuples of strings, e.g. (word, tag) pairs or n-grams.
+
+Example:
+    >>> c = Corpus('/home/mike/corpora/Mini-CORE_tagd_H')
+    >>> fs = c.freq_sketch(element_i=None, n=2)
+    >>> fs[(('of', 'IO'), ('the', 'AT'))]
+    >>> fs.most_common(10)
+    >>> fs.types()
+"""
+
+import hashlib
+import heapq
+import math
+from array import array
+
+from errors import CorpusError
+
+
+def item_hash(item):
+    """Returns a 64 bit hash of a string or a tuple of strings that is the same in every process."""
+    if isinstance(item, tuple):
+        item = '\x1f'.join(map(str, item))
+    return int.from_bytes(hashlib.blake2b(str(item).encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class CountMinSketch:
+    """
+    Approximate frequencies in a table of depth rows of width counters.
+
+    Arguments:
+        width: counters in each row. Errors are smaller with wider rows.
+        depth: number of rows. Errors are less likely with more rows.
+    """
+
+    def __init__(self, width=2 ** 20, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = array('q', bytes(8 * width * depth))
+        self.total = 0
+
+    @classmethod
+    def from_error(cls, epsilon, delta):
+        """Returns a CountMinSketch whose estimates are too high by more than epsilon * total with probability delta."""
+        return cls(math.ceil(math.e / epsilon), math.ceil(math.log(1 / delta)))
+
+    def cells(self, h):
+        """Returns the index of the counter of a hash in every row."""
+        # Rows use h1 + i * h2 instead of a separate hash function each
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, item, count=1, h=None):
+        """Adds count to the frequency of item. h is the item_hash() of item, if it has been worked out already."""
+        table = self.table
+        for cell in self.cells(item_hash(item) if h is None else h):
+            table[cell] += count
+        self.total += count
+
+    def __getitem__(self, item):
+        """Returns the estimated frequency of item."""
+        table = self.table
+        return min(table[cell] for cell in self.cells(item_hash(item)))
+
+    def merge(self, other):
+        """Adds the counts of other, which must have the same width and depth."""
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise CorpusError('Only count-min sketches of the same width and depth can be merged')
+
+        table = self.table
+        for i, count in enumerate(other.table):
+            if count:
+                table[i] += count
+        self.total += other.total
+        return self
+
+
+class SpaceSaving:
+    """
+    The k most frequent items, found with the Space-Saving algorithm. When a new item comes and k items are already
+    kept, it replaces the item with the lowest count and takes over that count, which is recorded as its error.
+
+    Arguments:
+        k: number of items kept
+    """
+
+    def __init__(self, k=1000):
+        self.k = k
+        self.counts = {}
+        self.errors = {}
+        # Min-heap of (count, item). Entries of items whose counts have gone up since are skipped when popped.
+        self.heap = []
+
+    def add(self, item, count=1):
+        """Adds count to the frequency of item."""
+        counts = self.counts
+
+        if item in counts:
+            counts[item] += count
+            return
+
+        error = 0
+        if len(counts) >= self.k:
+            error = self.pop_min()
+
+        counts[item] = error + count
+        self.errors[item] = error
+        heapq.heappush(self.heap, (counts[item], item))
+
+    def pop_min(self):
+        """Removes the item with the lowest count and returns the count."""
+        heap = self.heap
+        while True:
+            count, item = heapq.heappop(heap)
+            current = self.counts[item]
+            if current == count:
+                del self.counts[item]
+                del self.errors[item]
+                return count
+            heapq.heappush(heap, (current, item))
+
+    def min_count(self):
+        """Returns the count an item that is not kept can have at most."""
+        return min(self.counts.values()) if len(self.counts) >= self.k else 0
+
+    def top(self, n=None):
+        """Returns a list of (item, count, error) tuples from the highest to the lowest count."""
+        items = sorted(self.counts.items(), key=lambda pair: pair[1], reverse=True)[:n]
+        return [(item, count, self.errors[item]) for item, count in items]
+
+    def merge(self, other):
+        """
+        Adds the items of other. Items missing from a summary that is full are given its lowest count, which is also
+        added to their errors, so counts stay upper bounds.
+        """
+        self_min, other_min = self.min_count(), other.min_count()
+        counts = {}
+        errors = {}
+
+        for item in set(self.counts) | set(other.counts):
+            counts[item] = self.counts.get(item, self_min) + other.counts.get(item, other_min)
+            errors[item] = self.errors.get(item, self_min) + other.errors.get(item, other_min)
+
+        kept = heapq.nlargest(self.k, counts, key=counts.get)
+        self.counts = {item: counts[item] for item in kept}
+        self.errors = {item: errors[item] for item in kept}
+        self.heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self.heap)
+        return self
+
+
+class HyperLogLog:
+    """
+    Approximate number of different items.
+
+    Arguments:
+        precision: number of hash bits used to pick a register. Uses 2 ** precision bytes.
+    """
+
+    def __init__(self, precision=14):
+        if not 4 <= precision <= 18:
+            raise CorpusError('HyperLogLog precision must be between 4 and 18')
+
+        self.precision = precision
+        self.registers = bytearray(2 ** precision)
+
+    def add(self, item, h=None):
+        """Adds item. h is the item_hash() of item, if it has been worked out already."""
+        h = item_hash(item) if h is None else h
+        bits = 64 - self.precision
+        register = h >> bits
+        rest = h & ((1 << bits) - 1)
+        # Position of the first 1 bit in the rest of the hash
+        rank = bits - rest.bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def count(self):
+        """Returns the estimated number of different items added."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        zeros = self.registers.count(0)
+        # Small numbers of items are counted more accurately from the empty registers
+        if estimate <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return estimate
+
+    def __len__(self):
+        return round(self.count())
+
+    def merge(self, other):
+        """Adds the items of other, which must have the same precision."""
+        if self.precision != other.precision:
+            raise CorpusError('Only HyperLogLogs of the same precision can be merged')
+
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+
+class FrequencySketch:
+    """
+    Frequencies, most frequent items and number of different items of a distribution, in fixed memory.
+
+    Example:
+        >>> fs = FrequencySketch()
+        >>> for word in ['the', 'cat', 'the']:
+        ...     fs.add(word)
+        >>> fs['the'], fs.types(), fs.total
+        (2, 2, 3)
+
+    Keyword arguments:
+        width: width of the CountMinSketch
+        depth: depth of the CountMinSketch
+        top_k: number of items kept by the SpaceSaving summary
+        precision: precision of the HyperLogLog
+    """
+
+    def __init__(self, width=2 ** 20, depth=4, top_k=1000, precision=14):
+        self.counts = CountMinSketch(width, depth)
+        self.heavy_hitters = SpaceSaving(top_k)
+        self.distinct = HyperLogLog(precision)
+
+    @property
+    def total(self):
+        """Number of items added."""
+        return self.counts.total
+
+    def add(self, item, count=1):
+        """Adds count to the frequency of item."""
+        h = item_hash(item)
+        self.counts.add(item, count, h)
+        self.heavy_hitters.add(item, count)
+        self.distinct.add(item, h)
+
+    def update(self, items):
+        """Adds every item in items."""
+        for item in items:
+            self.add(item)
+        return self
+
+    def __getitem__(self, item):
+        """Returns the estimated frequency of item."""
+        return self.counts[item]
+
+    def most_common(self, n=None):
+        """Returns a list of (item, estimated frequency) tuples of the most frequent items."""
+        return [(item, count) for item, count, error in self.heavy_hitters.top(n)]
+
+    def types(self):
+        """Returns the estimated number of different items."""
+        return len(self.distinct)
+
+    def merge(self, other):
+        """Adds the counts of other, which must have been made with the same sizes."""
+        self.counts.merge(other.counts)
+        self.heavy_hitters.merge(other.heavy_hitters)
+        self.distinct.merge(other.distinct)
+        return self
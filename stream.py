@@ -0,0 +1,146 @@
+"""
+Tagging CLAWS tagged text read from a stream, e.g. when claws2biber.py is used as a filter:
+
+    zcat Minicore.txt.gz | python3 claws2biber.py - > Minicore.tec
+
+Text is parsed in chunks ending at sentence boundaries and every chunk is written as soon as it is parsed, so input
+of any length is tagged in bounded memory.
+
+Input without sentence tags, e.g. raw CLAWS output, is one long sentence. Text().parse_long_sent() splits sentences
+longer than max_sent_length after tokens with a sentence-final tag, so once a sentence is that long a sentence
+delimiter is added after those tokens, which splits it the same way and gives the chunks places to end. Chunks that
+still have no sentence boundary, e.g. when max_sent_length is 0, are cut after max_chunk_lines lines, and the tags of
+the tokens near the cut can then differ from those of the whole text.
+"""
+
+import re
+from collections import Counter
+
+from text import Text
+
+
+def tag_stream(lines, out, doc_separator=None, chunk_lines=10000, max_chunk_lines=None, keep_claws=True,
+               name='<stdin>', **text_kwargs):
+    """
+    Tags the CLAWS tagged text in lines and writes it to out in the format saved by Text().write(), with one token
+    per line. Returns (number of documents, totals of Text().long_sent_counts).
+
+    Example:
+        >>> import sys
+        >>> tag_stream(sys.stdin, sys.stdout, doc_separator='<doc>')
+
+    Arguments:
+        lines: iterable of lines of CLAWS tagged text, e.g. a file object
+        out: file object the tagged text is written to
+
+    Keyword arguments:
+        doc_separator: if given, lines that are equal to this string once stripped end a document. Every document
+        is parsed as a separate text starting at header_end, and the separator is written after its tagged text.
+        chunk_lines: number of lines read before parsing, rounded up to the next sentence boundary
+        max_chunk_lines: number of lines after which a chunk is parsed even if it has no sentence boundary.
+        4 * chunk_lines if None.
+        keep_claws: retains claws tag if True
+        name: file name given to the texts
+        **text_kwargs: passed to Text()
+    """
+    sentence_delimiter = text_kwargs.get('sentence_delimiter', Text('', text='').sentence_delimiter)
+    # Lines ending in a sentence delimiter end a sentence, so the text can be split after them
+    sentence_end = re.compile('(?:{0})\\s*$'.format(sentence_delimiter))
+    boundary = re.compile(sentence_delimiter)
+    max_chunk_lines = max_chunk_lines or 4 * chunk_lines
+    long_sent_counts = Counter()
+    documents = 0
+
+    # Long sentences are split by adding sentence_break after their tokens with a sentence-final tag. Not done if the
+    # sentence delimiter doesn't match sentence_break, or if header_end counts sentences that this would change.
+    max_sent_length = text_kwargs.get('max_sent_length', 1000)
+    sentence_break = '\n</s>\n'
+    can_break = bool(max_sent_length) and boundary.fullmatch(sentence_break) is not None and \
+        not text_kwargs.get('header_end')
+    final_token = re.compile('(?<!\\S)\\S*{0}(?:{1})(?!\\S)'.format(
+        re.escape(text_kwargs.get('word_tag_delimiter', '_')),
+        '|'.join(re.escape(tag) for tag in sorted(Text.sentence_final_tags))))
+
+    def add_breaks(line, head=True, tail=True):
+        """
+        Adds sentence_break after the sentence-final tokens of line before its first sentence boundary if head is
+        True and after its last one if tail is True. Lines without a boundary are one part.
+        """
+        def split(part):
+            return final_token.sub(lambda match: match.group(0) + sentence_break, part)
+
+        matches = list(boundary.finditer(line))
+        if not matches:
+            return split(line) if head or tail else line
+
+        first, last = matches[0].start(), matches[-1].end()
+        return (split(line[:first]) if head else line[:first]) + line[first:last] + \
+            (split(line[last:]) if tail else line[last:])
+
+    def parse(chunk, first):
+        kwargs = text_kwargs if first else dict(text_kwargs, header_end=0)
+        text = Text(name, text=''.join(chunk), **kwargs)
+        tagged = text.tagged_text(keep_claws=keep_claws)
+        long_sent_counts.update(text.long_sent_counts)
+
+        if tagged:
+            out.write(tagged + '\n')
+            out.flush()
+
+    chunk = []
+    first = True
+    in_document = False
+    # Tokens of the sentence that is not ended yet, the index of the chunk line it starts in, and whether it is long
+    sent_tokens = 0
+    sent_start = 0
+    in_long_sent = False
+
+    for line in lines:
+        if doc_separator is not None and line.strip() == doc_separator:
+            parse(chunk, first)
+            out.write(doc_separator + '\n')
+            out.flush()
+            documents += 1
+            chunk = []
+            first = True
+            in_document = False
+            sent_tokens = sent_start = 0
+            in_long_sent = False
+            continue
+
+        if can_break:
+            parts = boundary.split(line)
+
+            if len(parts) > 1:
+                # The long sentence ends in this line
+                if in_long_sent:
+                    line = add_breaks(line, tail=False)
+                sent_tokens = len(parts[-1].split())
+                sent_start = len(chunk)
+                in_long_sent = False
+            else:
+                sent_tokens += len(parts[0].split())
+
+            if in_long_sent:
+                line = add_breaks(line)
+            elif sent_tokens > max_sent_length:
+                in_long_sent = True
+                if sent_start < len(chunk):
+                    chunk[sent_start] = add_breaks(chunk[sent_start], head=False)
+                    chunk[sent_start + 1:] = [add_breaks(chunk_line) for chunk_line in chunk[sent_start + 1:]]
+                line = add_breaks(line, head=len(parts) == 1)
+
+        chunk.append(line)
+        in_document = True
+
+        if len(chunk) >= chunk_lines and sentence_end.search(line) or len(chunk) >= max_chunk_lines:
+            parse(chunk, first)
+            chunk = []
+            first = False
+            sent_start = 0
+
+    if in_document:
+        parse(chunk, first)
+        documents += 1
+
+    return documents, long_sent_counts
@@ -0,0 +1,243 @@
+"""
+Telemetry of conversion and query runs.
+
+A RunReport collects the throughput of a run (files, tokens and bytes per second), the time taken by every file with
+the slowest files, the time spent in every parser stage, the hit rate of the type cache (see type_cache.py) and the
+errors. Corpus().convert(..., report=True) and claws2biber.py save it next to the new corpus, e.g. as
+/corpora/Minicore-BT.report.json.
+
+With a Prometheus textfile, e.g. one read by the textfile collector of node_exporter, the metrics are also saved while
+the run goes on, at most every refresh_every seconds, and once more when it ends:
+
+    python3 claws2biber.py /corpora/Minicore /corpora/Minicore-BT --prometheus biber_tagger.prom
+
+Example:
+    >>> report = RunReport('convert')
+    >>> report.add_file('a.txt', seconds=0.5, tokens=1200, bytes_in=9000, bytes_out=30000)
+    >>> report.finish()
+    >>> report.summary()['tokens_per_second']
+"""
+
+import heapq
+import json
+from array import array
+from collections import Counter
+from os import replace
+from threading import Lock
+from time import time, monotonic
+
+# Version of the report format
+REPORT_VERSION = 1
+
+
+def report_path(new_folder, shard=None):
+    """Returns the path of the run report of a corpus converted to new_folder, or of a shard of it."""
+    new_folder = new_folder.rstrip('/\\')
+
+    if shard is None:
+        return new_folder + '.report.json'
+
+    # Not named like the manifests of shards, which are found with a glob of .shard-*-of-*.json
+    return '{0}.report.shard-{1}-of-{2}.json'.format(new_folder, *shard)
+
+
+def percentile(values, p):
+    """Returns the value at fraction p of the sorted list values."""
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+class RunReport:
+    """
+    Collects the stats of a run. Methods can be called from several threads.
+
+    Arguments:
+        kind: name of the run, e.g. 'convert', 'count_features' or 'find'
+
+    Keyword arguments:
+        slowest_n: number of slowest files listed in the report
+        prometheus_file: if given, the metrics are saved to this file in the Prometheus text format as the run goes on
+        refresh_every: least number of seconds between two saves of prometheus_file
+        **info: more items saved in the report, e.g. the corpus folder
+    """
+
+    def __init__(self, kind, slowest_n=10, prometheus_file=None, refresh_every=15, **info):
+        self.kind = kind
+        self.slowest_n = slowest_n
+        self.prometheus_file = prometheus_file
+        self.refresh_every = refresh_every
+        self.info = info
+
+        self.lock = Lock()
+        self.refresh_lock = Lock()
+        self.started = time()
+        self.started_monotonic = monotonic()
+        self.finished = None
+        self.seconds = None
+        self.last_refresh = None
+
+        self.counts = Counter()
+        self.file_seconds = array('d')
+        # Min-heap of (seconds, file name) of the slowest files
+        self.slowest = []
+        self.parser_seconds = Counter()
+        self.cache = Counter()
+        self.errors = []
+        self.stats = {}
+
+    def add_file(self, file_name, seconds=None, tokens=0, bytes_in=0, bytes_out=0, parser_seconds=None,
+                 cache_hits=0, cache_misses=0):
+        """
+        Adds a file. seconds is the time taken to parse it, or None if it wasn't parsed, e.g. for a duplicate whose
+        tagged text was copied.
+        """
+        with self.lock:
+            self.counts['files'] += 1
+            self.counts['tokens'] += tokens
+            self.counts['bytes_in'] += bytes_in
+            self.counts['bytes_out'] += bytes_out
+            self.cache['hits'] += cache_hits
+            self.cache['misses'] += cache_misses
+
+            if parser_seconds:
+                self.parser_seconds.update(parser_seconds)
+
+            if seconds is not None:
+                self.counts['parsed_files'] += 1
+                self.file_seconds.append(seconds)
+                entry = (seconds, file_name)
+                if len(self.slowest) < self.slowest_n:
+                    heapq.heappush(self.slowest, entry)
+                elif self.slowest and entry > self.slowest[0]:
+                    heapq.heapreplace(self.slowest, entry)
+
+        self.refresh()
+
+    def add_bytes_out(self, bytes_out):
+        """Adds bytes written after the file was added, e.g. by a writer thread."""
+        with self.lock:
+            self.counts['bytes_out'] += bytes_out
+
+    def add_error(self, file_name, error):
+        """Adds an error raised while file_name was processed."""
+        with self.lock:
+            self.errors.append({'file': file_name, 'error': '{0}: {1}'.format(type(error).__name__, error)})
+        self.refresh()
+
+    def add_stats(self, **stats):
+        """Adds items saved under 'stats' in the report, e.g. long_sent_counts or the number of duplicates."""
+        with self.lock:
+            self.stats.update(stats)
+
+    def finish(self):
+        """Records the end of the run."""
+        self.finished = time()
+        self.seconds = monotonic() - self.started_monotonic
+        self.refresh(force=True)
+
+    def summary(self):
+        """Returns the report as a dict."""
+        with self.lock:
+            seconds = self.seconds if self.seconds is not None else monotonic() - self.started_monotonic
+            file_seconds = sorted(self.file_seconds)
+            counts = dict(self.counts)
+            slowest = sorted(self.slowest, reverse=True)
+            parser_seconds = self.parser_seconds.most_common()
+            cache = dict(self.cache)
+            errors = list(self.errors)
+            stats = dict(self.stats)
+
+        lookups = cache.get('hits', 0) + cache.get('misses', 0)
+        per_second = max(seconds, 1e-9)
+
+        return {
+            'version': REPORT_VERSION,
+            'kind': self.kind,
+            'status': 'running' if self.finished is None else ('failed' if errors else 'finished'),
+            'started': self.started,
+            'finished': self.finished,
+            'seconds': seconds,
+            'files': counts.get('files', 0),
+            'parsed_files': counts.get('parsed_files', 0),
+            'tokens': counts.get('tokens', 0),
+            'bytes_in': counts.get('bytes_in', 0),
+            'bytes_out': counts.get('bytes_out', 0),
+            'files_per_second': counts.get('files', 0) / per_second,
+            'tokens_per_second': counts.get('tokens', 0) / per_second,
+            'bytes_per_second': counts.get('bytes_in', 0) / per_second,
+            'file_seconds': {
+                'mean': sum(file_seconds) / len(file_seconds) if file_seconds else 0.0,
+                'p50': percentile(file_seconds, 0.5),
+                'p90': percentile(file_seconds, 0.9),
+                'p99': percentile(file_seconds, 0.99),
+                'max': file_seconds[-1] if file_seconds else 0.0,
+            },
+            'slowest_files': [{'file': file_name, 'seconds': s} for s, file_name in slowest],
+            'parser_seconds': dict(parser_seconds),
+            'type_cache': {'hits': cache.get('hits', 0), 'misses': cache.get('misses', 0),
+                           'hit_rate': cache.get('hits', 0) / lookups if lookups else 0.0},
+            'error_count': len(errors),
+            'errors': errors,
+            'stats': stats,
+            'info': self.info,
+        }
+
+    def save(self, file_name):
+        """Saves the report as JSON. The file is replaced in one step."""
+        tmp_file = file_name + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=1)
+        replace(tmp_file, file_name)
+
+    def refresh(self, force=False):
+        """Saves the Prometheus textfile if it is set and refresh_every seconds have gone by since the last save."""
+        if self.prometheus_file is None:
+            return
+
+        # Threads that find another thread saving the file don't wait for it
+        if not self.refresh_lock.acquire(blocking=force):
+            return
+
+        try:
+            now = monotonic()
+            if force or self.last_refresh is None or now - self.last_refresh >= self.refresh_every:
+                self.last_refresh = now
+                self.save_prometheus(self.prometheus_file)
+        finally:
+            self.refresh_lock.release()
+
+    def prometheus_lines(self):
+        """Returns the metrics of the run in the Prometheus text format."""
+        summary = self.summary()
+        run = 'run="{0}"'.format(self.kind)
+        lines = []
+
+        def metric(name, metric_type, help_text, values):
+            lines.append('# HELP biber_tagger_{0} {1}'.format(name, help_text))
+            lines.append('# TYPE biber_tagger_{0} {1}'.format(name, metric_type))
+            for labels, value in values:
+                lines.append('biber_tagger_{0}{{{1}}} {2}'.format(name, ','.join((run,) + labels), float(value)))
+
+        metric('files_total', 'counter', 'Files processed.', [((), summary['files'])])
+        metric('tokens_total', 'counter', 'Tokens parsed.', [((), summary['tokens'])])
+        metric('bytes_in_total', 'counter', 'Bytes of input read.', [((), summary['bytes_in'])])
+        metric('bytes_out_total', 'counter', 'Bytes of output written.', [((), summary['bytes_out'])])
+        metric('errors_total', 'counter', 'Files that failed.', [((), summary['error_count'])])
+        metric('run_seconds', 'gauge', 'Seconds since the run started.', [((), summary['seconds'])])
+        metric('files_per_second', 'gauge', 'Files processed per second.', [((), summary['files_per_second'])])
+        metric('tokens_per_second', 'gauge', 'Tokens parsed per second.', [((), summary['tokens_per_second'])])
+        metric('file_seconds', 'gauge', 'Seconds taken to parse a file.',
+               [(('quantile="{0}"'.format(quantile),), summary['file_seconds'][key])
+                for key, quantile in (('p50', '0.5'), ('p90', '0.9'), ('p99', '0.99'))])
+        metric('parser_seconds_total', 'counter', 'Seconds spent in each parser stage.',
+               [(('parser="{0}"'.format(name),), s) for name, s in summary['parser_seconds'].items()])
+        metric('type_cache_hit_ratio', 'gauge', 'Hit rate of the word type cache.',
+               [((), summary['type_cache']['hit_rate'])])
+
+        return lines
+
+    def save_prometheus(self, file_name):
+        """Saves the metrics in the Prometheus text format. The file is replaced in one step, as collectors expect."""
+        tmp_file = file_name + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.prometheus_lines()) + '\n')
+        replace(tmp_file, file_name)
@@ -1,14 +1,19 @@
+import json
 from itertools import chain
 from re import split
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from types import MethodType
+from time import perf_counter
 
-import lexicon as lx
-import claws_replacements as cr
-import tag_match as tagm
-import token_match as tokm
-import token_tag_match as toktagm
+import lexicon_cache
+from type_cache import TypeCache, WordType
+from archive import read_text_file
 from errors import TextError
 
+# Lexicon and rule tables compiled from lexicon.py, lexicon_index.py, tag_match.py, token_match.py,
+# token_tag_match.py, claws_replacements.py and features.py. See lexicon_cache.py.
+tables = lexicon_cache.load()
+
 
 class Text:
     """
@@ -26,6 +31,17 @@ class Text:
         the text to be converted starting at line 1.
         sentence_delimiter: regular expression used to split by sentence
         word_tag_delimiter: string used to separate tokens from tags
+        parsers: names of the parser stages to run. All stages in parser_stages are run if None.
+        disabled_parsers: names of parser stages that will not be run
+        fields: indices of the Biber tag fields that are needed in the output. Stages that cannot change any of
+        these fields, either by writing to them or by writing to fields read by stages that do, are skipped. All
+        stages are run if None.
+        text: CLAWS tagged text as a string. If given, it is used instead of reading the file located at filepath.
+        max_sent_length: sentences with more tokens than this, e.g. whole files without <s> tags, are split at
+        sentence-final punctuation and then parsed in overlapping windows of this many tokens. Not done if None or 0.
+        sent_window_overlap: number of tokens of context on each side of a window. Must be less than half of
+        max_sent_length.
+        time_parsers: if True, the seconds spent in each parser stage are added up in self.parser_seconds
     """
 
     parser_config = {
@@ -36,19 +52,79 @@ class Text:
     # Determines how many tag fields there will be in Biber tag output
     tag_field_n = 6
 
+    # Parser stages that can be applied to every sentence by Text().parse(). Stages are run in the order they are
+    # listed here unless their settings require otherwise. Use Text.register_parser() to add new stages.
+    #
+    # Format:
+    #
+    #   name: {'parser': method name or function, 'after': (stage names, ...), 'requires': (stage names, ...),
+    #          'fields': (Biber tag field indices, ...) or None, 'reads': (Biber tag field indices, ...) or None,
+    #          'position': 'first', 'last' or None}
+    #
+    #   parser: name of a Text method or a function taking (text, sent) and returning sent
+    #   after: stages that must be run before this stage when they are enabled
+    #   requires: stages that are always enabled when this stage is enabled
+    #   fields: Biber tag fields the stage can write to. None means it changes what every later stage sees.
+    #   reads: Biber tag fields written by other stages that the stage reads, so that what it writes depends on
+    #          them. None means it can read every field, e.g. basic_matcher, which only tags tokens whose fields
+    #          are all still empty.
+    #   position: 'first' and 'last' stages run before and after all other stages
+    parser_stages = OrderedDict([
+        ('replace_in_claws', {'parser': 'replace_in_claws', 'after': (), 'requires': (), 'fields': None, 'reads': (),
+                              'position': 'first'}),
+        ('extraposition', {'parser': 'extraposition', 'after': (), 'requires': (), 'fields': (0, 1, 2, 3, 4),
+                           'reads': (), 'position': None}),
+        ('phrasal_verbs', {'parser': 'phrasal_verbs', 'after': (), 'requires': (), 'fields': (0, 1), 'reads': (),
+                           'position': None}),
+        ('passives', {'parser': 'passives', 'after': (), 'requires': ('replace_in_claws',), 'fields': (0, 1, 2, 3, 4),
+                      'reads': (), 'position': None}),
+        ('proper_nouns', {'parser': 'proper_nouns', 'after': (), 'requires': (), 'fields': (0,), 'reads': (),
+                          'position': None}),
+        ('modal_types', {'parser': 'modal_types', 'after': (), 'requires': (), 'fields': (0, 1, 2, 4), 'reads': (),
+                         'position': None}),
+        ('conjunction_types', {'parser': 'conjunction_types', 'after': (), 'requires': (), 'fields': (0, 1, 2, 3, 4),
+                               'reads': (0, 1, 2, 4), 'position': None}),
+        ('adverb_types', {'parser': 'adverb_types', 'after': (), 'requires': (), 'fields': (0, 3), 'reads': (),
+                          'position': None}),
+        ('noun_types', {'parser': 'noun_types', 'after': (), 'requires': (), 'fields': (2, 3), 'reads': (),
+                        'position': None}),
+        ('basic_matcher', {'parser': 'basic_matcher', 'after': (), 'requires': (), 'fields': (0, 1, 2, 3, 4),
+                           'reads': None, 'position': 'last'}),
+    ])
+
     # dicts with lexical and tag information used in methods
-    lexicon_dict = lx.lexicon
-    token_match_dict = tokm.token_match
-    tag_match_dict = tagm.tag_match
-    token_tag_match_dict = toktagm.token_tag_match
-    claws_replacements_dict = cr.replacements
+    lexicon_dict = tables['lexicon']
+    # lowercase word -> bitmask of the lexicon categories it is in, and lexicon category -> bit
+    lexicon_index = tables['lexicon_index']
+    lexicon_bits = tables['lexicon_bits']
+    token_match_dict = tables['token_match']
+    tag_match_dict = tables['tag_match']
+    token_tag_match_dict = tables['token_tag_match']
+    claws_replacements_dict = tables['claws_replacements']
+    feature_dict = tables['features']
+
+    # TypeCache of the features of (word, CLAWS tag) pairs shared by every Text. Made below the class definition.
+    type_cache = None
+
+    # Number of padding tokens added to both ends of every sentence given to the parsers, so that parsers can look
+    # at sent[i - 2] or sent[i + 9] without checking the length of the sentence. Padding tokens have an empty word,
+    # a tag that no rule matches, and Biber tag fields that can't be changed. Parsers only tag the tokens in
+    # range(self.sent_padding, len(sent) - self.sent_padding).
+    sent_padding = 10
+    padding_token = ('', '<pad>', ('',) * tag_field_n)
+    padding_word_type = WordType('', 0, None, None)
+
+    # CLAWS tags of the tokens sentences longer than max_sent_length are split after
+    sentence_final_tags = frozenset(('.', '?', '!'))
 
     def __init__(self, filepath, register='written', input_encoding='UTF-8', input_open_errors='ignore',
                  lowercase=False,
-                 header_end=0, sentence_delimiter='\n?</?s>\n?', word_tag_delimiter='_'):
+                 header_end=0, sentence_delimiter='\n?</?s>\n?', word_tag_delimiter='_', parsers=None,
+                 disabled_parsers=(), fields=None, text=None, max_sent_length=1000, sent_window_overlap=50,
+                 time_parsers=False):
 
         # Makes the list of parsers that will be used on the input text
-        self.set_parsers()
+        self.set_parsers(parsers, disabled_parsers, fields)
 
         # register is not used for anything yet
         self.register = register
@@ -59,20 +135,102 @@ class Text:
         self.header_end = header_end
         self.sentence_delimiter = sentence_delimiter
         self.word_tag_delimiter = word_tag_delimiter
-        self.open()
+
+        # Parsing long sentences in bounded pieces keeps parsing time linear in the length of the text
+        if max_sent_length and 2 * sent_window_overlap >= max_sent_length:
+            raise TextError('sent_window_overlap must be less than half of max_sent_length')
+
+        self.max_sent_length = max_sent_length
+        self.sent_window_overlap = sent_window_overlap
+        # Number of sentences longer than max_sent_length, the pieces they were split into at sentence-final
+        # punctuation, and the windows parsed. Updated by self.parse().
+        self.long_sent_counts = OrderedDict([('long_sentences', 0), ('split_sentences', 0), ('windows', 0)])
+        # Seconds spent in each parser stage if time_parsers is True. Updated by self.parse().
+        self.parser_seconds = OrderedDict((name, 0.0) for name in self.parser_names) if time_parsers else None
+
+        if text is None:
+            self.open()
+        else:
+            self.text = text
+            self.make_sents()
+
+    @classmethod
+    def from_string(cls, text, filepath='<string>', **kwargs):
+        """
+        Returns a Text made from CLAWS tagged text in a string, without reading or writing any files.
+
+        Example:
+            >>> t = Text.from_string('<s> It_PPH1 was_VBDZ written_VVN ._. </s>')
+
+        Arguments:
+            text: CLAWS tagged text
+
+        Keyword arguments:
+            filepath: name given to the text
+            **kwargs: passed to Text()
+        """
+        return cls(filepath, text=text, **kwargs)
+
+    @classmethod
+    def from_bytes(cls, data, filepath='<bytes>', **kwargs):
+        """
+        Returns a Text made from CLAWS tagged text in bytes, decoded with the input_encoding and input_open_errors
+        keyword arguments.
+
+        Example:
+            >>> t = Text.from_bytes(b'<s> It_PPH1 was_VBDZ written_VVN ._. </s>', input_encoding='ascii')
+        """
+        text = data.decode(kwargs.get('input_encoding', 'UTF-8'), kwargs.get('input_open_errors', 'ignore'))
+        return cls(filepath, text=text, **kwargs)
+
+    @classmethod
+    def from_sents(cls, sents, filepath='<sents>', **kwargs):
+        """
+        Returns a Text made from sentences that have already been tokenized.
+
+        Example:
+            >>> t = Text.from_sents([[('It', 'PPH1'), ('was', 'VBDZ'), ('written', 'VVN'), ('.', '.')]])
+
+        Arguments:
+            sents: iterable of sentences, each an iterable of (token, CLAWS tag) pairs
+
+        Keyword arguments:
+            filepath: name given to the text
+            **kwargs: passed to Text(). Keyword arguments about splitting the text into sentences and tokens are not
+            used.
+        """
+        text = cls(filepath, text='', **kwargs)
+        text.sents = []
+
+        for sent in sents:
+            sent = [[token.lower() if text.lowercase else token, tag] for token, tag in sent]
+            if sent:
+                text.sents.append(sent)
+
+        return text
 
     def open(self):
-        """Makes the self.text string and the self.sents list"""
-        with open(self.filepath, encoding=self.input_encoding, errors=self.input_open_errors) as f:
-            self.text = f.read()
+        """Makes the self.text string and the self.sents list. Files ending in .gz are decompressed."""
+        self.text = read_text_file(self.filepath, self.input_encoding, self.input_open_errors)
+
+        self.make_sents()
 
+    def make_sents(self):
+        """Makes the self.sents list from the self.text string"""
         if self.lowercase:
             self.text = self.text.lower()
 
-        self.sents = []
-        sents = split(self.sentence_delimiter, self.text)[self.header_end:]
+        self.sents = self.tokenize_sents(self.split_sents(self.text))
 
-        for sent in sents:
+    def split_sents(self, text):
+        """Returns the sentence strings in the CLAWS tagged text text, starting at self.header_end."""
+        return split(self.sentence_delimiter, text)[self.header_end:]
+
+    def tokenize_sents(self, raw_sents):
+        """Returns a list of sentences, each a list of [token, tag] lists, made from the sentence strings raw_sents."""
+        sents = []
+
+        for sent in raw_sents:
             sent = sent.strip()
 
             if sent:
@@ -95,26 +253,144 @@ class Text:
 
                     sent_as_list.append([token, tag])
 
-                self.sents.append(sent_as_list)
-
-    def set_parsers(self):
-        """The methods in this list will be applied to every sentence in the text when Text().parse() is called."""
-        self.parsers = [self.replace_in_claws,
-                        self.extraposition,
-                        self.phrasal_verbs,
-                        self.passives,
-                        self.proper_nouns,
-                        self.modal_types,
-                        self.conjunction_types,
-                        self.adverb_types,
-                        self.noun_types,
-                        self.basic_matcher]
+                sents.append(sent_as_list)
+
+        return sents
+
+    def set_parsers(self, parsers=None, disabled_parsers=(), fields=None):
+        """
+        Makes self.parsers, the list of methods that will be applied to every sentence in the text when
+        Text().parse() is called.
+
+        Keyword arguments:
+            parsers: names of the stages in self.parser_stages to run. All stages are run if None.
+            disabled_parsers: names of stages that will not be run
+            fields: indices of the Biber tag fields needed in the output. Stages are skipped unless their 'fields'
+            include one of these or a field in the 'reads' of another stage that is not skipped, or another stage
+            requires them.
+
+        Example:
+            Only tags passives and modals
+            >>> t = Text('some_file.cls', parsers=['passives', 'modal_types'])
+        """
+        stages = self.parser_stages
+        names = list(stages) if parsers is None else list(parsers)
+
+        unknown = [name for name in chain(names, disabled_parsers) if name not in stages]
+        if unknown:
+            raise TextError('Unknown parser stage(s): ' + ', '.join(unknown))
+
+        enabled = [name for name in names if name not in disabled_parsers]
+
+        if fields is not None:
+            # Stages can change the needed fields through the fields read by the stages kept, so the needed fields
+            # grow until no more stages are kept
+            needed = set(fields)
+            kept = set()
+            changed = True
+            while changed:
+                changed = False
+                for name in enabled:
+                    stage = stages[name]
+                    if name in kept or stage['fields'] is not None and not needed.intersection(stage['fields']):
+                        continue
+                    kept.add(name)
+                    reads = stage.get('reads')
+                    needed.update(range(self.tag_field_n) if reads is None else reads)
+                    changed = True
+
+            enabled = [name for name in enabled if name in kept]
+
+        # Adds stages required by enabled stages
+        i = 0
+        while i < len(enabled):
+            for required in stages[enabled[i]]['requires']:
+                if required in disabled_parsers:
+                    raise TextError('Parser stage {0} requires disabled stage {1}'.format(enabled[i], required))
+                if required not in stages:
+                    raise TextError('Parser stage {0} requires unknown stage {1}'.format(enabled[i], required))
+                if required not in enabled:
+                    enabled.append(required)
+            i += 1
+
+        self.parser_names = self.order_parser_stages(enabled)
+        self.parsers = []
+
+        for name in self.parser_names:
+            parser = stages[name]['parser']
+            if isinstance(parser, str):
+                self.parsers.append(getattr(self, parser))
+            else:
+                self.parsers.append(MethodType(parser, self))
+
+    @classmethod
+    def order_parser_stages(cls, names):
+        """
+        Returns stage names sorted so that 'first' stages come first, 'last' stages come last, and every stage comes
+        after the enabled stages in its 'after' setting. Ties keep the order of cls.parser_stages.
+        """
+        rank = {'first': 0, None: 1, 'last': 2}
+        order = list(cls.parser_stages)
+        names = sorted(set(names), key=order.index)
+        ordered = []
+
+        while names:
+            for name in names:
+                stage = cls.parser_stages[name]
+                waiting = [other for other in names if other != name and
+                           (other in stage['after'] or
+                            rank[cls.parser_stages[other]['position']] < rank[stage['position']])]
+                if not waiting:
+                    ordered.append(name)
+                    names.remove(name)
+                    break
+            else:
+                raise TextError('Parser stages have circular dependencies: ' + ', '.join(names))
+
+        return ordered
+
+    @classmethod
+    def register_parser(cls, name, parser, after=(), requires=(), fields=None, reads=None, position=None):
+        """
+        Adds a parser stage to cls.parser_stages. Registering a stage on a subclass does not change Text.
+
+        Arguments:
+            name: name of the stage
+            parser: name of a method of cls or a function taking (text, sent) and returning sent. sent has
+            text.sent_padding padding tokens at both ends (see Text.sent_padding).
+
+        Keyword arguments:
+            after: names of stages that must run before this one
+            requires: names of stages that must be enabled whenever this one is
+            fields: indices of the Biber tag fields the stage writes to. None if the stage should never be skipped.
+            reads: indices of the Biber tag fields written by other stages that the stage reads. None if it can read
+            any of them.
+            position: 'first' or 'last' to run the stage before or after all other stages
+
+        Example:
+            >>> def dummy_it(text, sent):
+            ...     for word, tag, biber_tags in sent:
+            ...         if word.lower() == 'it':
+            ...             biber_tags[5] = 'IT'
+            ...     return sent
+            >>> Text.register_parser('dummy_it', dummy_it, after=('extraposition',), fields=(5,), reads=())
+        """
+        if position not in ('first', 'last', None):
+            raise TextError("position must be 'first', 'last' or None")
+
+        # Copies the stages so that subclasses don't change the stages of their parent class
+        if 'parser_stages' not in cls.__dict__:
+            cls.parser_stages = OrderedDict(cls.parser_stages)
+
+        cls.parser_stages[name] = {'parser': parser, 'after': tuple(after), 'requires': tuple(requires),
+                                   'fields': None if fields is None else tuple(fields),
+                                   'reads': None if reads is None else tuple(reads), 'position': position}
 
     def tokens(self):
         """Returns a list of lists of tagged tokens without sentence boundaries."""
         return tuple(chain(*self.sents))
 
-    def freq_dist(self, element_i=1, formatting_func=None):
+    def freq_dist(self, element_i=1, formatting_func=None, sketch=None):
         """Returns a dictionary of word or tag frequencies. Returns tags by default.
 
         Keyword arguments:
@@ -122,6 +398,8 @@ class Text:
             Set to 0 for tokens, 1 for tags, or None or False for (token, tag)
             formatting_func: a function used on each item in the frequency distribution. Set to a non-true value if
             no function is wanted (e.g. None, False)
+            sketch: a FrequencySketch (see sketches.py). If given, the items are added to it and it is returned
+            instead of a dictionary, e.g. to add up the frequencies of a large corpus in fixed memory.
 
         Examples:
             Frequency distribution of lowercase tokens:
@@ -131,7 +409,7 @@ class Text:
             >>> t = Text('some_file.cls')
             >>> t.freq_dist(None)
         """
-        fd = defaultdict(int)
+        fd = defaultdict(int) if sketch is None else sketch
 
         for element in self.tokens():
             # determines what the keys in the frequency distribution dictionary are
@@ -140,39 +418,182 @@ class Text:
             elif element_i is None or element_i is False:
                 element = tuple(element)
 
-            # makes the frequency distribution
             if formatting_func:
-                fd[formatting_func(element)] += 1
-            else:
+                element = formatting_func(element)
+
+            # makes the frequency distribution
+            if sketch is None:
                 fd[element] += 1
+            else:
+                sketch.add(element)
 
         return fd
 
+    def feature_counts(self, per=1000, parsed_sents=None):
+        """
+        Returns a dict with the number of tokens in the text and the frequency of every feature in
+        self.feature_dict.
+
+        Keyword arguments:
+            per: frequencies are normalised per this many tokens. Raw counts are returned if per is None or 0.
+            parsed_sents: output of self.parse(). The text is parsed if this is None.
+
+        Example:
+            >>> t = Text('some_file.cls')
+            >>> t.feature_counts()['agentless_passive']
+            3.2
+        """
+        if parsed_sents is None:
+            parsed_sents = self.parse()
+
+        counts = OrderedDict((feature, 0) for feature in self.feature_dict)
+        token_n = 0
+
+        for word, tag, biber_tag in chain(*parsed_sents):
+            token_n += 1
+
+            # Skips tokens without a Biber tag
+            if not [b for b in biber_tag if b]:
+                continue
+
+            for feature, feature_tags in self.feature_dict.items():
+                for bt, ind in feature_tags:
+                    if biber_tag[ind] != bt:
+                        break
+                else:
+                    counts[feature] += 1
+
+        if per and token_n:
+            for feature in counts:
+                counts[feature] = counts[feature] * per / token_n
+
+        result = OrderedDict([('tokens', token_n)])
+        result.update(counts)
+        return result
+
     def parse(self):
-        """Calls the items in self.parsers on every sentence in self.sents."""
+        """
+        Calls the items in self.parsers on every sentence in self.sents and returns the parsed sentences.
+
+        Sentences longer than self.max_sent_length are parsed in pieces (see self.parse_long_sent()).
+        """
         parsed_sents = []
+
         for sent in self.sents:
-            # Adds list that will contain biber tags to each element in sent
-            # If this is done another way, then replace the value of parsed_sent below with copy.deepcopy(sent)
-            # Otherwise parsed_sent will be a pointer to sent, even if [:] is used, because of its embedded lists
-            parsed_sent = tuple(element + [['' for i in range(self.tag_field_n)]] for element in sent)
-            for parser in self.parsers:
+            if self.max_sent_length and len(sent) > self.max_sent_length:
+                parsed_sents.append(self.parse_long_sent(sent))
+            else:
+                parsed_sents.append(self.parse_sent(sent))
+
+        return parsed_sents
+
+    def parse_sent(self, sent):
+        """
+        Calls the items in self.parsers on sent and returns the parsed sentence.
+
+        Parsers are given the sentence with self.sent_padding padding tokens at both ends. These are removed from the
+        sentence that is returned.
+        """
+        padding = (self.padding_token,) * self.sent_padding
+        padding_types = [self.padding_word_type] * self.sent_padding
+
+        # Adds list that will contain biber tags to each element in sent
+        # If this is done another way, then replace the value of parsed_sent below with copy.deepcopy(sent)
+        # Otherwise parsed_sent will be a pointer to sent, even if [:] is used, because of its embedded lists
+        parsed_sent = padding + tuple(element + [['' for i in range(self.tag_field_n)]] for element in sent) + padding
+        # Features of every word type, looked up once for all parsers
+        self.word_types = padding_types + [self.type_cache.get(word, tag) for word, tag in sent] + padding_types
+        self.lex_masks = [word_type.lex_mask for word_type in self.word_types]
+
+        parser_seconds = self.parser_seconds
+
+        for i, parser in enumerate(self.parsers):
+            if parser_seconds is None:
                 parsed_sent = parser(parsed_sent)
+            else:
+                t = perf_counter()
+                parsed_sent = parser(parsed_sent)
+                name = self.parser_names[i]
+                parser_seconds[name] = parser_seconds.get(name, 0.0) + perf_counter() - t
 
-                # Raises exception if tags are not in the right format
-                ps = [ps for ps in parsed_sent if len(ps) != 3]
-                if ps:
-                    error_message = 'Sentence returned by {parser_name} has {n} element(s) that do(es) not have 3 items:' \
-                                    '\n{sent}'.format(parser_name=parser.__name__, n=len(ps), sent=parsed_sent)
+            # Raises exception if tags are not in the right format
+            ps = [ps for ps in parsed_sent if len(ps) != 3]
+            if ps:
+                error_message = 'Sentence returned by {parser_name} has {n} element(s) that do(es) not have 3 items:' \
+                                '\n{sent}'.format(parser_name=parser.__name__, n=len(ps), sent=parsed_sent)
 
-                    raise TextError(error_message)
+                raise TextError(error_message)
 
-            parsed_sents.append(parsed_sent)
+        return parsed_sent[self.sent_padding:len(parsed_sent) - self.sent_padding]
 
-        return parsed_sents
+    def parse_long_sent(self, sent):
+        """
+        Parses a sentence longer than self.max_sent_length and returns it as one parsed sentence.
+
+        The sentence is split after tokens with a tag in self.sentence_final_tags. Pieces that are still longer than
+        self.max_sent_length are parsed in windows: every window tags up to max_sent_length - 2 * sent_window_overlap
+        tokens and also contains sent_window_overlap tokens of context on each side, whose tags are thrown away.
+        """
+        max_length = self.max_sent_length
+        overlap = self.sent_window_overlap
+        step = max_length - 2 * overlap
+        counts = self.long_sent_counts
+        counts['long_sentences'] += 1
+
+        pieces = []
+        start = 0
+        for i, (word, tag) in enumerate(sent):
+            if tag in self.sentence_final_tags:
+                pieces.append(sent[start:i + 1])
+                start = i + 1
+        if start < len(sent):
+            pieces.append(sent[start:])
+
+        if len(pieces) > 1:
+            counts['split_sentences'] += len(pieces)
+
+        parsed_sent = []
+        for piece in pieces:
+            if len(piece) <= max_length:
+                parsed_sent.extend(self.parse_sent(piece))
+                continue
+
+            for core_start in range(0, len(piece), step):
+                window_start = max(0, core_start - overlap)
+                core_end = min(core_start + step, len(piece))
+                parsed_window = self.parse_sent(piece[window_start:core_end + overlap])
+                parsed_sent.extend(parsed_window[core_start - window_start:core_end - window_start])
+                counts['windows'] += 1
+
+        return tuple(parsed_sent)
+
+    @classmethod
+    def make_word_type(cls, word, tag):
+        """Returns a WordType with the features of word with the CLAWS tag tag. Used by cls.type_cache."""
+        lower = word.lower()
+
+        nominalization = None
+        word_len = len(word)
+        for suffix in cls.lexicon_dict['nominalization_suffices']:
+            suff_len = len(suffix)
+            if word_len > suff_len and word[-suff_len:] == suffix and \
+                    ((suff_len >= 3 and word_len > 6) or (suff_len < 3 and word_len > 7)):
+                nominalization = 'PLUR' if word[-1] == 's' else 'SING'
+                break
+
+        basic_match = cls.tag_match_dict.get(tag, False) or cls.token_match_dict.get(lower, False) or \
+            cls.token_tag_match_dict.get((lower, tag), False) or None
+
+        return WordType(lower, cls.lexicon_index.get(lower, 0), nominalization, basic_match)
+
+    def __init_subclass__(cls, **kwargs):
+        """Gives subclasses their own type cache, since they can change the dicts word types are made from."""
+        super().__init_subclass__(**kwargs)
+        if 'type_cache' not in cls.__dict__:
+            cls.type_cache = TypeCache(cls.make_word_type, Text.type_cache.max_size)
 
     @staticmethod
-    def sent_tails(sent, start, tail_length=4, ind=None, entity=None):
+    def sent_tails(sent, start, tail_length=4, ind=None, entity=None, end=None):
         """
         Returns specified number of tokens after an index
 
@@ -186,21 +607,23 @@ class Text:
             ind: an integer representing the index of subitems in sent. sent=0 returns a list of words and sent=1
             returns a list of tags
             entity: a string that determines the value of ind. Value must be "tags" or "words" for it to do anything.
+            end: index where the sentence ends, e.g. where the padding starts in padded sentences. Tails stop at end
+            and negative tail lengths count back from end.
         """
         if entity and entity.lower() == 'tags':
             ind = 1
         elif entity and entity.lower() == 'words':
             ind = 0
 
+        if 0 > tail_length:
+            stop = tail_length if end is None else end + tail_length
+        else:
+            stop = start + 1 + tail_length if end is None else min(start + 1 + tail_length, end)
+
         if ind is not None and ind is not False:
-            if 0 > tail_length:
-                return [elem[ind] for elem in sent[start + 1:tail_length]]
-            else:
-                return [elem[ind] for elem in sent[start + 1:start + 1 + tail_length]]
-        elif 0 > tail_length:
-            return sent[start + 1:tail_length]
+            return [elem[ind] for elem in sent[start + 1:stop]]
         else:
-            return sent[start + 1:start + 1 + tail_length]
+            return sent[start + 1:stop]
 
     def extraposition(self, sent):
         """Finds extraposed clauses
@@ -238,10 +661,18 @@ class Text:
 
         """
 
-        for i, (word, tag, biber_tags) in enumerate(sent):
+        lex_masks = self.lex_masks
+        extraposing_verbs = self.lexicon_bits['extraposing_verbs']
+        extraposed_to_verbs = self.lexicon_bits['extraposed_to_verbs']
+        extraposing_adjectives = self.lexicon_bits['extraposing_adjectives']
+        wh_complementizers = self.lexicon_bits['wh_complementizers']
+        end = len(sent) - self.sent_padding
+
+        for i in range(self.sent_padding, end):
+            word, tag, biber_tags = sent[i]
 
             if word.lower() == 'it':
-                sent_tail = self.sent_tails(sent, i, 7)
+                sent_tail = self.sent_tails(sent, i, 7, end=end)
 
                 # values below will be index of token in sent tail if not None
                 extraposing_adj_verb_match_i = None  # verb coming before adjectival predicate
@@ -253,12 +684,13 @@ class Text:
 
                 for n, (tail_word, tail_tag, _) in enumerate(sent_tail):
                     tail_word = tail_word.lower()
+                    tail_mask = lex_masks[i + n + 1]
                     # matches lexical verbs coming before adjectives extraposed predicates
-                    if tail_word in self.lexicon_dict['extraposing_verbs']:
+                    if tail_mask & extraposing_verbs:
                         extraposing_adj_verb_match_i = n
 
                     # matches with lexical verbs that can control extraposed to-clause - forms of help and take
-                    if tail_word in self.lexicon_dict['extraposed_to_verbs']:
+                    if tail_mask & extraposed_to_verbs:
                         extraposing_verb_to_clause_match_i = n
 
                     # matches lexical 'be'
@@ -282,8 +714,7 @@ class Text:
                         noun_phrase_that_clause_match_i = n
 
                     # matches controlling adjective after verb in corresponding semantic domain is matched
-                    elif extraposing_adj_verb_match_i is not None and tail_word in self.lexicon_dict[
-                        'extraposing_adjectives']:
+                    elif extraposing_adj_verb_match_i is not None and tail_mask & extraposing_adjectives:
                         adj_match_i = n
 
                     # breaks loop if determiner is before controlling adjective
@@ -292,7 +723,7 @@ class Text:
 
                     elif noun_phrase_that_clause_match_i and tail_word == 'that':
                         # breaks if two or less tokens after 'that' -- also rules out possibility of index error in next two statements
-                        if 3 > len(sent) - (i + n + 2):
+                        if 3 > end - (i + n + 2):
                             break
                         # breaks if a verb is immediately after 'that' -- these would be relative clauses with subject gaps
                         elif sent[i + n + 2][1][0] == 'V':
@@ -302,7 +733,7 @@ class Text:
                             break
                         # breaks if word before 'that' is a conjunction
                         elif sent[i + n][1][0] == 'C':
-                            print(' '.join(w for w, t, bt in sent))
+                            print(' '.join(w for w, t, bt in sent[self.sent_padding:end]))
                             break
 
                         # P+IM++3+EXT
@@ -318,7 +749,7 @@ class Text:
                         break
 
                     elif noun_phrase_to_clause_match_i is not None and tail_word == 'to':
-                        extraposed_clause_tags = self.sent_tails(sent, i + n, 6, entity='tags')
+                        extraposed_clause_tags = self.sent_tails(sent, i + n, 6, entity='tags', end=end)
                         # breaks loop if no verb is within six words of the adjective controlling the extraposed clause
                         if [t for t in extraposed_clause_tags if t[0] == 'V']:
                             # dummy it
@@ -335,7 +766,7 @@ class Text:
                     # ends the loop -- either catches or ignores what comes after the adjective
                     elif adj_match_i is not None:
 
-                        extraposed_clause_tags = self.sent_tails(sent, i + n, 6, entity='tags')
+                        extraposed_clause_tags = self.sent_tails(sent, i + n, 6, entity='tags', end=end)
                         apply_tag = False
 
                         # breaks loop if no verb is within six words of the adjective controlling the extraposed clause
@@ -351,7 +782,7 @@ class Text:
 
                             # wh-clause - what, how, where, why, which, whose, whom, and who as clause heads
                             # todo: decide if this should include when, if, whether, or wh-ever words -- is when even possible as a clause head?
-                            elif tail_word in self.lexicon_dict['wh_complementizers']:
+                            elif tail_mask & wh_complementizers:
                                 apply_tag = True
 
                                 # Classifies what type of WH-word the complementizer is
@@ -377,7 +808,7 @@ class Text:
                             # to clause
                             elif tail_word == 'to':
                                 # makes sure to is actually followed by infinitive verb
-                                if i + n + 1 < len(sent) - 1 and sent[i + n + 2][1][-1] == 'I':
+                                if i + n + 1 < end - 1 and sent[i + n + 2][1][-1] == 'I':
                                     apply_tag = True
                                     sent[i + n + 1][2][0] = 'TO'
                                     sent[i + n + 1][2][4] = 'EXT'
@@ -404,13 +835,17 @@ class Text:
         Appends tags to the main verb and particle in phrasal verbs.
         Gap allowed between verb and particle determined by  parser_config['phrasal_verb_range']
         """
-        for i, (word, tag, biber_tags) in enumerate(sent):
+        end = len(sent) - self.sent_padding
+
+        for i in range(self.sent_padding, end):
+            word, tag, biber_tags = sent[i]
 
-            if i + 1 < len(sent) and tag[0] == 'V':
+            if i + 1 < end and tag[0] == 'V':
                 sent_tail_tags = self.sent_tails(sent,
                                                  i,
                                                  tail_length=self.parser_config['phrasal_verb_range'],
-                                                 entity='tags')
+                                                 entity='tags',
+                                                 end=end)
 
                 if 'RP' in sent_tail_tags:
                     # Ensures that tags are not added
@@ -430,8 +865,13 @@ class Text:
         # todo account for VDN (done) and VHN (had) tags
 
         existential_there_ind = None
+        lex_masks = self.lex_masks
+        get_passive_verbs = self.lexicon_bits['get_passive_verbs']
+        vwbn_gt_vpsv = self.lexicon_bits['vwbn_gt_vpsv']
+        end = len(sent) - self.sent_padding
 
-        for i, (word, tag, biber_tags) in enumerate(sent):
+        for i in range(self.sent_padding, end):
+            word, tag, biber_tags = sent[i]
 
             # the presence of existential there is used later to distinguish between a passive yes/no question and
             # a passive post-nominal modifier
@@ -439,11 +879,12 @@ class Text:
                 existential_there_ind = i
 
             # Finds be-verb
-            if tag[:2] == 'VB' or word.lower() in ['get', 'gets', 'got', 'gotten']:
+            if tag[:2] == 'VB' or lex_masks[i] & get_passive_verbs:
                 sent_tail_tags = self.sent_tails(sent,
                                                  i,
                                                  tail_length=self.parser_config['passive_range'],
-                                                 entity='tags')
+                                                 entity='tags',
+                                                 end=end)
 
                 # Finds last participle coming after be-verb
                 if 'VVN' in sent_tail_tags:
@@ -452,8 +893,9 @@ class Text:
 
                     sent_tail_words = self.sent_tails(sent,
                                                       max(main_verb_i),
-                                                      tail_length=len(sent) - max(main_verb_i),
-                                                      entity='words')
+                                                      tail_length=end - max(main_verb_i),
+                                                      entity='words',
+                                                      end=end)
                     post_nominal_modifier = False
 
                     # first two characters in tags between auxilliary verb and first main verb
@@ -487,7 +929,7 @@ class Text:
 
                             # tags as vwbn if the main verb is in a set of words from Longman that occur more frequently
                             # as vwbn than as vpsv
-                            elif sent[main_verb_i[0]][0].lower() in self.lexicon_dict['vwbn_gt_vpsv']:
+                            elif lex_masks[main_verb_i[0]] & vwbn_gt_vpsv:
                                 post_nominal_modifier = True
 
                         else:
@@ -534,7 +976,8 @@ class Text:
                 sent_tail_tags = self.sent_tails(sent,
                                                  i,
                                                  tail_length=self.parser_config['passive_range'],
-                                                 entity='tags')
+                                                 entity='tags',
+                                                 end=end)
                 banned_tags = 'N', 'V'
 
                 if 'VVN' in sent_tail_tags and not [t[0] for t in sent_tail_tags if t[0] in banned_tags and t != 'VVN']:
@@ -549,7 +992,8 @@ class Text:
 
     def proper_nouns(self, sent):
         """Adds Biber tags for proper nouns."""
-        for i, (word, tag, biber_tags) in enumerate(sent):
+        for i in range(self.sent_padding, len(sent) - self.sent_padding):
+            word, tag, biber_tags = sent[i]
 
             if tag == 'NP' or tag == 'NP1':
                 # Sets the first item in the biber tag to the singular proper noun tag
@@ -571,28 +1015,18 @@ class Text:
         proper_nouns() should be added to this eventually, but I haven't put it in so that it can serve as a basic
         example of how Text() works.
         """
-        for i, (word, tag, biber_tag) in enumerate(sent):
+        type_cache = self.type_cache
+
+        for i in range(self.sent_padding, len(sent) - self.sent_padding):
+            word, tag, biber_tag = sent[i]
 
             # only matches if there is not already a biber tag for the word
             if not [b for b in biber_tag if b]:
-                tag_val = self.tag_match_dict.get(tag, False)
+                # the tag might have been changed by replace_in_claws, so the type is looked up with the current tag
+                match = type_cache.get(word, tag).basic_match
 
-                if tag_val:
-                    for bt, ind in tag_val:
-                        sent[i][2][ind] = bt
-                    continue
-
-                token_val = self.token_match_dict.get(word.lower(), False)
-
-                if token_val:
-                    for bt, ind in token_val:
-                        sent[i][2][ind] = bt
-                    continue
-
-                token_tag_val = self.token_tag_match_dict.get((word.lower(), tag), False)
-
-                if token_tag_val:
-                    for bt, ind in token_tag_val:
+                if match:
+                    for bt, ind in match:
                         sent[i][2][ind] = bt
 
         return sent
@@ -600,32 +1034,48 @@ class Text:
 
     def modal_types(self, sent):
         # divides sentences into bigrams
-        sent_bigrams = [[w.lower(), sent[i + 1][0].lower()] for i, (w, t, bt) in enumerate(sent) if i < len(sent) - 1]
+        lowers = [word_type.lower for word_type in self.word_types]
+        sent_bigrams = [[lowers[i], lowers[i + 1]] for i in range(len(sent) - 1)]
+
+        lex_masks = self.lex_masks
+        bits = self.lexicon_bits
+        necessity_modals = bits['necessity_modals']
+        possibility_modals = bits['possibility_modals']
+        prediction_modals = bits['prediction_modals']
+        # first words of multi-word modals
+        necessity_modals_first = bits['necessity_modals.first']
+        possibility_modals_first = bits['possibility_modals.first']
+        prediction_modals_first = bits['prediction_modals.first']
+
+        for i in range(self.sent_padding, len(sent) - self.sent_padding):
+            word, tag, biber_tags = sent[i]
+            mask = lex_masks[i]
+            word = lowers[i]
 
-        for i, (word, tag, biber_tags) in enumerate(sent):
             # checks to see if the modal is in the corresponding lexicon and checks the tags to make sure they are correct
-            if ([word.lower()] in self.lexicon_dict['necessity_modals'] and tag == 'VM') \
-                    or (word.lower() == 'better' and tag[0:2] == 'VV'):
+            if (mask & necessity_modals and tag == 'VM') \
+                    or (word == 'better' and tag[0:2] == 'VV'):
 
                 # tags the words with biber tags
                 sent[i][2][0] = 'VM'
                 sent[i][2][2] = 'NEC'
 
-            elif [word.lower()] in self.lexicon_dict['possibility_modals'] and tag == 'VM':
+            elif mask & possibility_modals and tag == 'VM':
                 sent[i][2][0] = 'VM'
                 sent[i][2][2] = 'POS'
 
-            elif [word.lower()] in self.lexicon_dict['prediction_modals'] and tag == 'VM':
+            elif mask & prediction_modals and tag == 'VM':
                 sent[i][2][0] = 'VM'
                 sent[i][2][2] = 'PRD'
 
-            else:
+            # only words that start a multi-word modal are checked against the multi-word modals in the lexicon
+            elif mask & (necessity_modals_first | possibility_modals_first | prediction_modals_first):
                 # checks bigrams and finds matches in the lexicon
                 for nec_modal in self.lexicon_dict['necessity_modals']:
-                    if (len(nec_modal) > 2 and nec_modal[0] == word.lower() and nec_modal[1:] in sent_bigrams[
+                    if (len(nec_modal) > 2 and nec_modal[0] == word and nec_modal[1:] in sent_bigrams[
                                                                                                  i + 1:i + 3]) \
-                            or (i < len(sent) - 1 and len(nec_modal) == 2 and nec_modal[0] == word.lower() and
-                                nec_modal[1] == sent[i + 1][0].lower() and (sent[i + 1][1] == 'TO')):
+                            or (len(nec_modal) == 2 and nec_modal[0] == word and
+                                nec_modal[1] == lowers[i + 1] and (sent[i + 1][1] == 'TO')):
 
                         # tags the words with biber tags
                         for n in range(len(nec_modal)):
@@ -635,10 +1085,10 @@ class Text:
                             sent[i + n][2][4] = 'MULTI'
 
                 for pos_modal in self.lexicon_dict['possibility_modals']:
-                    if (len(pos_modal) > 2 and pos_modal[0] == word.lower() and pos_modal[1:] in sent_bigrams[
+                    if (len(pos_modal) > 2 and pos_modal[0] == word and pos_modal[1:] in sent_bigrams[
                                                                                                  i + 1:i + 3]) \
-                            or (i < len(sent) - 1 and len(pos_modal) == 2 and pos_modal[0] == word.lower() and
-                                pos_modal[1] == sent[i + 1][0].lower()):
+                            or (len(pos_modal) == 2 and pos_modal[0] == word and
+                                pos_modal[1] == lowers[i + 1]):
 
                         for n in range(len(pos_modal)):
                             # Adds the VM+POS+++MULTI tag to all words in a multi-word modal
@@ -647,10 +1097,10 @@ class Text:
                             sent[i + n][2][4] = 'MULTI'
 
                 for prd_modal in self.lexicon_dict['prediction_modals']:
-                    if (len(prd_modal) > 2 and prd_modal[0] == word.lower() and prd_modal[1:] in sent_bigrams[
+                    if (len(prd_modal) > 2 and prd_modal[0] == word and prd_modal[1:] in sent_bigrams[
                                                                                                  i + 1:i + 3]) \
-                            or (i < len(sent) - 1 and len(prd_modal) == 2 and prd_modal[0] == word.lower() and
-                                prd_modal[1] == sent[i + 1][0].lower()):
+                            or (len(prd_modal) == 2 and prd_modal[0] == word and
+                                prd_modal[1] == lowers[i + 1]):
 
                         for n in range(len(prd_modal)):
                             # Adds the VM+PRD+++MULTI tag to all words in a multi-word modal
@@ -661,18 +1111,30 @@ class Text:
         return sent
     def adverb_types(self, sent):
         # tags splitting adverbs
-        for i, (word, tag, biber_tags) in enumerate(sent):
+        for i in range(self.sent_padding, len(sent) - self.sent_padding):
+            word, tag, biber_tags = sent[i]
             # checks to see if the word is an adverb, if the word preceding is either an auxiliary verb, to- particle, or
             # modal verb and the following word is a lexical verb, then it tags it as a splitting adverb
-            if tag[0] == 'R' and i > 0:
-                if i < len(sent) - 1 and (sent[i + 1][1][0] == 'V') and ('VM' or 'TO' or 'VB' or 'VD' or 'VH'
+            if tag[0] == 'R':
+                if (sent[i + 1][1][0] == 'V') and ('VM' or 'TO' or 'VB' or 'VD' or 'VH'
                 ) in sent[i - 1][1]:
                     sent[i][2][0] = 'R'
                     sent[i][2][3] = 'SPLT'
 
         return sent
     def conjunction_types(self, sent):
-        for i, (word, tag, biber_tags) in enumerate(sent):
+        lex_masks = self.lex_masks
+        bits = self.lexicon_bits
+        adversative_conjunctions = bits['adversative_conjunctions']
+        clausal_coordination_subjects = bits['clausal_coordination_subjects']
+        subordinating_conjunctions_multi_first = bits['subordinating_conjunctions_multi.first']
+        causative_subordinators = bits['causative_subordinators']
+        conditional_subordinators = bits['conditional_subordinators']
+        wh_subordinators = bits['wh_subordinators']
+        concessive_subordinators = bits['concessive_subordinators']
+
+        for i in range(self.sent_padding, len(sent) - self.sent_padding):
+            word, tag, biber_tags = sent[i]
             # if the CLAWS tag is cc then tag it as a coordinating conjunction in the biber tagfield
             if tag == 'CC' or tag == 'CCB':
                 sent[i][2][0] = 'C'
@@ -689,7 +1151,7 @@ class Text:
                 sent[i + 2][2][1] = 'C'
                 sent[i + 2][2][4] = 'MULTI'
             # tags adversative coordinating conjunctions
-            elif sent[i][0].lower() in ['but','yet','nor']:
+            elif lex_masks[i] & adversative_conjunctions:
                 sent[i][2][0] = 'C'
                 sent[i][2][1] = 'C'
                 sent[i][2][3] = 'ADVS'
@@ -713,8 +1175,8 @@ class Text:
                         sent[i + 1][2][2] = 'PHRS'
                 # tags clausal coordination according to Biber's algorithm from his tagger but also takes into account
                 # that commas can come between the two coordinated things
-                if sent[i - 1][2][2] == 'CLP' or (sent[i - 1][2][1] == 'COM' and sent[i + 1][0].lower() in ['it', 'so',
-                        'then', 'you', 'there', 'this', 'these', 'those', 'that', 'I', 'we', 'he', 'she', 'they']):
+                if sent[i - 1][2][2] == 'CLP' or (sent[i - 1][2][1] == 'COM' and
+                                                  lex_masks[i + 1] & clausal_coordination_subjects):
                     sent[i][2][2] = 'CLS'
 
             # checks to see if it tagged as a subordinating conjunction in CLAWS and if so, tags it as such in Biber
@@ -724,8 +1186,9 @@ class Text:
             # goes through all the multiword subordinating conjunctions in the lexicon and if the word matches the first
             # word of an item and the next word matches the second word in a multiword item and the next word matches
             # the third word in a multiword item, then it tags all three words as a multiword subordinating conjunction
-            for items in self.lexicon_dict['subordinating_conjunctions_multi']:
-                if len(items) >  2 and len(sent) > i + 1 :
+            for items in (self.lexicon_dict['subordinating_conjunctions_multi']
+                          if lex_masks[i] & subordinating_conjunctions_multi_first else ()):
+                if len(items) > 2:
                     if items[0] == sent[i][0].lower() and items[1] == sent[i + 1][0] and items[2] == sent[i + 2][0]:
                         sent[i][2][0] = 'C'
                         sent[i][2][1] = 'S'
@@ -737,28 +1200,24 @@ class Text:
                         sent[i + 2][2][1] = 'S'
                         sent[i + 2][2][4] = 'MULTI'
                 # same thing as above except two words instead of three
-                else:
-                    if len(sent) > i + 1:
-                        if items[0] == sent[i][0].lower() and items[1] == sent[i + 1][0]:
-                            sent[i][2][0] = 'C'
-                            sent[i][2][1] = 'S'
-                            sent[i][2][4] = 'MULTI'
-                            sent[i + 1][2][0] = 'C'
-                            sent[i + 1][2][1] = 'S'
-                            sent[i + 1][2][4] = 'MULTI'
+                elif items[0] == sent[i][0].lower() and items[1] == sent[i + 1][0]:
+                    sent[i][2][0] = 'C'
+                    sent[i][2][1] = 'S'
+                    sent[i][2][4] = 'MULTI'
+                    sent[i + 1][2][0] = 'C'
+                    sent[i + 1][2][1] = 'S'
+                    sent[i + 1][2][4] = 'MULTI'
             # tags causative subordinating conjunction by checking if it is CS in CLAWS and in the causative class
-            if tag[0:2] == 'CS' and word.lower() in ['because', 'cuz', 'cos', 'cause']:
+            if tag[0:2] == 'CS' and lex_masks[i] & causative_subordinators:
                 sent[i][2][2] = 'CAUS'
             # tags conditional subordinating conjunction by checking if it is CS in CLAWS and in the conditional class
-            elif tag[0:2] == 'CS' and word.lower() in ['unless', 'if']:
+            elif tag[0:2] == 'CS' and lex_masks[i] & conditional_subordinators:
                 sent[i][2][2] = 'CND'
             # tags wh- subordinating conjunctions by checking if they are CS in CLAWS and are a wh- word
-            elif tag[0:2] == 'CS' and word.lower() in ['what', 'how', 'whether', 'whoever', 'where', 'wherein',
-                                                       'when', 'why', 'whomever', 'whichever', 'wherever', 'whenever',
-                                                       'whatever']:
+            elif tag[0:2] == 'CS' and lex_masks[i] & wh_subordinators:
                 sent[i][2][2] = 'WH'
             # tags concessive subordinating conjunction by checking if it is CS in CLAWS and in the concessive class
-            elif tag[0:2] == 'CS' and word.lower() in ['although', 'though', 'while']:
+            elif tag[0:2] == 'CS' and lex_masks[i] & concessive_subordinators:
                 sent[i][2][2] = 'CONC'
             # tags multiword concessive subordinating conjunctions by checking the tags to see if it the right tag
             # and then checks the words to see if they match those in the concessive class
@@ -769,30 +1228,22 @@ class Text:
         return sent
 
     def noun_types(self, sent):
-        for i, (word, tag, biber_tags) in enumerate(sent):
+        # nominalization suffixes are matched once per word type (see Text.make_word_type())
+        word_types = self.word_types
+
+        for i in range(self.sent_padding, len(sent) - self.sent_padding):
+            word, tag, biber_tags = sent[i]
             if tag[0] == 'N':
-                for suffix in self.lexicon_dict['nominalization_suffices']:
-                    suff_len = len(suffix)
-                    word_len = len(word)
-                    if word_len > suff_len:
-                        if suff_len >= 3 and word_len > 6 and word[-suff_len:] == suffix:
-                            sent[i][2][3] = 'NOM'
-                            if word[-1] == 's':
-                                sent[i][2][2] = 'PLUR'
-                            else:
-                                sent[i][2][2] = 'SING'
-                        if suff_len < 3 and word_len > 7 and word[-suff_len:] == suffix:
-                            sent[i][2][3] = 'NOM'
-                            if word[-1] == 's':
-                                sent[i][2][2] = 'PLUR'
-                            else:
-                                sent[i][2][2] = 'SING'
+                nominalization = word_types[i].nominalization
+                if nominalization:
+                    sent[i][2][3] = 'NOM'
+                    sent[i][2][2] = nominalization
         return sent
 
     def replace_in_claws(self, sent):
         """Replaces claws tags based on dictionary key matches in self.claws_replacements."""
-        for i, (word, tag, biber_tag) in enumerate(sent):
-            sent[i][1] = self.claws_replacements_dict.get(tag, tag)
+        for i in range(self.sent_padding, len(sent) - self.sent_padding):
+            sent[i][1] = self.claws_replacements_dict.get(sent[i][1], sent[i][1])
         return sent
 
     def be_aux_tag(self, word):
@@ -903,21 +1354,66 @@ class Text:
 
             structured ^vpsv++agls+xvbn+ ^VVN
         """
-        parsed_text = self.parse()
+        parsed_text = self.tagged_text(header=header, keep_claws=keep_claws)
+
+        print(file_name)
+
+        with open(file_name, 'w', encoding=encoding, errors=errors) as f:
+            f.write(parsed_text)
+
+    def tagged_text(self, header='', keep_claws=True):
+        """
+        Returns the text with Biber tags added as a string in the format saved by Text().write().
+
+        Keyword arguments:
+            header: string inserted at the beginning of the text
+            keep_claws: retains claws tag if True
+        """
+        return self.serialize(self.parse(), 'tec', header=header, keep_claws=keep_claws)
+
+    @staticmethod
+    def serialize(parsed_sents, output_format='tec', header='', keep_claws=True):
+        """
+        Returns the output of Text().parse() in one of these formats:
+
+            'tec': the string saved by Text().write()
+            'lists': a list of sentences, each a list of [word, CLAWS tag, [Biber tag fields]] lists, e.g. for JSON
+            'json': the 'lists' format as a JSON string
+
+        Example:
+            >>> t = Text.from_string('<s> It_PPH1 was_VBDZ written_VVN ._. </s>')
+            >>> Text.serialize(t.parse(), 'lists')[0][2]
+            ['written', 'VVN', ['VL', '', 'AGLS', '', '', '']]
+
+        Arguments:
+            parsed_sents: sentences returned by Text().parse()
+
+        Keyword arguments:
+            output_format: 'tec', 'lists' or 'json'
+            header: string inserted at the beginning of 'tec' output
+            keep_claws: retains claws tag in 'tec' output if True
+        """
+        if output_format in ('lists', 'json'):
+            lists = [[[word, tag, list(biber_tag)] for word, tag, biber_tag in sent] for sent in parsed_sents]
+            return json.dumps(lists) if output_format == 'json' else lists
+
+        if output_format != 'tec':
+            raise TextError("output_format must be 'tec', 'lists' or 'json'")
 
         if keep_claws:
             line = '{0} ^{1} ^{2}'
             parsed_text = '\n'.join(
-                line.format(word, '+'.join(biber_tag), tag) for word, tag, biber_tag in chain(*parsed_text))
+                line.format(word, '+'.join(biber_tag), tag) for word, tag, biber_tag in chain(*parsed_sents))
         else:
             line = '{0} ^{1}'
             parsed_text = '\n'.join(
-                line.format(word, '+'.join(biber_tag)) for word, tag, biber_tag in chain(*parsed_text))
+                line.format(word, '+'.join(biber_tag)) for word, tag, biber_tag in chain(*parsed_sents))
 
         if header:
             parsed_text = header + '\n' + parsed_text
 
-        print(file_name)
+        return parsed_text
 
-        with open(file_name, 'w', encoding=encoding, errors=errors) as f:
-            f.write(parsed_text)
+
+# Shared by every Text in the process
+Text.type_cache = TypeCache(Text.make_word_type)
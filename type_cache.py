@@ -0,0 +1,72 @@
+"""
+Cache of the features of word types used by Text.
+
+Corpora have far fewer word types than tokens, so everything that only depends on a token and its CLAWS tag is worked
+out once per (word, CLAWS tag) and shared by every Text made in the process.
+"""
+
+from collections import namedtuple
+
+# Features of a (word, CLAWS tag) pair
+#   lower: lowercase word
+#   lex_mask: bitmask of the lexicon categories of the word (see lexicon_index.py)
+#   nominalization: 'SING' or 'PLUR' if the word ends in a nominalization suffix, otherwise None
+#   basic_match: the tag_match, token_match or token_tag_match value used by Text.basic_matcher(), otherwise None
+WordType = namedtuple('WordType', ['lower', 'lex_mask', 'nominalization', 'basic_match'])
+
+
+class TypeCache:
+    """
+    Size-bounded cache of WordType values.
+
+    Example:
+        >>> Text.type_cache.get('Organization', 'NN1')
+        WordType(lower='organization', lex_mask=0, nominalization='SING', basic_match=None)
+        >>> Text.type_cache.stats()
+        {'size': 1, 'hits': 0, 'misses': 1, 'hit_rate': 0.0}
+
+    Arguments:
+        make: function taking (word, tag) and returning a WordType
+
+    Keyword arguments:
+        max_size: maximum number of word types kept. The oldest tenth of the cache is dropped when it is full.
+    """
+
+    def __init__(self, make, max_size=1000000):
+        self.make = make
+        self.max_size = max_size
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, word, tag):
+        """Returns the WordType of word with the CLAWS tag tag."""
+        key = (word, tag)
+        word_type = self.cache.get(key)
+
+        if word_type is not None:
+            self.hits += 1
+            return word_type
+
+        self.misses += 1
+        word_type = self.make(word, tag)
+
+        if len(self.cache) >= self.max_size:
+            # dicts keep insertion order, so this drops the types that were added first
+            for old_key in list(self.cache)[:max(1, self.max_size // 10)]:
+                del self.cache[old_key]
+
+        self.cache[key] = word_type
+        return word_type
+
+    def clear(self):
+        """Empties the cache and resets the counters."""
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Returns a dict with the size of the cache, the number of hits and misses, and the hit rate."""
+        lookups = self.hits + self.misses
+        return {'size': len(self.cache), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}